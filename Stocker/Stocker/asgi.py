@@ -3,6 +3,10 @@ ASGI config for Stocker project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve it with an ASGI server, e.g. ``uvicorn Stocker.asgi:application --workers 4``.
+The async dashboard and report views then run on the event loop and overlap
+their queries (see reports.aio) without tying up a worker per request.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -12,5 +16,8 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Stocker.settings')
+# sync code runs on per-request threads under ASGI, so persistent connections
+# would pile up instead of being reused
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
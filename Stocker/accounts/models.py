@@ -1,10 +1,21 @@
 from django.db import models
 from django.contrib.auth.models import User
 
+from main import thumbnails
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     about = models.TextField(blank=True)
     avatar = models.ImageField(upload_to="images/avatars/", default="images/avatars/avatar.jpg")
+    avatar_variants = models.JSONField(default=dict, blank=True, editable=False)  # see main.thumbnails
 
     def __str__(self):
-        return f"Profile {self.user.username}"
\ No newline at end of file
+        return f"Profile {self.user.username}"
+
+    @property
+    def avatar_small(self):
+        return thumbnails.variant(self.avatar, self.avatar_variants, 'avatar_small')
+
+    @property
+    def avatar_large(self):
+        return thumbnails.variant(self.avatar, self.avatar_variants, 'avatar_large')
\ No newline at end of file
@@ -0,0 +1,102 @@
+"""Barcode -> product lookups for the scan endpoint, behind an in-process LRU cache.
+
+Entries are evicted by the Product signals in inventory.signals (save, delete,
+products_changed, stock_changed) once the change commits: evicting earlier
+would let a concurrent lookup cache the old row again. Those signals only
+reach the process that made the change, so
+entries also expire after BARCODE_CACHE_TTL seconds to bound staleness across
+workers. Unknown barcodes are not cached, so newly created products resolve at once.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Product
+
+FIELDS = ('id', 'barcode', 'name', 'strength', 'price', 'quantity')
+MAX_BATCH = 100
+
+
+class LRUCache:
+    def __init__(self, maxsize, ttl):
+        self.maxsize, self.ttl = maxsize, ttl
+        self._data = OrderedDict()   # barcode -> (expires, payload)
+        self._codes = {}             # product id -> barcode
+        self._lock = threading.Lock()
+
+    def get_many(self, codes):
+        now, found = time.monotonic(), {}
+        with self._lock:
+            for code in codes:
+                entry = self._data.get(code)
+                if entry is None:
+                    continue
+                if entry[0] < now:
+                    self._pop(code)
+                    continue
+                self._data.move_to_end(code)
+                found[code] = entry[1]
+        return found
+
+    def set_many(self, payloads):
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            for code, payload in payloads.items():
+                self._data[code] = (expires, payload)
+                self._data.move_to_end(code)
+                self._codes[payload['id']] = code
+            while len(self._data) > self.maxsize:
+                self._pop(next(iter(self._data)))
+
+    def evict_products(self, ids, codes=()):
+        with self._lock:
+            for pk in ids:
+                code = self._codes.get(pk)
+                if code is not None:
+                    self._pop(code)
+            for code in codes:
+                if code:
+                    self._pop(code)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._codes.clear()
+
+    def _pop(self, code):
+        entry = self._data.pop(code, None)
+        if entry is not None:
+            self._codes.pop(entry[1]['id'], None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+cache = LRUCache(getattr(settings, 'BARCODE_CACHE_SIZE', 4096), getattr(settings, 'BARCODE_CACHE_TTL', 30))
+
+
+def evict_on_commit(ids, codes=()):
+    """Drop the entries of products `ids` (and of barcodes `codes`) after the current transaction commits."""
+    ids, codes = list(ids), list(codes)
+    transaction.on_commit(lambda: cache.evict_products(ids, codes))
+
+
+def _payload(row):
+    row['price'] = str(row['price'])
+    return row
+
+
+def lookup(codes):
+    """{barcode: product dict} for the barcodes that exist (one query for all misses)."""
+    codes = list(dict.fromkeys(c for c in codes if c))
+    found = cache.get_many(codes)
+    missing = [c for c in codes if c not in found]
+    if missing:
+        fetched = {r['barcode']: _payload(r) for r in
+                   Product.objects.filter(barcode__in=missing).order_by().values(*FIELDS)}
+        cache.set_many(fetched)
+        found.update(fetched)
+    return found
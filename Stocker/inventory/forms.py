@@ -1,6 +1,22 @@
 from django import forms
 from datetime import date
-from .models import Product, Category, Supplier
+from .models import Product, Category, Supplier, StockMovement, Location
+
+
+# Field rules shared by ProductForm and the CSV importer (inventory.importer)
+def validate_expiry_date(exp):
+    if exp and exp < date.today():
+        raise forms.ValidationError("The expiration date cannot be in the past.")
+
+def validate_non_negative(label):
+    def validator(v):
+        if v is not None and v < 0:
+            raise forms.ValidationError(f"{label} must be 0 or more.")
+    return validator
+
+validate_price = validate_non_negative("Price")
+validate_quantity = validate_non_negative("Quantity")
+validate_reorder_level = validate_non_negative("Reorder level")
 
 
 class DateInput(forms.DateInput):
@@ -46,32 +62,113 @@ class ProductForm(forms.ModelForm):
             'expiry_date':   DateInput(attrs={'class': 'form-control'}),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            # existing stock and its lots only change through stock movements (inventory.stock)
+            for name in ('quantity', 'batch_no', 'expiry_date'):
+                del self.fields[name]
+
     # validations
     def clean_expiry_date(self):
         exp = self.cleaned_data.get('expiry_date')
-        if exp and exp < date.today():
-            raise forms.ValidationError("The expiration date cannot be in the past.")
+        validate_expiry_date(exp)
         return exp
 
     def clean_price(self):
         v = self.cleaned_data.get('price')
-        if v is not None and v < 0:
-            raise forms.ValidationError("Price must be 0 or more.")
+        validate_price(v)
         return v
 
     def clean_quantity(self):
         v = self.cleaned_data.get('quantity')
-        if v is not None and v < 0:
-            raise forms.ValidationError("Quantity must be 0 or more.")
+        validate_quantity(v)
         return v
 
     def clean_reorder_level(self):
         v = self.cleaned_data.get('reorder_level')
-        if v is not None and v < 0:
-            raise forms.ValidationError("Reorder level must be 0 or more.")
+        validate_reorder_level(v)
         return v
 
 
+def location_choices(locations):
+    return [(l.pk, l.name) for l in locations]
+
+
+def default_location(locations):
+    return next((l.pk for l in locations if l.is_default), None)
+
+
+class StockMovementForm(forms.Form):
+    """`locations`: the Location rows to offer (read once by the view for every form on the page)."""
+    kind = forms.ChoiceField(label='Movement',
+                             choices=[c for c in StockMovement.Kind.choices if c[0] != StockMovement.Kind.TRANSFER],
+                             widget=forms.Select(attrs={'class': 'form-select'}))
+    location = forms.TypedChoiceField(label='Location', coerce=int,
+                                      widget=forms.Select(attrs={'class': 'form-select'}))
+    quantity = forms.IntegerField(label='Quantity',
+                                  help_text='Adjustments may be negative; other movements are always positive.',
+                                  widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': '0'}))
+    note = forms.CharField(label='Note', required=False, max_length=200,
+                           widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Optional'}))
+    batch_no = forms.CharField(label='Batch No.', required=False, max_length=64,
+                               help_text='Receipts only: the lot the stock goes into.',
+                               widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'e.g. L2025-07'}))
+    expiry_date = forms.DateField(label='Expiry date', required=False,
+                                  widget=DateInput(attrs={'class': 'form-control'}))
+
+    def __init__(self, *args, locations=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['location'].choices = location_choices(locations)
+        self.fields['location'].initial = default_location(locations)
+        if len(locations) < 2:
+            self.fields['location'].widget = forms.HiddenInput()
+
+    def clean_expiry_date(self):
+        exp = self.cleaned_data.get('expiry_date')
+        validate_expiry_date(exp)
+        return exp
+
+    def clean(self):
+        cleaned = super().clean()
+        kind, qty = cleaned.get('kind'), cleaned.get('quantity')
+        if qty is not None:
+            if qty == 0:
+                self.add_error('quantity', "Quantity cannot be 0.")
+            elif qty < 0 and kind != StockMovement.Kind.ADJUSTMENT:
+                self.add_error('quantity', "Only adjustments can be negative.")
+        return cleaned
+
+
+class StockTransferForm(forms.Form):
+    source = forms.TypedChoiceField(label='From', coerce=int, widget=forms.Select(attrs={'class': 'form-select'}))
+    destination = forms.TypedChoiceField(label='To', coerce=int, widget=forms.Select(attrs={'class': 'form-select'}))
+    quantity = forms.IntegerField(label='Quantity', min_value=1,
+                                  widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': '0'}))
+    note = forms.CharField(label='Note', required=False, max_length=200,
+                           widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Optional'}))
+
+    def __init__(self, *args, locations=(), **kwargs):
+        super().__init__(*args, prefix='transfer', **kwargs)
+        for name in ('source', 'destination'):
+            self.fields[name].choices = location_choices(locations)
+        self.fields['source'].initial = default_location(locations)
+
+    def clean(self):
+        cleaned = super().clean()
+        if cleaned.get('source') is not None and cleaned.get('source') == cleaned.get('destination'):
+            self.add_error('destination', "Pick a different location.")
+        return cleaned
+
+
+class ProductImportForm(forms.Form):
+    file = forms.FileField(
+        label='CSV file',
+        help_text='Same columns as the inventory export. Rows are matched on Barcode.',
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,text/csv'}),
+    )
+
+
 class CategoryForm(forms.ModelForm):
     class Meta:
         model = Category
@@ -83,6 +180,16 @@ class CategoryForm(forms.ModelForm):
         }
 
 
+class LocationForm(forms.ModelForm):
+    class Meta:
+        model = Location
+        fields = ['name']
+        labels = {'name': 'Name'}
+        widgets = {
+            'name': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'e.g. Branch 2 / Ward A'}),
+        }
+
+
 class SupplierForm(forms.ModelForm):
     class Meta:
         model = Supplier
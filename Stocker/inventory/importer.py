@@ -0,0 +1,206 @@
+"""Streaming CSV product import.
+
+Rows are read one at a time, validated with the same rules as ProductForm,
+and written in batches: products are upserted by barcode with bulk_create /
+bulk_update, categories and suppliers are resolved through in-memory
+name -> id maps, and supplier links are written to the through table in bulk.
+"""
+import csv
+from dataclasses import dataclass, field
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django import forms
+from django.db import DatabaseError, transaction
+
+from .forms import validate_expiry_date, validate_price, validate_quantity, validate_reorder_level
+from .models import Product, Category, Supplier
+from .signals import products_changing, products_changed
+from .stock import refresh_product_lots, sync_lots
+
+BATCH_SIZE = 1000
+
+# CSV header (as written by reports.views.export_inventory_csv) -> Product field
+COLUMNS = {
+    'name': 'name',
+    'strength': 'strength',
+    'form': 'form',
+    'barcode': 'barcode',
+    'category': 'category',
+    'suppliers': 'suppliers',
+    'price': 'price',
+    'quantity': 'quantity',
+    'reorderlevel': 'reorder_level',
+    'reorder_level': 'reorder_level',
+    'batchno': 'batch_no',
+    'batch_no': 'batch_no',
+    'expiry': 'expiry_date',
+    'expiry_date': 'expiry_date',
+}
+
+UPDATE_FIELDS = ['name', 'strength', 'form', 'category', 'price', 'quantity',
+                 'reorder_level', 'batch_no', 'expiry_date']
+
+
+@dataclass
+class BatchReport:
+    number: int
+    rows: int = 0
+    created: int = 0
+    updated: int = 0
+    errors: list = field(default_factory=list)  # [(line_no, message)]
+
+
+def _max_length(name):
+    return Product._meta.get_field(name).max_length
+
+
+def _int(value, label, default=None):
+    if value == '':
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise forms.ValidationError(f"{label} must be a whole number.")
+
+
+def clean_row(raw):
+    """Map one CSV dict to cleaned values, raising ValidationError like ProductForm would."""
+    row = {COLUMNS[k.strip().lower()]: (v or '').strip()
+           for k, v in raw.items() if k and k.strip().lower() in COLUMNS}
+    if not row.get('name'):
+        raise forms.ValidationError("Name is required.")
+    for name in ('name', 'strength', 'form', 'barcode', 'batch_no'):
+        if len(row.get(name, '')) > _max_length(name):
+            raise forms.ValidationError(f"{name} is longer than {_max_length(name)} characters.")
+
+    try:
+        price = Decimal(row.get('price', ''))
+    except InvalidOperation:
+        raise forms.ValidationError("Price must be a number.")
+    if not price.is_finite() or price.as_tuple().exponent < -2:
+        raise forms.ValidationError("Price must be a number with at most 2 decimal places.")
+    Product._meta.get_field('price').run_validators(price)  # max_digits: one bad row would fail the batch
+    quantity = _int(row.get('quantity', ''), "Quantity", 0)
+    reorder_level = _int(row.get('reorder_level', ''), "Reorder level", 5)
+    expiry = row.get('expiry_date') or None
+    if expiry:
+        try:
+            expiry = date.fromisoformat(expiry)
+        except ValueError:
+            raise forms.ValidationError("Expiry must be a date (YYYY-MM-DD).")
+
+    validate_price(price)
+    validate_quantity(quantity)
+    validate_reorder_level(reorder_level)
+    validate_expiry_date(expiry)
+
+    return {
+        'name': row['name'],
+        'strength': row.get('strength', ''),
+        'form': row.get('form', ''),
+        'barcode': row.get('barcode') or None,
+        'category': row.get('category', ''),
+        'suppliers': [s.strip() for s in row['suppliers'].split(',') if s.strip()] if 'suppliers' in row else None,
+        'price': price,
+        'quantity': quantity,
+        'reorder_level': reorder_level,
+        'batch_no': row.get('batch_no') or None,
+        'expiry_date': expiry,
+    }
+
+
+class ProductImporter:
+    def __init__(self, batch_size=BATCH_SIZE, create_missing=True):
+        self.batch_size = batch_size
+        self.create_missing = create_missing
+        self.categories = dict(Category.objects.values_list('name', 'pk'))
+        self.suppliers = {}
+        for name, pk in Supplier.objects.order_by('-pk').values_list('name', 'pk'):
+            self.suppliers[name] = pk  # duplicates: the oldest supplier wins
+
+    def run(self, stream):
+        """Import CSV text from `stream`, yielding a BatchReport per batch."""
+        reader = csv.DictReader(stream)
+        batch, report, number = [], None, 0
+        for raw in reader:
+            if report is None:
+                number += 1
+                report = BatchReport(number)
+            report.rows += 1
+            try:
+                batch.append(clean_row(raw))
+            except forms.ValidationError as e:
+                report.errors.append((reader.line_num, '; '.join(e.messages)))
+            if report.rows >= self.batch_size:
+                self._write(batch, report)
+                yield report
+                batch, report = [], None
+        if report is not None:
+            self._write(batch, report)
+            yield report
+
+    def _resolve(self, names, lookup, model):
+        missing = {n for n in names if n and n not in lookup}
+        if missing and self.create_missing:
+            for obj in model.objects.bulk_create([model(name=n) for n in sorted(missing)]):
+                lookup[obj.name] = obj.pk
+
+    def _write(self, rows, report):
+        # last row wins when a barcode repeats within the batch
+        keyed, loose = {}, []
+        for r in rows:
+            if r['barcode']:
+                keyed[r['barcode']] = r
+            else:
+                loose.append(r)
+        rows = list(keyed.values()) + loose
+        if not rows:
+            return
+        categories, suppliers = dict(self.categories), dict(self.suppliers)
+        try:
+            created, updated = self._upsert(keyed, rows)
+        except DatabaseError as e:
+            # rolled back: forget categories/suppliers created inside the batch
+            self.categories, self.suppliers = categories, suppliers
+            report.errors.append((None, f"Batch not saved: {e}"))
+            return
+        report.created += created
+        report.updated += updated
+
+    def _upsert(self, keyed, rows):
+        with transaction.atomic():
+            self._resolve({r['category'] for r in rows}, self.categories, Category)
+            self._resolve({s for r in rows for s in (r['suppliers'] or [])}, self.suppliers, Supplier)
+
+            existing = Product.objects.filter(barcode__in=list(keyed)).in_bulk(field_name='barcode')
+            products_changing.send(sender=Product, product_ids=[p.pk for p in existing.values()])
+            to_create, to_update, links, relabelled = [], [], [], []
+            for r in rows:
+                p = existing.get(r['barcode']) or Product(barcode=r['barcode'])
+                if p.pk and (p.batch_no, p.expiry_date) != (r['batch_no'], r['expiry_date']):
+                    relabelled.append(p.pk)
+                for name in UPDATE_FIELDS:
+                    if name == 'category':
+                        p.category_id = self.categories.get(r['category'])
+                    else:
+                        setattr(p, name, r[name])
+                (to_update if p.pk else to_create).append(p)
+                links.append((p, r['suppliers']))
+
+            Product.objects.bulk_create(to_create, batch_size=500)
+            Product.objects.bulk_update(to_update, UPDATE_FIELDS, batch_size=500)
+
+            through = Product.suppliers.through
+            replaced = [p.pk for p, sups in links if sups is not None]
+            through.objects.filter(product_id__in=replaced).delete()
+            through.objects.bulk_create([
+                through(product_id=p.pk, supplier_id=self.suppliers[s])
+                for p, sups in links for s in (sups or []) if s in self.suppliers
+            ], batch_size=1000, ignore_conflicts=True)
+
+            sync_lots([p.pk for p, _ in links], note='CSV import')
+            # batch / expiry mirror the earliest lot: a new label alone changes no lot
+            refresh_product_lots(relabelled)
+            products_changed.send(sender=Product, product_ids=[p.pk for p, _ in links])
+        return len(to_create), len(to_update)
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from inventory.models import Product, stock_health_expression
+
+class Command(BaseCommand):
+    help = "Recompute Product.stock_health for existing rows (set-based, in pk ranges)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        batch = options['batch_size']
+        last = Product.objects.aggregate(m=Max('pk'))['m'] or 0
+        changed = 0
+        for start in range(0, last, batch):
+            with transaction.atomic():
+                changed += (Product.objects
+                            .filter(pk__gt=start, pk__lte=start + batch)
+                            .update(stock_health=stock_health_expression()))
+        self.stdout.write(self.style.SUCCESS(f"Stock health recomputed for {changed} products."))
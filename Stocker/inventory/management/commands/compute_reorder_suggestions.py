@@ -0,0 +1,23 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory import reorder
+
+class Command(BaseCommand):
+    help = ("Recompute reorder suggestions (velocity, days of cover, order quantity) for every product "
+            "from recent dispenses (cron-friendly, e.g. nightly)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=date.fromisoformat,
+                            help="Compute as of this day (YYYY-MM-DD); the window ends the day before")
+
+    def handle(self, *args, **options):
+        if not reorder.available():
+            raise CommandError("The reorder engine needs NumPy: pip install numpy")
+        result = reorder.refresh(options['date'])
+        t = result['timings']
+        self.stdout.write(f"Load {t['load']:.0f} ms, compute {t['compute']:.0f} ms, save {t['save']:.0f} ms")
+        self.stdout.write(self.style.SUCCESS(
+            f"Reorder suggestions computed for {result['products']} products ({result['stored']} stored); "
+            f"{result['due']} due for an order."))
@@ -0,0 +1,42 @@
+import io
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.importer import ProductImporter, BATCH_SIZE
+
+class Command(BaseCommand):
+    help = "Import products from a CSV file (same columns as the inventory export), upserting by barcode"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV file, or - for stdin")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--no-create', action='store_true',
+                            help="Don't create missing categories/suppliers; leave them unlinked")
+
+    def handle(self, *args, **options):
+        importer = ProductImporter(batch_size=options['batch_size'], create_missing=not options['no_create'])
+        path = options['path']
+        try:
+            stream = (io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline='') if path == '-'
+                      else open(path, newline='', encoding='utf-8-sig'))
+        except OSError as e:
+            raise CommandError(e)
+
+        rows = created = updated = errors = 0
+        with stream:
+            for report in importer.run(stream):
+                rows += report.rows
+                created += report.created
+                updated += report.updated
+                errors += len(report.errors)
+                self.stdout.write(
+                    f"Batch {report.number}: {report.rows} rows, {report.created} created, "
+                    f"{report.updated} updated, {len(report.errors)} errors"
+                )
+                for line_no, message in report.errors:
+                    where = f"line {line_no}" if line_no else "batch"
+                    self.stderr.write(f"  {where}: {message}")
+
+        style = self.style.WARNING if errors else self.style.SUCCESS
+        self.stdout.write(style(f"Import complete: {rows} rows, {created} created, {updated} updated, {errors} errors."))
@@ -0,0 +1,48 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from inventory.models import ProductAlert
+from inventory.utils import scan_alerts, digest_lines, dispatch_alerts
+
+class Command(BaseCommand):
+    help = "Scan all products for new low-stock / near-expiry conditions and send one digest (cron-friendly)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be sent without saving state")
+        parser.add_argument('--queue-only', action='store_true',
+                            help="Queue the digest in the outbox and leave sending to send_alerts")
+
+    def handle(self, *args, **options):
+        queries = []
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        manager = getattr(settings, "MANAGER_EMAIL", None)
+        started = time.perf_counter()
+        with connection.execute_wrapper(count):
+            with transaction.atomic():
+                new_low, new_near, cleared = scan_alerts()
+                lines = digest_lines(new_low, new_near)
+                if options['dry_run']:
+                    transaction.set_rollback(True)
+                elif lines and manager:
+                    ProductAlert.objects.create(recipient=manager, lines="\n".join(lines))
+        elapsed = (time.perf_counter() - started) * 1000
+
+        self.stdout.write(
+            f"New low stock: {len(new_low)}, new near expiry: {len(new_near)}, cleared: {cleared}"
+        )
+        self.stdout.write(f"Scan cost: {len(queries)} queries in {elapsed:.1f} ms")
+        if options['dry_run']:
+            self.stdout.write("\n".join(lines) or "Nothing to report.")
+            return
+        if lines and not manager:
+            self.stdout.write(self.style.WARNING("MANAGER_EMAIL is not set; digest not queued."))
+        if lines and manager and not options['queue_only']:
+            handled, sent, failed = dispatch_alerts()
+            self.stdout.write(f"Dispatched {handled} alerts in {sent} messages ({failed} failed).")
+        self.stdout.write(self.style.SUCCESS("Alert scan complete."))
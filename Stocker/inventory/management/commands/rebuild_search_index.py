@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from inventory import search
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text product search index"
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("The FTS5 search index is only used on SQLite.")
+        search.create_index_table(connection)
+        with transaction.atomic():
+            n = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Search index rebuilt: {n} products."))
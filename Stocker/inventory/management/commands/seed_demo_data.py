@@ -1,16 +1,54 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
 from django.db import transaction
 from decimal import Decimal
 from datetime import date, timedelta
+import itertools
+import random
+import time
+
+from inventory import search, versioning
+from inventory.models import Category, Supplier, Product, StockLot, LocationStock
+from inventory.stock import default_location_id, sync_lots
+from reports import kpis, summaries
+
+FORMS = ["Tablet", "Capsule", "Syrup", "Injection", "Cream", "Drops", "Inhaler", "Device"]
+STRENGTHS = ["5 mg", "10 mg", "20 mg", "50 mg", "100 mg", "250 mg", "500 mg", "1 g", "5 mg/ml", "100 ml", ""]
+NAME_PARTS = ["Amo", "Cef", "Para", "Ibu", "Lora", "Meto", "Ome", "Sal", "Ator", "Levo", "Cipro", "Dexa",
+              "Fluo", "Keto", "Mon", "Pred", "Ran", "Val", "Zin", "Hydro"]
+NAME_ENDS = ["xicillin", "alexin", "cetamol", "profen", "tadine", "formin", "prazole", "butamol", "statin",
+             "thyroxine", "floxacin", "methasone", "xetine", "conazole", "telukast", "nisone", "itidine", "sartan"]
+# synthetic EAN-13 barcodes: "2" (in-store range), the seed, the product's index, a check digit
+SEED_DIGITS, INDEX_DIGITS = 4, 7
 
-from inventory.models import Category, Supplier, Product
 
 class Command(BaseCommand):
-    help = "Seed demo data for the pharmacy inventory"
+    help = "Seed demo data for the pharmacy inventory (add --products N for a synthetic catalogue)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=0, help="Synthetic products to generate")
+        parser.add_argument('--suppliers', type=int, default=200, help="Synthetic suppliers (with --products)")
+        parser.add_argument('--categories', type=int, default=40, help="Synthetic categories (with --products)")
+        parser.add_argument('--users', type=int, default=0, help="Extra clerk accounts (clerkN / clerk123)")
+        parser.add_argument('--seed', type=int, default=1, help="Random seed; same seed, same data")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--low-stock-share', type=float, default=0.15)
 
-    @transaction.atomic
     def handle(self, *args, **options):
+        self.seed_demo()
+        rng = random.Random(options['seed'])
+        if options['users']:
+            self.seed_users(options['users'])
+        if options['products']:
+            started = time.perf_counter()
+            if self.seed_catalogue(rng, options):
+                self.stdout.write(self.style.SUCCESS(
+                    f"Synthetic catalogue ready in {time.perf_counter() - started:.1f}s."))
+        self.stdout.write(self.style.SUCCESS("Seeding complete."))
+
+    @transaction.atomic
+    def seed_demo(self):
         # Users
         admin, _ = User.objects.get_or_create(username='admin', defaults={
             'email': 'admin@example.com', 'first_name': 'Admin', 'last_name': 'User'
@@ -101,7 +139,122 @@ class Command(BaseCommand):
 
             # suppliers (M2M)
             p.suppliers.set([sup_map[s] for s in sups])
+            sync_lots([p.pk], note='Demo data')
 
         self.stdout.write(self.style.SUCCESS(f"Products ready. Created/updated: {created}/{len(products)}"))
 
-        self.stdout.write(self.style.SUCCESS("Seeding complete."))
+    @transaction.atomic
+    def seed_users(self, count):
+        password = make_password('clerk123')  # hash once, reuse for every account
+        existing = set(User.objects.filter(username__startswith='clerk').values_list('username', flat=True))
+        users = [
+            User(username=f'clerk{i}', email=f'clerk{i}@example.com', first_name='Clerk', last_name=str(i),
+                 password=password)
+            for i in range(1, count + 1) if f'clerk{i}' not in existing
+        ]
+        User.objects.bulk_create(users, batch_size=1000)
+        self.stdout.write(self.style.SUCCESS(f"Clerk users ready: {len(users)} created (password clerk123)."))
+
+    def seed_catalogue(self, rng, options):
+        n_products, batch = options['products'], options['batch_size']
+        if not 0 <= options['seed'] < 10 ** SEED_DIGITS:
+            raise CommandError(f"--seed must be between 0 and {10 ** SEED_DIGITS - 1} with --products.")
+        if n_products > 10 ** INDEX_DIGITS:
+            raise CommandError(f"At most {10 ** INDEX_DIGITS} synthetic products per seed.")
+        prefix = f"2{options['seed']:0{SEED_DIGITS}d}"
+        if Product.objects.filter(barcode__startswith=prefix, barcode__regex=r'^\d{13}$').exists():
+            self.stdout.write(self.style.WARNING(
+                f"Synthetic products for seed {options['seed']} already exist; use another --seed."))
+            return False
+
+        with transaction.atomic():
+            cat_ids = self.ensure_named(Category, [f"Category {i:03d}" for i in range(1, options['categories'] + 1)])
+            sup_ids = self.ensure_named(Supplier, [f"Supplier {i:04d}" for i in range(1, options['suppliers'] + 1)])
+        # Zipf-like popularity: a few suppliers/categories carry most of the catalogue
+        sup_weights = list(itertools.accumulate(1 / (r + 1) for r in range(len(sup_ids))))
+        cat_weights = list(itertools.accumulate(1 / (r + 1) ** 0.7 for r in range(len(cat_ids))))
+        today = date.today()
+        through = Product.suppliers.through
+        location_id = default_location_id()
+
+        made = 0
+        while made < n_products:
+            size = min(batch, n_products - made)
+            products, links = [], []
+            for i in range(made, made + size):
+                products.append(self.fake_product(rng, i, prefix, today, cat_ids, cat_weights, options['low_stock_share']))
+                # 1 supplier usually, occasionally up to 5
+                k = min(len(sup_ids), 1 + int(rng.expovariate(1.6)))
+                links.append(set(rng.choices(sup_ids, cum_weights=sup_weights, k=k)))
+            with transaction.atomic():
+                Product.objects.bulk_create(products, batch_size=1000)
+                StockLot.objects.bulk_create(
+                    [lot for p in products for lot in self.fake_lots(rng, p, today, location_id)], batch_size=2000)
+                LocationStock.objects.bulk_create(
+                    [LocationStock(location_id=location_id, product=p, quantity=p.quantity)
+                     for p in products if p.quantity], batch_size=2000)
+                through.objects.bulk_create(
+                    [through(product_id=p.pk, supplier_id=s) for p, sups in zip(products, links) for s in sups],
+                    batch_size=2000,
+                )
+            made += size
+            self.stdout.write(f"  {made}/{n_products} products")
+
+        # bulk_create skips signals: rebuild the derived tables set-based, once
+        with transaction.atomic():
+            if search.is_available():
+                search.rebuild()
+            summaries.rebuild()
+        kpis.invalidate()
+        versioning.bump()  # conditional pages must not keep answering 304 with the old catalogue
+        return True
+
+    def ensure_named(self, model, names):
+        existing = dict(model.objects.filter(name__in=names).values_list('name', 'pk'))
+        model.objects.bulk_create([model(name=n) for n in names if n not in existing], batch_size=1000)
+        existing.update(model.objects.filter(name__in=names).values_list('name', 'pk'))
+        return [existing[n] for n in names]
+
+    def fake_lots(self, rng, product, today, location_id):
+        # the product's batch/expiry is its earliest lot; some stock sits in a later second lot
+        if not product.quantity:
+            return []
+        first = product.quantity
+        lots = []
+        if product.quantity > 1 and product.expiry_date and rng.random() < 0.3:
+            first = rng.randint(1, product.quantity - 1)
+            lots.append(StockLot(product=product, location_id=location_id,
+                                 batch_no=f"L{today.year}-{rng.randint(1, 9999):04d}",
+                                 expiry_date=product.expiry_date + timedelta(days=rng.randint(30, 365)),
+                                 quantity=product.quantity - first))
+        lots.append(StockLot(product=product, location_id=location_id, batch_no=product.batch_no,
+                             expiry_date=product.expiry_date, quantity=first))
+        return lots
+
+    def fake_product(self, rng, i, prefix, today, cat_ids, cat_weights, low_share):
+        body = f"{prefix}{i:0{INDEX_DIGITS}d}"
+        check = (10 - sum(int(d) * (3 if j % 2 else 1) for j, d in enumerate(body)) % 10) % 10
+        reorder = rng.choice([5, 10, 10, 20, 20, 50])
+        if rng.random() < low_share:
+            quantity = rng.randint(0, reorder)
+        else:
+            quantity = reorder + 1 + int(rng.lognormvariate(3.5, 1.0))
+        roll = rng.random()
+        if roll < 0.1:
+            expiry = None                                            # non-perishable
+        elif roll < 0.15:
+            expiry = today + timedelta(days=rng.randint(0, 30))      # near expiry
+        else:
+            expiry = today + timedelta(days=rng.randint(31, 1000))
+        return Product(
+            name=f"{rng.choice(NAME_PARTS)}{rng.choice(NAME_ENDS)} {i}",
+            strength=rng.choice(STRENGTHS),
+            form=rng.choice(FORMS),
+            barcode=body + str(check),
+            category_id=rng.choices(cat_ids, cum_weights=cat_weights)[0],
+            price=Decimal(f"{rng.lognormvariate(2.5, 0.8):.2f}"),
+            quantity=quantity,
+            reorder_level=reorder,
+            batch_no=f"L{today.year}-{rng.randint(1, 9999):04d}",
+            expiry_date=expiry,
+        )
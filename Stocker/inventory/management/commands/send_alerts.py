@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventory.utils import dispatch_alerts
+
+class Command(BaseCommand):
+    help = "Send queued product alert emails (one connection per batch, one message per recipient)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--loop', action='store_true', help="Keep polling the queue instead of exiting when it's empty")
+        parser.add_argument('--interval', type=float, default=10.0, help="Seconds between polls with --loop")
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            handled, sent, failed = dispatch_alerts(batch_size=options['batch_size'])
+            if handled:
+                total += handled
+                self.stdout.write(f"{handled} alerts -> {sent} messages sent, {failed} failed")
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f"Alert queue drained ({total} alerts)."))
@@ -0,0 +1,43 @@
+from django.db import migrations
+
+FTS_TABLE = 'inventory_product_fts'
+
+
+def create_fts(apps, schema_editor):
+    # self-contained: the schema and first fill as of this migration (see inventory.search)
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Product = apps.get_model('inventory', 'Product')
+    product = Product._meta.db_table
+    category = apps.get_model('inventory', 'Category')._meta.db_table
+    supplier = apps.get_model('inventory', 'Supplier')._meta.db_table
+    through = Product.suppliers.through._meta.db_table
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        "name, strength, form, barcode, category, suppliers, "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    schema_editor.execute(
+        f"INSERT INTO {FTS_TABLE} (rowid, name, strength, form, barcode, category, suppliers) "
+        f"SELECT p.id, p.name, p.strength, p.form, COALESCE(p.barcode, ''), COALESCE(c.name, ''), "
+        f"COALESCE((SELECT group_concat(s.name, ' ') FROM {through} ps "
+        f"JOIN {supplier} s ON s.id = ps.supplier_id WHERE ps.product_id = p.id), '') "
+        f"FROM {product} p LEFT JOIN {category} c ON c.id = p.category_id"
+    )
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0002_name_pk_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
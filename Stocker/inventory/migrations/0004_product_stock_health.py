@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:17
+
+from django.db import migrations, models
+from django.db.models import Case, F, Value, When
+
+
+def backfill_stock_health(apps, schema_editor):
+    Product = apps.get_model('inventory', 'Product')
+    Product.objects.update(stock_health=Case(
+        When(quantity=0, then=Value(0)),
+        When(quantity__lte=F('reorder_level'), then=Value(1)),
+        default=Value(2),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0003_product_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='stock_health',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Out of stock'), (1, 'Low stock'), (2, 'In stock')], default=2, editable=False),
+        ),
+        migrations.RunPython(backfill_stock_health, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('stock_health__lte', 1)), fields=['name', 'id'], name='product_low_stock_idx'),
+        ),
+    ]
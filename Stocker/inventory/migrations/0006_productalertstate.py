@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_productalert'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductAlertState',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='alert_state', serialize=False, to='inventory.product')),
+                ('low_stock', models.BooleanField(default=False)),
+                ('near_expiry', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('expiry_date__isnull', False)), fields=['expiry_date'], name='product_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_lots(apps, schema_editor):
+    # one lot per stocked product, from its current batch_no / expiry_date
+    Product = apps.get_model('inventory', 'Product')
+    StockLot = apps.get_model('inventory', 'StockLot')
+    rows = Product.objects.filter(quantity__gt=0).values_list('pk', 'batch_no', 'expiry_date', 'quantity')
+    lots = []
+    for pk, batch_no, expiry_date, quantity in rows.iterator(chunk_size=2000):
+        lots.append(StockLot(product_id=pk, batch_no=batch_no or '', expiry_date=expiry_date, quantity=quantity))
+        if len(lots) == 2000:
+            StockLot.objects.bulk_create(lots)
+            lots = []
+    StockLot.objects.bulk_create(lots)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_stockmovement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockLot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch_no', models.CharField(blank=True, max_length=64)),
+                ('expiry_date', models.DateField(blank=True, null=True)),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lots', to='inventory.product')),
+            ],
+            options={
+                'ordering': [models.OrderBy(models.F('expiry_date'), nulls_last=True), 'id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='stockmovement',
+            name='lot',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movements', to='inventory.stocklot'),
+        ),
+        migrations.AddIndex(
+            model_name='stocklot',
+            index=models.Index(condition=models.Q(('quantity__gt', 0)), fields=['expiry_date', 'product'], name='stocklot_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stocklot',
+            index=models.Index(fields=['product', 'expiry_date'], name='stocklot_product_expiry_idx'),
+        ),
+        migrations.RunPython(backfill_lots, migrations.RunPython.noop),
+    ]
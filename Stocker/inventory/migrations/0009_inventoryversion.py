@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:38
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def create_row(apps, schema_editor):
+    apps.get_model('inventory', 'InventoryVersion').objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_stocklot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(create_row, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:47
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0009_inventoryversion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReorderSuggestion',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='reorder', serialize=False, to='inventory.product')),
+                ('daily_velocity', models.FloatField(default=0)),
+                ('days_of_cover', models.FloatField(blank=True, null=True)),
+                ('suggested_quantity', models.PositiveIntegerField(default=0)),
+                ('computed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(condition=models.Q(('kind', 'dispense')), fields=['created_at', 'product'], name='stockmovement_dispense_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reordersuggestion',
+            index=models.Index(condition=models.Q(('suggested_quantity__gt', 0)), fields=['days_of_cover', 'product'], name='reorder_urgency_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0010_reordersuggestion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='supplier',
+            name='logo_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
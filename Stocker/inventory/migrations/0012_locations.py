@@ -0,0 +1,97 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_locations(apps, schema_editor):
+    # everything on hand so far is at the default location
+    Location = apps.get_model('inventory', 'Location')
+    LocationStock = apps.get_model('inventory', 'LocationStock')
+    Product = apps.get_model('inventory', 'Product')
+    StockLot = apps.get_model('inventory', 'StockLot')
+    StockMovement = apps.get_model('inventory', 'StockMovement')
+    main = Location.objects.create(name='Main store', is_default=True)
+    StockLot.objects.update(location=main)
+    StockMovement.objects.update(location=main)
+    rows = Product.objects.filter(quantity__gt=0).values_list('pk', 'quantity')
+    stock = []
+    for pk, quantity in rows.iterator(chunk_size=2000):
+        stock.append(LocationStock(location=main, product_id=pk, quantity=quantity))
+        if len(stock) == 2000:
+            LocationStock.objects.bulk_create(stock)
+            stock = []
+    LocationStock.objects.bulk_create(stock)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0011_supplier_logo_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Location',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('is_default', models.BooleanField(default=False)),
+            ],
+            options={
+                'ordering': ['name'],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('is_default', True)), fields=('is_default',), name='location_single_default')],
+            },
+        ),
+        migrations.CreateModel(
+            name='LocationStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('location', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='stock', to='inventory.location')),
+                ('product', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='location_stock', to='inventory.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'location'], name='locationstock_product_idx')],
+                'constraints': [models.UniqueConstraint(fields=('location', 'product'), name='locationstock_location_product')],
+            },
+        ),
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='kind',
+            field=models.CharField(choices=[('receipt', 'Receipt'), ('dispense', 'Dispense'), ('adjustment', 'Adjustment'), ('write_off', 'Expiry write-off'), ('transfer', 'Transfer')], max_length=20),
+        ),
+        migrations.AddField(
+            model_name='stocklot',
+            name='location',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='lots', to='inventory.location'),
+        ),
+        migrations.AddField(
+            model_name='stockmovement',
+            name='location',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='movements', to='inventory.location'),
+        ),
+        migrations.RunPython(backfill_locations, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='stocklot',
+            name='location',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='lots', to='inventory.location'),
+        ),
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='location',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='movements', to='inventory.location'),
+        ),
+        migrations.RemoveIndex(
+            model_name='stocklot',
+            name='stocklot_product_expiry_idx',
+        ),
+        migrations.AddIndex(
+            model_name='stocklot',
+            index=models.Index(condition=models.Q(('quantity__gt', 0)), fields=['location', 'expiry_date', 'product'], name='stocklot_location_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stocklot',
+            index=models.Index(fields=['product', 'location', 'expiry_date'], name='stocklot_product_location_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0012_locations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productalert',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
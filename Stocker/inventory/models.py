@@ -1,9 +1,14 @@
+from django.conf import settings
 from django.db import models
+from django.db.models import Case, When, Value, F
+from django.db.models.lookups import Exact, LessThanOrEqual
 
 # Create your models here.
 from django.utils import timezone
 from datetime import date
 
+from main import thumbnails
+
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True, null=True)
@@ -16,8 +21,61 @@ class Supplier(models.Model):
     logo = models.ImageField(upload_to='suppliers/', blank=True, null=True)
     website = models.URLField(blank=True, null=True)
     address = models.TextField(blank=True, null=True)
+    logo_variants = models.JSONField(default=dict, blank=True, editable=False)  # see main.thumbnails
+
+    class Meta:
+        indexes = [models.Index(fields=['name', 'id'], name='supplier_name_id_idx')]
+
     def __str__(self): return self.name
 
+    @property
+    def logo_card(self): return thumbnails.variant(self.logo, self.logo_variants, 'logo_card')
+
+class StockHealth(models.IntegerChoices):
+    OUT = 0, 'Out of stock'
+    LOW = 1, 'Low stock'
+    OK = 2, 'In stock'
+
+def stock_health_expression(quantity=F('quantity'), reorder_level=F('reorder_level')):
+    """SQL CASE computing StockHealth from (possibly new) quantity/reorder_level expressions."""
+    if not hasattr(quantity, 'resolve_expression'): quantity = Value(quantity)
+    if not hasattr(reorder_level, 'resolve_expression'): reorder_level = Value(reorder_level)
+    return Case(
+        When(Exact(quantity, 0), then=Value(StockHealth.OUT)),
+        When(LessThanOrEqual(quantity, reorder_level), then=Value(StockHealth.LOW)),
+        default=Value(StockHealth.OK),
+        output_field=models.PositiveSmallIntegerField(),
+    )
+
+class ProductQuerySet(models.QuerySet):
+    """Keeps `stock_health` in step with quantity/reorder_level on bulk write paths."""
+
+    def low_stock(self):
+        return self.filter(stock_health__lte=StockHealth.LOW)
+
+    def update(self, **kwargs):
+        if ('quantity' in kwargs or 'reorder_level' in kwargs) and 'stock_health' not in kwargs:
+            kwargs['stock_health'] = stock_health_expression(
+                kwargs.get('quantity', F('quantity')), kwargs.get('reorder_level', F('reorder_level')))
+        return super().update(**kwargs)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.stock_health = obj.compute_stock_health()
+        update_fields = kwargs.get('update_fields')
+        if update_fields and {'quantity', 'reorder_level'} & set(update_fields):
+            kwargs['update_fields'] = list(update_fields) + ['stock_health']
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs, fields = list(objs), list(fields)
+        if {'quantity', 'reorder_level'} & set(fields) and 'stock_health' not in fields:
+            for obj in objs:
+                obj.stock_health = obj.compute_stock_health()
+            fields.append('stock_health')
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
 class Product(models.Model):
     name = models.CharField(max_length=150)         
     strength = models.CharField(max_length=50, blank=True)  # 500mg, 5mg/ml...
@@ -30,6 +88,7 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     quantity = models.PositiveIntegerField(default=0)
     reorder_level = models.PositiveIntegerField(default=5)
+    stock_health = models.PositiveSmallIntegerField(choices=StockHealth.choices, default=StockHealth.OK, editable=False)
 
     batch_no = models.CharField(max_length=64, blank=True, null=True)
     expiry_date = models.DateField(blank=True, null=True)
@@ -37,11 +96,42 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['name', 'id'], name='product_name_id_idx'),
+            # low-stock lists read this in name order; OK rows never enter the index
+            models.Index(fields=['name', 'id'], condition=models.Q(stock_health__lte=StockHealth.LOW),
+                         name='product_low_stock_idx'),
+            models.Index(fields=['expiry_date'], condition=models.Q(expiry_date__isnull=False),
+                         name='product_expiry_idx'),
+        ]
 
     def __str__(self): return f"{self.name} {self.strength}".strip()
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'quantity' not in update_fields:
+            if 'reorder_level' not in update_fields:
+                return super().save(*args, **kwargs)
+            # the stored quantity may have moved since this instance was loaded
+            self.stock_health = stock_health_expression(reorder_level=self.reorder_level)
+            kwargs['update_fields'] = set(update_fields) | {'stock_health'}
+            super().save(*args, **kwargs)
+            self.refresh_from_db(fields=['quantity', 'stock_health'])
+            return
+        self.stock_health = self.compute_stock_health()
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'stock_health'}
+        super().save(*args, **kwargs)
+
+    def compute_stock_health(self):
+        if self.quantity == 0: return StockHealth.OUT
+        if self.quantity <= self.reorder_level: return StockHealth.LOW
+        return StockHealth.OK
+
     def is_low_stock(self): return self.quantity <= self.reorder_level
     def days_to_expiry(self):
         if not self.expiry_date: return None
@@ -49,3 +139,150 @@ class Product(models.Model):
     def is_near_expiry(self, days=30):
         d = self.days_to_expiry()
         return d is not None and d <= days
+
+class ProductAlert(models.Model):
+    """Outbox row for a product alert email; drained by the `send_alerts` command."""
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True, related_name='alerts')
+    recipient = models.EmailField()
+    lines = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    next_attempt_at = models.DateTimeField(blank=True, null=True)  # claim expiry / retry backoff; None: due now
+    sent_at = models.DateTimeField(blank=True, null=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(sent_at__isnull=True), name='productalert_pending_idx'),
+        ]
+
+    def __str__(self): return f"Alert to {self.recipient} ({'sent' if self.sent_at else 'pending'})"
+
+class ProductAlertState(models.Model):
+    """What the manager was last alerted about for a product, so only new crossings alert again."""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='alert_state')
+    low_stock = models.BooleanField(default=False)
+    near_expiry = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self): return f"Alert state for product {self.product_id}"
+
+class Location(models.Model):
+    """A place stock is held (store room, branch, ward cupboard)."""
+    name = models.CharField(max_length=100, unique=True)
+    is_default = models.BooleanField(default=False)  # where stock goes when no location is given
+
+    class Meta:
+        ordering = ['name']
+        constraints = [
+            models.UniqueConstraint(fields=['is_default'], condition=models.Q(is_default=True),
+                                    name='location_single_default'),
+        ]
+
+    def __str__(self): return self.name
+
+class LocationStock(models.Model):
+    """Quantity of a product held at a location: the sum of its lots there. Product.quantity
+    is the sum over locations; both are maintained incrementally (see inventory.stock)."""
+    # indexed by the composite unique constraint / index below, not on their own
+    location = models.ForeignKey(Location, on_delete=models.PROTECT, related_name='stock', db_index=False)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='location_stock', db_index=False)
+    quantity = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # also the index for per-location lists (location, product)
+            models.UniqueConstraint(fields=['location', 'product'], name='locationstock_location_product'),
+        ]
+        indexes = [models.Index(fields=['product', 'location'], name='locationstock_product_idx')]
+
+    def __str__(self): return f"{self.quantity} of product {self.product_id} at location {self.location_id}"
+
+class StockLotQuerySet(models.QuerySet):
+    def near_expiry(self, cutoff, location=None):
+        """Lots in stock expiring by `cutoff`, soonest first (range scan on stocklot_expiry_idx,
+        or stocklot_location_expiry_idx for one location)."""
+        qs = self.filter(quantity__gt=0, expiry_date__lte=cutoff)
+        if location is not None:
+            qs = qs.filter(location=location)
+        return qs.select_related('product').order_by('expiry_date', 'product_id')
+
+class StockLot(models.Model):
+    """One batch of a product on hand at a location. Product.quantity is the sum of its lots (see inventory.stock)."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='lots')
+    location = models.ForeignKey(Location, on_delete=models.PROTECT, related_name='lots')
+    batch_no = models.CharField(max_length=64, blank=True)
+    expiry_date = models.DateField(blank=True, null=True)
+    quantity = models.PositiveIntegerField(default=0)
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    objects = StockLotQuerySet.as_manager()
+
+    class Meta:
+        ordering = [F('expiry_date').asc(nulls_last=True), 'id']
+        indexes = [
+            # near-expiry range scans; empty lots never enter the index
+            models.Index(fields=['expiry_date', 'product'], condition=models.Q(quantity__gt=0),
+                         name='stocklot_expiry_idx'),
+            models.Index(fields=['location', 'expiry_date', 'product'], condition=models.Q(quantity__gt=0),
+                         name='stocklot_location_expiry_idx'),
+            # first-expiry-first-out per product (and location)
+            models.Index(fields=['product', 'location', 'expiry_date'], name='stocklot_product_location_idx'),
+        ]
+
+    def __str__(self): return f"{self.batch_no or 'No batch'} ({self.quantity})"
+
+class StockMovement(models.Model):
+    """Ledger row for one change of a product's quantity (see inventory.stock)."""
+    class Kind(models.TextChoices):
+        RECEIPT = 'receipt', 'Receipt'
+        DISPENSE = 'dispense', 'Dispense'
+        ADJUSTMENT = 'adjustment', 'Adjustment'
+        WRITE_OFF = 'write_off', 'Expiry write-off'
+        TRANSFER = 'transfer', 'Transfer'
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='movements')
+    location = models.ForeignKey(Location, on_delete=models.PROTECT, related_name='movements')
+    lot = models.ForeignKey(StockLot, on_delete=models.SET_NULL, null=True, blank=True, related_name='movements')
+    kind = models.CharField(max_length=20, choices=Kind.choices)
+    delta = models.IntegerField()  # signed change at the location; a transfer's pair of rows nets to zero
+    note = models.CharField(max_length=200, blank=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['product', '-id'], name='stockmovement_product_idx'),
+            # consumption history for the reorder engine: a range scan over recent dispenses only
+            models.Index(fields=['created_at', 'product'], condition=models.Q(kind='dispense'),
+                         name='stockmovement_dispense_idx'),
+        ]
+
+    def __str__(self): return f"{self.get_kind_display()} {self.delta:+d} {self.product_id}"
+
+class ReorderSuggestion(models.Model):
+    """Latest output of the reorder engine for a product (see inventory.reorder)."""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='reorder')
+    daily_velocity = models.FloatField(default=0)        # units dispensed per day, moving average
+    days_of_cover = models.FloatField(blank=True, null=True)  # None: no recent consumption
+    suggested_quantity = models.PositiveIntegerField(default=0)
+    computed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # stock status lists what to order, most urgent first
+            models.Index(fields=['days_of_cover', 'product'], condition=models.Q(suggested_quantity__gt=0),
+                         name='reorder_urgency_idx'),
+        ]
+
+    def __str__(self): return f"Reorder {self.suggested_quantity} of product {self.product_id}"
+
+class InventoryVersion(models.Model):
+    """Single-row counter bumped after each committed catalogue change (see inventory.versioning)."""
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self): return f"Inventory version {self.version}"
@@ -0,0 +1,134 @@
+import base64
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+
+
+def encode_cursor(values, direction):
+    raw = json.dumps({'k': values, 'd': direction}, separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Return (values, direction) or (None, 'n') for a missing/garbled token."""
+    if not token:
+        return None, 'n'
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        data = json.loads(raw)
+        values, direction = data['k'], data['d']
+    except (ValueError, TypeError, KeyError):
+        return None, 'n'
+    if direction not in ('n', 'p') or not isinstance(values, list):
+        return None, 'n'
+    return values, direction
+
+
+def approximate_count(qs, timeout=300):
+    """Cheap row count for "about N results" labels.
+
+    Unfiltered Postgres tables read the planner estimate; everything else
+    falls back to an exact COUNT(*) that is cached per query for `timeout` s.
+    """
+    conn = connections[qs.db]
+    if conn.vendor == 'postgresql' and not qs.query.where:
+        with conn.cursor() as cur:
+            cur.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                        [qs.model._meta.db_table])
+            row = cur.fetchone()
+        if row and row[0] > 0:
+            return row[0]
+    key = 'approx_count:' + hashlib.md5(str(qs.query).encode()).hexdigest()
+    n = cache.get(key)
+    if n is None:
+        n = qs.count()
+        cache.set(key, n, timeout)
+    return n
+
+
+class KeysetPage:
+    is_keyset = True
+
+    def __init__(self, object_list, has_next, has_previous, next_cursor, prev_cursor, approx_total=None):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.approx_total = approx_total
+
+    def __iter__(self): return iter(self.object_list)
+    def __len__(self): return len(self.object_list)
+
+
+class KeysetPaginator:
+    """Seek pagination over a stable ordering (e.g. name, then pk).
+
+    Each page is a single indexed range read of `per_page + 1` rows, so deep
+    pages cost the same as the first one and no COUNT(*) is issued.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('name', 'pk')):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = ordering
+
+    def _seek(self, values, forward):
+        op = 'gt' if forward else 'lt'
+        cond = Q()
+        for i, field in enumerate(self.ordering):
+            term = Q(**{f'{field}__{op}': values[i]})
+            for prev, value in zip(self.ordering[:i], values[:i]):
+                term &= Q(**{prev: value})
+            cond |= term
+        return cond
+
+    def _coerce(self, values):
+        """Cursor values as their ordering fields' types, or None if the cursor doesn't fit them."""
+        if len(values) != len(self.ordering):
+            return None
+        opts = self.queryset.model._meta
+        coerced = []
+        for name, value in zip(self.ordering, values):
+            if not isinstance(value, (str, int)):
+                return None
+            try:
+                coerced.append((opts.pk if name == 'pk' else opts.get_field(name)).to_python(value))
+            except ValidationError:
+                return None
+        return coerced
+
+    def _key(self, obj):
+        return [getattr(obj, f) for f in self.ordering]
+
+    def get_page(self, token=None, with_total=False):
+        values, direction = decode_cursor(token)
+        if values is not None:
+            values = self._coerce(values)
+            if values is None:  # tampered with: start over
+                direction = 'n'
+        forward = direction == 'n'
+
+        qs = self.queryset
+        if values is not None:
+            qs = qs.filter(self._seek(values, forward))
+        order = self.ordering if forward else [f'-{f}' for f in self.ordering]
+        rows = list(qs.order_by(*order)[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not forward:
+            rows.reverse()
+
+        if forward:
+            has_next, has_previous = more, values is not None
+        else:
+            has_next, has_previous = True, more
+
+        next_cursor = encode_cursor(self._key(rows[-1]), 'n') if rows and has_next else None
+        prev_cursor = encode_cursor(self._key(rows[0]), 'p') if rows and has_previous else None
+        total = approximate_count(self.queryset) if with_total else None
+        return KeysetPage(rows, has_next, has_previous, next_cursor, prev_cursor, total)
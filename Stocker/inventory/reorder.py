@@ -0,0 +1,126 @@
+"""Reorder suggestions from consumption velocity.
+
+One grouped query loads every product's consumption per day over the last
+REORDER_WINDOW_DAYS complete days into a (products x days) NumPy matrix.
+Consumption is the stock taken out by the ledger kinds in
+REORDER_CONSUMPTION_KINDS (dispenses by default). Quantities that imports
+write directly reach the ledger as adjustments (stock.sync_lots), so they
+only count when 'adjustment' is listed; only outgoing rows ever count.
+Velocity (the moving average), its spread, days of cover and the order
+quantity are then computed for the whole catalogue at once and written back
+in one pass, replacing the previous run. Products with no consumption and
+nothing to order get no ReorderSuggestion row.
+
+A product is due when its stock would not last the lead time plus safety
+stock (z * daily std * sqrt(lead time)), or when it is at its reorder_level.
+The suggestion tops it up to lead time + REORDER_TARGET_DAYS of demand plus
+safety stock, and never below reorder_level + 1.
+"""
+import math
+import time as clock
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Product, ReorderSuggestion, StockMovement
+
+try:
+    import numpy as np
+except ImportError:  # optional: only the reorder engine needs it
+    np = None
+
+CHUNK = 1000
+
+
+def available():
+    return np is not None
+
+
+def _midnight(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def load(today=None):
+    """(ids, quantity, reorder_level, daily) arrays; daily[i, d] is the quantity of
+    product ids[i] consumed d days after the window start."""
+    window = max(settings.REORDER_WINDOW_DAYS, 1)
+    today = today or timezone.localdate()
+    start = today - timedelta(days=window)
+
+    products = np.array(list(Product.objects.order_by('pk').values_list('pk', 'quantity', 'reorder_level')),
+                        dtype=np.int64).reshape(-1, 3)
+    ids, quantity, level = products[:, 0], products[:, 1], products[:, 2]
+
+    # one row per product: column i is the total consumed before the end of day i (range
+    # comparisons only, no per-row date functions); np.diff turns it into daily amounts
+    ends = {f'd{i}': Coalesce(Sum('delta', filter=Q(created_at__lt=_midnight(start + timedelta(days=i + 1)))), 0)
+            for i in range(window - 1)}
+    consumption = list(StockMovement.objects
+                       .filter(kind__in=settings.REORDER_CONSUMPTION_KINDS, delta__lt=0,
+                               created_at__gte=_midnight(start), created_at__lt=_midnight(today))
+                       .order_by().values('product_id')
+                       .annotate(**ends, total=Sum('delta'))
+                       .values_list('product_id', *ends, 'total'))
+    used = np.array(consumption, dtype=np.int64).reshape(-1, window + 1)
+
+    daily = np.zeros((len(ids), window))
+    if len(used) and len(ids):
+        rows = np.minimum(np.searchsorted(ids, used[:, 0]), len(ids) - 1)
+        known = ids[rows] == used[:, 0]
+        daily[rows[known]] = -np.diff(used[known, 1:], prepend=0)
+    return ids, quantity, level, daily
+
+
+def compute(quantity, level, daily):
+    """(velocity, days_of_cover, suggested) for every row; days_of_cover is NaN without consumption."""
+    lead, target = settings.REORDER_LEAD_TIME_DAYS, settings.REORDER_TARGET_DAYS
+    velocity = daily.mean(axis=1)
+    safety = settings.REORDER_SERVICE_Z * daily.std(axis=1) * math.sqrt(lead)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cover = np.where(velocity > 0, quantity / velocity, np.nan)
+    due = ((velocity > 0) & (quantity <= velocity * lead + safety)) | (quantity <= level)
+    order_up_to = np.maximum(velocity * (lead + target) + safety, level + 1)
+    suggested = np.where(due, np.ceil(np.maximum(order_up_to - quantity, 0)), 0).astype(np.int64)
+    return velocity, cover, suggested
+
+
+def save(ids, velocity, cover, suggested):
+    """Replace the stored suggestions; products with no consumption and nothing to order get no row.
+
+    Rows go in with executemany: building and preparing model instances would
+    cost more than computing the suggestions.
+    """
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    keep = np.flatnonzero((velocity > 0) | (suggested > 0))
+    rows = [
+        (pk, round(v, 3), None if math.isnan(c) else round(c, 1), s, now)
+        for pk, v, c, s in zip(ids[keep].tolist(), velocity[keep].tolist(), cover[keep].tolist(),
+                               suggested[keep].tolist())
+    ]
+    table = connection.ops.quote_name(ReorderSuggestion._meta.db_table)
+    sql = (f"INSERT INTO {table} (product_id, daily_velocity, days_of_cover, suggested_quantity, computed_at) "
+           f"VALUES (%s, %s, %s, %s, %s)")
+    with transaction.atomic(), connection.cursor() as cursor:
+        ReorderSuggestion.objects.all().delete()
+        for i in range(0, len(rows), CHUNK):
+            cursor.executemany(sql, rows[i:i + CHUNK])
+    return len(rows)
+
+
+def refresh(today=None):
+    """Recompute and store suggestions for the whole catalogue; returns counts and phase timings (ms)."""
+    timings = {}
+    started = clock.perf_counter()
+    ids, quantity, level, daily = load(today)
+    timings['load'] = (clock.perf_counter() - started) * 1000
+    started = clock.perf_counter()
+    velocity, cover, suggested = compute(quantity, level, daily)
+    timings['compute'] = (clock.perf_counter() - started) * 1000
+    started = clock.perf_counter()
+    saved = save(ids, velocity, cover, suggested)
+    timings['save'] = (clock.perf_counter() - started) * 1000
+    return {'products': len(ids), 'stored': saved, 'due': int((suggested > 0).sum()), 'timings': timings}
@@ -0,0 +1,167 @@
+"""Full-text product search backed by an SQLite FTS5 shadow table.
+
+`inventory_product_fts` holds one row per product (rowid = product id) with
+the searchable text: name, strength, form, barcode, category name and the
+names of all suppliers. Signals in `inventory.signals` keep it in sync; the
+`rebuild_search_index` command rebuilds it from scratch.
+
+Results are ranked and paged inside the FTS table (ORDER BY bm25 with
+LIMIT / OFFSET), so every match can be reached; only the products of the
+page being shown are then loaded.
+"""
+import re
+
+from django.db import connection
+
+from .models import Product, Category, Supplier
+
+FTS_TABLE = 'inventory_product_fts'
+CHUNK = 500
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def create_index_table(conn):
+    with conn.cursor() as cur:
+        cur.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            "name, strength, form, barcode, category, suppliers, "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+
+
+def drop_index_table(conn):
+    with conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+_available = set()
+
+
+def is_available(conn=connection):
+    """True when the FTS table exists (checked once per database, then remembered)."""
+    if conn.vendor != 'sqlite':
+        return False
+    name = str(conn.settings_dict['NAME'])
+    if name in _available:
+        return True
+    with conn.cursor() as cur:
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        found = cur.fetchone() is not None
+    if found:
+        _available.add(name)
+    return found
+
+
+def _reindex(where, params=()):
+    """Replace the FTS rows of every product matching `where` (SQL on alias p)."""
+    product = Product._meta.db_table
+    category = Category._meta.db_table
+    supplier = Supplier._meta.db_table
+    through = Product.suppliers.through._meta.db_table
+    with connection.cursor() as cur:
+        cur.execute(
+            f"DELETE FROM {FTS_TABLE} WHERE rowid IN (SELECT p.id FROM {product} p WHERE {where})",
+            params,
+        )
+        cur.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, strength, form, barcode, category, suppliers) "
+            f"SELECT p.id, p.name, p.strength, p.form, COALESCE(p.barcode, ''), COALESCE(c.name, ''), "
+            f"COALESCE((SELECT group_concat(s.name, ' ') FROM {through} ps "
+            f"JOIN {supplier} s ON s.id = ps.supplier_id WHERE ps.product_id = p.id), '') "
+            f"FROM {product} p LEFT JOIN {category} c ON c.id = p.category_id WHERE {where}",
+            params,
+        )
+
+
+def index_products(ids):
+    ids = list(ids)
+    for i in range(0, len(ids), CHUNK):
+        chunk = ids[i:i + CHUNK]
+        _reindex(f"p.id IN ({', '.join(['%s'] * len(chunk))})", chunk)
+
+
+def index_category(category_id):
+    _reindex("p.category_id = %s", [category_id])
+
+
+def index_supplier(supplier_id):
+    through = Product.suppliers.through._meta.db_table
+    _reindex(f"p.id IN (SELECT product_id FROM {through} WHERE supplier_id = %s)", [supplier_id])
+
+
+def remove_products(ids):
+    ids = list(ids)
+    with connection.cursor() as cur:
+        for i in range(0, len(ids), CHUNK):
+            chunk = ids[i:i + CHUNK]
+            cur.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({', '.join(['%s'] * len(chunk))})", chunk)
+
+
+def rebuild():
+    with connection.cursor() as cur:
+        cur.execute(f"DELETE FROM {FTS_TABLE}")
+    _reindex("1 = 1")
+    with connection.cursor() as cur:
+        cur.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        cur.execute(f"SELECT count(*) FROM {FTS_TABLE}")
+        return cur.fetchone()[0]
+
+
+def match_expression(q):
+    """'para 500' -> '"para"* AND "500"*' (every term, prefix-matched)."""
+    tokens = _TOKEN_RE.findall(q)
+    return ' AND '.join(f'"{t}"*' for t in tokens)
+
+
+def ranked_ids(q, limit=-1, offset=0):
+    """Ids of the products matching `q`, best first (limit -1: all of them)."""
+    expr = match_expression(q)
+    if not expr:
+        return []
+    with connection.cursor() as cur:
+        cur.execute(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+            f"ORDER BY bm25({FTS_TABLE}, 10.0, 2.0, 2.0, 5.0, 3.0, 3.0), rowid LIMIT %s OFFSET %s",
+            [expr, limit, offset],
+        )
+        return [r[0] for r in cur.fetchall()]
+
+
+def match_count(q):
+    expr = match_expression(q)
+    if not expr:
+        return 0
+    with connection.cursor() as cur:
+        cur.execute(f"SELECT count(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [expr])
+        return cur.fetchone()[0]
+
+
+class SearchResults:
+    """Products of `qs` matching `q`, best first, as a Paginator object list: count()
+    and slices run against the FTS table, then load just the sliced products."""
+
+    def __init__(self, qs, q):
+        self.qs, self.q = qs, q
+
+    def count(self):
+        return match_count(self.q)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice) or index.step is not None:
+            raise TypeError("SearchResults only supports slicing")
+        start = index.start or 0
+        limit = -1 if index.stop is None else max(index.stop - start, 0)
+        ids = ranked_ids(self.q, limit, start) if limit else []
+        products = self.qs.in_bulk(ids)
+        ranked = []
+        for rank, pk in enumerate(ids, start):
+            if pk in products:
+                products[pk].search_rank = rank  # lower is better
+                ranked.append(products[pk])
+        return ranked
+
+
+def search_products(qs, q):
+    """Products of `qs` matching `q`, ranked (see SearchResults)."""
+    return SearchResults(qs, q)
@@ -0,0 +1,107 @@
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver, Signal
+
+from . import search, barcodes, versioning
+from .models import Product, Category, Supplier, Location
+
+# Sent by set-based writers (bulk_create/bulk_update/update) that skip the
+# model signals: products_changing before touching existing rows,
+# products_changed afterwards (both in the same transaction).
+# kwargs: product_ids
+products_changing = Signal()
+products_changed = Signal()
+
+# Sent by stock movements (inventory.stock), which change quantities only,
+# after their writes and in the same transaction.
+# kwargs: deltas ({product_id: signed quantity change})
+stock_changed = Signal()
+
+
+# ----- Conditional GET validators -----
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Supplier)
+@receiver(post_delete, sender=Supplier)
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+@receiver(post_save, sender='accounts.Profile')  # avatar in the page header
+@receiver(m2m_changed, sender=Product.suppliers.through)
+@receiver(products_changed)
+@receiver(stock_changed)
+def bump_inventory_version(sender, raw=False, **kwargs):
+    if not raw and kwargs.get('action', 'post_').startswith('post_'):
+        versioning.bump()
+
+
+# ----- Barcode lookup cache -----
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def evict_barcode(sender, instance, **kwargs):
+    # by id drops the entry under its previous barcode too
+    barcodes.evict_on_commit([instance.pk], [instance.barcode])
+
+@receiver(products_changed)
+def evict_changed_barcodes(sender, product_ids, **kwargs):
+    barcodes.evict_on_commit(product_ids)
+
+@receiver(stock_changed)
+def evict_restocked_barcodes(sender, deltas, **kwargs):
+    barcodes.evict_on_commit(deltas)  # cached payloads carry the quantity
+
+
+# ----- Search index -----
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    if not raw and search.is_available():
+        search.index_products([instance.pk])
+
+@receiver(products_changed)
+def index_changed_products(sender, product_ids, **kwargs):
+    if search.is_available():
+        search.index_products(product_ids)
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    if search.is_available():
+        search.remove_products([instance.pk])
+
+@receiver(m2m_changed, sender=Product.suppliers.through)
+def index_product_suppliers(sender, instance, action, reverse, pk_set, **kwargs):
+    if not search.is_available():
+        return
+    if action == 'pre_clear' and reverse:
+        # supplier.product_set.clear() doesn't report which products lost the link
+        instance._search_product_ids = list(instance.product_set.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            search.index_products([instance.pk])
+        elif action == 'post_clear':
+            search.index_products(getattr(instance, '_search_product_ids', []))
+        else:
+            search.index_products(pk_set or [])
+
+@receiver(post_save, sender=Category)
+def index_category(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw and search.is_available():
+        search.index_category(instance.pk)
+
+@receiver(post_save, sender=Supplier)
+def index_supplier(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw and search.is_available():
+        search.index_supplier(instance.pk)
+
+@receiver(pre_delete, sender=Category)
+def remember_category_products(sender, instance, **kwargs):
+    instance._search_product_ids = list(instance.product_set.values_list('pk', flat=True))
+
+@receiver(pre_delete, sender=Supplier)
+def remember_supplier_products(sender, instance, **kwargs):
+    instance._search_product_ids = list(instance.product_set.values_list('pk', flat=True))
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Supplier)
+def reindex_orphaned_products(sender, instance, **kwargs):
+    if search.is_available():
+        search.index_products(getattr(instance, '_search_product_ids', []))
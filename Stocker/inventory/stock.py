@@ -0,0 +1,392 @@
+"""Stock movements: how stock quantities change after a product is created.
+
+Stock is held in StockLot rows at a Location. LocationStock holds each
+product's quantity per location (the sum of its lots there) and
+Product.quantity the total over locations. Both are denormalized and kept
+current incrementally by the writers here (sync_lots recounts the products
+it reconciles from their lots), never summed at read time.
+
+Outgoing stock is reserved with one `UPDATE ... SET quantity = quantity -
+n` per (location, product) on LocationStock, guarded by `quantity >= n`, in
+(location, product) order, so concurrent counters never overwrite each
+other and concurrent batches lock rows in the same order. Incoming stock and
+the totals are then added set-based: one CASE UPDATE per location / chunk.
+`apply_movements` applies many movements in one transaction and sends
+`stock_changed` with the net change per product: only quantities moved, so
+summaries are adjusted by price * change and the search index is left alone.
+
+Incoming stock goes to the lot matching (location, batch_no, expiry_date);
+outgoing stock is taken first-expiry-first-out: one windowed SELECT finds
+the lots each product draws from, and one CASE UPDATE takes from all of
+them. Product.expiry_date / batch_no then mirror the product's
+earliest-expiring lot still in stock, at any location.
+
+`transfer_stock` moves stock between two locations with a paired UPDATE of
+both locations' rows; the totals do not change.
+
+The product importer (bulk_update inside a products_changing /
+products_changed pair) and the demo seeder (save()) are the exception: they
+write Product.quantity directly and then call `sync_lots`, which records the
+difference as adjustments and brings lots and LocationStock in line.
+"""
+from collections import defaultdict
+from dataclasses import dataclass, replace
+from datetime import date
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When, Window
+from django.db.models.expressions import RowRange
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import versioning
+from .models import Location, LocationStock, Product, StockLot, StockMovement
+from .signals import stock_changed
+
+Kind = StockMovement.Kind
+
+# kinds whose quantity is always taken out of stock; ADJUSTMENT is signed
+OUTGOING = {Kind.DISPENSE, Kind.WRITE_OFF}
+CHUNK = 500
+FEFO_ORDER = [F('expiry_date').asc(nulls_last=True), F('pk').asc()]
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_ids, location_ids=()):
+        self.product_ids = list(product_ids)
+        self.location_ids = list(location_ids)  # where each product was short
+        super().__init__(f"Not enough stock for product(s) {', '.join(map(str, self.product_ids))}.")
+
+
+class _Short(Exception):
+    pass
+
+
+def default_location_id():
+    """The location stock goes to when none is given."""
+    location, _ = Location.objects.get_or_create(is_default=True, defaults={'name': 'Main store'})
+    return location.pk
+
+
+@dataclass
+class Movement:
+    product_id: int
+    kind: str
+    quantity: int  # > 0, except ADJUSTMENT which may be negative
+    note: str = ''
+    batch_no: str = ''              # lot for incoming stock
+    expiry_date: date = None
+    location_id: int = None         # default: default_location_id()
+
+    @property
+    def delta(self):
+        return -abs(self.quantity) if self.kind in OUTGOING else self.quantity
+
+    @property
+    def lot_key(self):
+        return self.product_id, self.location_id, self.batch_no or '', self.expiry_date
+
+
+def _case(mapping, key='pk'):
+    return Case(*[When(**{key: k}, then=Value(v)) for k, v in mapping.items()],
+                default=Value(0), output_field=IntegerField())
+
+
+def _add_to_lots(amounts):
+    """amounts: {lot id: quantity}, added in one UPDATE per chunk."""
+    items = list(amounts.items())
+    for i in range(0, len(items), CHUNK):
+        chunk = dict(items[i:i + CHUNK])
+        StockLot.objects.filter(pk__in=list(chunk)).update(quantity=F('quantity') + _case(chunk))
+
+
+def _add_location_stock(amounts):
+    """amounts: {(location_id, product_id): quantity > 0}. Creates the rows stock arrives
+    in, then adds to them with one UPDATE per location and chunk. Stock only ever
+    leaves LocationStock through the guarded _reserve."""
+    amounts = {k: q for k, q in amounts.items() if q > 0}
+    LocationStock.objects.bulk_create([LocationStock(location_id=l, product_id=p) for l, p in amounts],
+                                      ignore_conflicts=True, batch_size=CHUNK)
+    by_location = defaultdict(dict)
+    for (location_id, product_id), quantity in amounts.items():
+        by_location[location_id][product_id] = quantity
+    for location_id, per_product in sorted(by_location.items()):
+        items = sorted(per_product.items())
+        for i in range(0, len(items), CHUNK):
+            chunk = dict(items[i:i + CHUNK])
+            LocationStock.objects.filter(location_id=location_id, product_id__in=list(chunk)).update(
+                quantity=F('quantity') + _case(chunk, key='product_id'))
+
+
+def _recount_location_stock(product_ids):
+    """Set the products' LocationStock rows to the sum of their lots at each location."""
+    ids = sorted(product_ids)
+    for i in range(0, len(ids), CHUNK):
+        chunk = ids[i:i + CHUNK]
+        held = (StockLot.objects.filter(product_id__in=chunk, quantity__gt=0).order_by()
+                .values_list('location_id', 'product_id').annotate(held=Sum('quantity')))
+        LocationStock.objects.filter(product_id__in=chunk).delete()
+        LocationStock.objects.bulk_create([LocationStock(location_id=l, product_id=p, quantity=q)
+                                           for l, p, q in held], batch_size=CHUNK)
+
+
+def _reserve(needs):
+    """needs: {(location_id, product_id): quantity}. Takes each from LocationStock with a
+    guarded UPDATE; returns the (location_id, product_id) pairs that were short."""
+    short = []
+    for location_id, product_id in sorted(needs):
+        need = needs[location_id, product_id]
+        if not LocationStock.objects.filter(location_id=location_id, product_id=product_id,
+                                            quantity__gte=need).update(quantity=F('quantity') - need):
+            short.append((location_id, product_id))
+    return short
+
+
+def _add_to_totals(net, now):
+    """net: {product_id: signed quantity}, added to Product.quantity in one UPDATE per chunk."""
+    items = sorted(net.items())
+    for i in range(0, len(items), CHUNK):
+        chunk = dict(items[i:i + CHUNK])
+        Product.objects.filter(pk__in=list(chunk)).update(quantity=F('quantity') + _case(chunk), updated_at=now)
+
+
+def receive(incoming):
+    """incoming: {(product_id, location_id, batch_no, expiry_date): quantity}. Adds stock
+    to the matching lots, creating missing ones. Returns {key: lot id}."""
+    incoming = {k: q for k, q in incoming.items() if q > 0}
+    if not incoming:
+        return {}
+    lots = {}
+    for pk, product_id, location_id, batch_no, expiry_date in (
+            StockLot.objects.filter(product_id__in={k[0] for k in incoming}, location_id__in={k[1] for k in incoming},
+                                    batch_no__in={k[2] for k in incoming})
+            .order_by('pk').values_list('pk', 'product_id', 'location_id', 'batch_no', 'expiry_date')):
+        lots.setdefault((product_id, location_id, batch_no, expiry_date), pk)
+    missing = [k for k in incoming if k not in lots]
+    for lot in StockLot.objects.bulk_create([StockLot(product_id=p, location_id=l, batch_no=b, expiry_date=e)
+                                             for p, l, b, e in missing]):
+        lots[lot.product_id, lot.location_id, lot.batch_no, lot.expiry_date] = lot.pk
+    _add_to_lots({lots[k]: q for k, q in incoming.items()})
+    return {k: lots[k] for k in incoming}
+
+
+def take_fefo(needs, location_id=None):
+    """needs: {product_id: quantity}. Takes stock from each product's lots at the location
+    (any location if None), earliest expiry first (lots without expiry last). Returns
+    {product_id: [(lot id, taken, location id, batch_no, expiry_date), ...]}.
+
+    Callers reserve the quantity on LocationStock first; that row lock keeps
+    concurrent takers of the same product and location from racing on its lots.
+    """
+    needs = {p: n for p, n in needs.items() if n > 0}
+    allocations = defaultdict(list)
+    items = list(needs.items())
+    for i in range(0, len(items), CHUNK):
+        chunk = dict(items[i:i + CHUNK])
+        # stock in the product's earlier lots; a lot is drawn from while that is below the need
+        before = Coalesce(Window(Sum('quantity'), partition_by=[F('product_id')], order_by=FEFO_ORDER,
+                                 frame=RowRange(start=None, end=-1)), 0)
+        lots = StockLot.objects.filter(product_id__in=list(chunk), quantity__gt=0)
+        if location_id is not None:
+            lots = lots.filter(location_id=location_id)
+        rows = (lots.annotate(before=before, need=_case(chunk, key='product_id'))
+                .filter(before__lt=F('need'))
+                .order_by('product_id', *FEFO_ORDER)
+                .values_list('pk', 'product_id', 'quantity', 'before', 'location_id', 'batch_no', 'expiry_date'))
+        taken = {}
+        for pk, product_id, quantity, before, lot_location, batch_no, expiry_date in rows:
+            taken[pk] = min(quantity, chunk[product_id] - before)
+            allocations[product_id].append((pk, taken[pk], lot_location, batch_no, expiry_date))
+        if taken:
+            StockLot.objects.filter(pk__in=list(taken)).update(quantity=F('quantity') - _case(taken))
+    return allocations
+
+
+def refresh_product_lots(product_ids):
+    """Copy each product's earliest-expiring lot in stock onto Product.expiry_date / batch_no."""
+    first = (StockLot.objects.filter(product=OuterRef('pk'), quantity__gt=0)
+             .order_by(*FEFO_ORDER))
+    ids = list(product_ids)
+    for i in range(0, len(ids), CHUNK):
+        Product.objects.filter(pk__in=ids[i:i + CHUNK]).update(
+            expiry_date=Subquery(first.values('expiry_date')[:1]),
+            batch_no=Subquery(first.values('batch_no')[:1]),
+        )
+
+
+def _ledger_rows(movements, received, allocations, user):
+    """One StockMovement per movement and lot it touched, in movement order.
+    allocations: {(product_id, movement location_id): take_fefo allocations}."""
+    remaining = {k: [list(a) for a in allocs] for k, allocs in allocations.items()}
+    rows = []
+    for m in movements:
+        base = dict(product_id=m.product_id, kind=m.kind, note=m.note, user=user)
+        if m.delta > 0:
+            rows.append(StockMovement(lot_id=received.get(m.lot_key), location_id=m.location_id,
+                                      delta=m.delta, **base))
+            continue
+        need = -m.delta
+        for alloc in remaining.get((m.product_id, m.location_id), []):
+            if not need:
+                break
+            part = min(need, alloc[1])
+            if part:
+                alloc[1] -= part
+                need -= part
+                rows.append(StockMovement(lot_id=alloc[0], location_id=alloc[2], delta=-part, **base))
+        if need:  # taken from stock not held in any lot
+            rows.append(StockMovement(location_id=m.location_id, delta=-need, **base))
+    return rows
+
+
+def _with_locations(movements):
+    if all(m.location_id for m in movements):
+        return movements
+    default = default_location_id()
+    return [m if m.location_id else replace(m, location_id=default) for m in movements]
+
+
+def apply_movements(movements, user=None):
+    """Apply movements atomically; raises InsufficientStock (nothing written) if any
+    product would go below zero at its location. Returns the created StockMovement rows."""
+    movements = _with_locations([m for m in movements if m.delta])
+    if not movements:
+        return []
+    net, at = defaultdict(int), defaultdict(int)
+    incoming, outgoing = defaultdict(int), defaultdict(lambda: defaultdict(int))
+    for m in movements:
+        net[m.product_id] += m.delta
+        at[m.location_id, m.product_id] += m.delta
+        if m.delta > 0:
+            incoming[m.lot_key] += m.delta
+        else:
+            outgoing[m.location_id][m.product_id] -= m.delta
+    ids = sorted(net)
+    now = timezone.now()
+
+    with transaction.atomic():
+        short = _reserve({k: -d for k, d in at.items() if d < 0})
+        if short:
+            raise InsufficientStock([p for _, p in short], [l for l, _ in short])
+        _add_location_stock(at)
+        _add_to_totals(net, now)
+        received = receive(incoming)
+        allocations = {}
+        for location_id, needs in outgoing.items():
+            for product_id, allocs in take_fefo(needs, location_id).items():
+                allocations[product_id, location_id] = allocs
+        rows = StockMovement.objects.bulk_create(_ledger_rows(movements, received, allocations, user))
+        refresh_product_lots(ids)
+        stock_changed.send(sender=Product, deltas=dict(net))
+    return rows
+
+
+def apply_movement(product_id, kind, quantity, user=None, note='', batch_no='', expiry_date=None,
+                   location_id=None):
+    """Apply one movement; returns its ledger rows (one per lot it touched)."""
+    return apply_movements([Movement(product_id, kind, quantity, note, batch_no, expiry_date, location_id)],
+                           user=user)
+
+
+def transfer_stock(quantities, source_id, destination_id, user=None, note=''):
+    """Move {product_id: quantity} from one location to another; raises InsufficientStock
+    (nothing written) if the source holds too little of any product. Returns the ledger rows.
+
+    Both locations' LocationStock rows change in one paired UPDATE per chunk that
+    only matches source rows holding enough, so a short source shows up as a
+    missing row count. Lots move FEFO and keep their batch / expiry; each lot
+    moved gets a pair of TRANSFER rows. Product.quantity does not change, so no
+    products_changing / products_changed pair is sent.
+    """
+    needs = {p: q for p, q in quantities.items() if q > 0}
+    if not needs or source_id == destination_id:
+        return []
+    ids = sorted(needs)
+    try:
+        with transaction.atomic():
+            LocationStock.objects.bulk_create([LocationStock(location_id=destination_id, product_id=p) for p in ids],
+                                              ignore_conflicts=True, batch_size=CHUNK)
+            for i in range(0, len(ids), CHUNK):
+                chunk = {p: needs[p] for p in ids[i:i + CHUNK]}
+                need = _case(chunk, key='product_id')
+                moved = (LocationStock.objects
+                         .filter(Q(location_id=source_id, quantity__gte=need) | Q(location_id=destination_id),
+                                 product_id__in=list(chunk))
+                         .update(quantity=Case(When(location_id=source_id, then=F('quantity') - need),
+                                               default=F('quantity') + need)))
+                if moved != 2 * len(chunk):
+                    raise _Short
+            allocations = take_fefo(needs, source_id)
+            incoming = defaultdict(int)
+            for product_id, allocs in allocations.items():
+                for _, taken, _, batch_no, expiry_date in allocs:
+                    incoming[product_id, destination_id, batch_no, expiry_date] += taken
+            received = receive(incoming)
+            base = dict(kind=Kind.TRANSFER, note=note, user=user)
+            rows = []
+            for product_id in ids:
+                moved = 0
+                for lot, taken, _, batch_no, expiry_date in allocations.get(product_id, []):
+                    rows.append(StockMovement(product_id=product_id, location_id=source_id, lot_id=lot,
+                                              delta=-taken, **base))
+                    rows.append(StockMovement(product_id=product_id, location_id=destination_id, delta=taken,
+                                              lot_id=received[product_id, destination_id, batch_no, expiry_date],
+                                              **base))
+                    moved += taken
+                if moved < needs[product_id]:  # stock not held in any lot
+                    rows.append(StockMovement(product_id=product_id, location_id=source_id,
+                                              delta=moved - needs[product_id], **base))
+                    rows.append(StockMovement(product_id=product_id, location_id=destination_id,
+                                              delta=needs[product_id] - moved, **base))
+            rows = StockMovement.objects.bulk_create(rows)
+            versioning.bump()  # per-location figures changed; totals and summaries did not
+    except _Short:
+        held = dict(LocationStock.objects.filter(location_id=source_id, product_id__in=ids)
+                    .values_list('product_id', 'quantity'))
+        short = [p for p in ids if held.get(p, 0) < needs[p]]
+        raise InsufficientStock(short, [source_id] * len(short)) from None
+    return rows
+
+
+def record_opening_stock(product, user=None, location_id=None):
+    """Lot and ledger entry for the quantity a product was created with (no quantity change)."""
+    if not product.quantity:
+        return None
+    location_id = location_id or default_location_id()
+    lot = StockLot.objects.create(product=product, location_id=location_id, batch_no=product.batch_no or '',
+                                  expiry_date=product.expiry_date, quantity=product.quantity)
+    LocationStock.objects.create(product=product, location_id=location_id, quantity=product.quantity)
+    return StockMovement.objects.create(product=product, location_id=location_id, lot=lot, kind=Kind.RECEIPT,
+                                        delta=product.quantity, note='Opening stock', user=user)
+
+
+def sync_lots(product_ids, user=None, note=''):
+    """Bring lots in line with a Product.quantity that was written directly (imports,
+    seeding): the difference is received into the product's batch_no / expiry_date
+    lot at the default location or taken FEFO from any location, and recorded as
+    an adjustment. The products' LocationStock rows are then recounted from their
+    lots, which also absorbs stock that was never held in a lot. Runs no signals;
+    callers inside a products_changing / products_changed pair are covered by it.
+    """
+    ids = list(product_ids)
+    movements = []
+    for i in range(0, len(ids), CHUNK):
+        for pk, quantity, batch_no, expiry_date, held in (
+                Product.objects.filter(pk__in=ids[i:i + CHUNK]).order_by()
+                .annotate(held=Coalesce(Sum('lots__quantity'), 0))
+                .values_list('pk', 'quantity', 'batch_no', 'expiry_date', 'held')):
+            if quantity != held:
+                movements.append(Movement(pk, Kind.ADJUSTMENT, quantity - held, note, batch_no or '', expiry_date))
+    if not movements:
+        return 0
+    movements = _with_locations(movements)
+    with transaction.atomic():
+        received = receive({m.lot_key: m.delta for m in movements if m.delta > 0})
+        # all at the default location; stock is taken from wherever the lots are
+        allocations = {(p, movements[0].location_id): allocs for p, allocs in
+                       take_fefo({m.product_id: -m.delta for m in movements if m.delta < 0}).items()}
+        StockMovement.objects.bulk_create(_ledger_rows(movements, received, allocations, user), batch_size=1000)
+        changed = [m.product_id for m in movements]
+        _recount_location_stock(changed)
+        refresh_product_lots(changed)
+    return len(movements)
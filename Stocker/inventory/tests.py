@@ -1,3 +1,801 @@
-from django.test import TestCase
+import io
+import os
+import random
+import re
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.contrib.messages import constants as message_constants
+from django.contrib.messages.storage.base import Message
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core import mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from main import perf
+from reports import summaries
+from reports.models import CategoryStockSummary, SupplierStockSummary
+
+from . import barcodes, reorder, search, versioning
+from .importer import ProductImporter
+from .management.commands.seed_demo_data import Command as SeedCommand
+from .pagination import KeysetPaginator, approximate_count, encode_cursor
+from .models import (Category, InventoryVersion, Location, LocationStock, Product, ProductAlert, ProductAlertState,
+                     ReorderSuggestion, StockHealth, StockLot, StockMovement, Supplier)
+from .stock import (InsufficientStock, Movement, apply_movement, apply_movements, default_location_id, sync_lots,
+                    transfer_stock)
+from .utils import ALERT_MAX_ATTEMPTS, dispatch_alerts, queue_product_alert, scan_alerts
+
+Kind = StockMovement.Kind
+
+
+class StockTestCase(TestCase):
+    """A few products with stock received at the default location."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Analgesics')
+        cls.supplier = Supplier.objects.create(name='Acme')
+        cls.location_id = default_location_id()
+        cls.products = []
+        for i, price in enumerate(['2.50', '4.00', '10.00']):
+            p = Product.objects.create(name=f'Product {i}', price=Decimal(price), category=cls.category)
+            if i:
+                p.suppliers.add(cls.supplier)
+            cls.products.append(p)
+        apply_movements([Movement(p.pk, Kind.RECEIPT, 10) for p in cls.products])
+
+    def totals(self, product):
+        """(Product.quantity, sum of LocationStock, sum of lots) for one product."""
+        product.refresh_from_db()
+        return (product.quantity,
+                sum(LocationStock.objects.filter(product=product).values_list('quantity', flat=True)),
+                sum(StockLot.objects.filter(product=product).values_list('quantity', flat=True)))
+
+    def summary_rows(self):
+        return (sorted(CategoryStockSummary.objects.values_list('pk', 'products_count', 'stock_value')),
+                sorted(SupplierStockSummary.objects.values_list('pk', 'products_count', 'stock_value')))
+
+
+class StockHealthTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.out = Product.objects.create(name='Out', price=1, quantity=0)
+        cls.low = Product.objects.create(name='Low', price=1, quantity=3, reorder_level=5)
+        cls.ok = Product.objects.create(name='Ok', price=1, quantity=50, reorder_level=5)
+
+    def health(self, product):
+        return Product.objects.values_list('stock_health', flat=True).get(pk=product.pk)
+
+    def test_computed_on_create(self):
+        self.assertEqual([self.health(p) for p in (self.out, self.low, self.ok)],
+                         [StockHealth.OUT, StockHealth.LOW, StockHealth.OK])
+        Product.objects.bulk_create([Product(name='Bulk', price=1, quantity=2)])
+        self.assertEqual(Product.objects.get(name='Bulk').stock_health, StockHealth.LOW)
+
+    def test_partial_saves(self):
+        self.ok.quantity = 4
+        self.ok.save(update_fields=['quantity'])
+        self.assertEqual(self.health(self.ok), StockHealth.LOW)
+
+        stale = Product.objects.get(pk=self.low.pk)
+        Product.objects.filter(pk=self.low.pk).update(quantity=40)
+        stale.reorder_level = 10
+        stale.save(update_fields=['reorder_level'])  # judged on the stored quantity, 40
+        self.assertEqual(self.health(self.low), StockHealth.OK)
+
+        Product.objects.filter(pk=self.out.pk).update(quantity=9)
+        self.out.name = 'Renamed'
+        self.out.save(update_fields=['name'])  # not from the stale quantity, 0
+        self.assertEqual(self.health(self.out), StockHealth.OK)
+
+    def test_queryset_update(self):
+        Product.objects.filter(pk__in=[self.low.pk, self.ok.pk]).update(quantity=0)
+        self.assertEqual(self.health(self.ok), StockHealth.OUT)
+        Product.objects.update(reorder_level=F('reorder_level') * 0)
+        Product.objects.filter(pk=self.ok.pk).update(quantity=F('quantity') + 1)
+        self.assertEqual(self.health(self.ok), StockHealth.OK)
+
+    def test_bulk_update(self):
+        self.out.quantity, self.ok.quantity = 20, 1
+        Product.objects.bulk_update([self.out, self.ok], ['quantity'])
+        self.assertEqual((self.health(self.out), self.health(self.ok)), (StockHealth.OK, StockHealth.LOW))
+
+    def test_low_stock_filter_uses_the_partial_index(self):
+        self.assertEqual(list(Product.objects.low_stock().order_by('name', 'pk')), [self.low, self.out])
+        if connection.vendor == 'sqlite':
+            plan = Product.objects.low_stock().order_by('name', 'pk').explain()
+            self.assertIn('product_low_stock_idx', plan)
+
+
+class ApplyMovementsTests(StockTestCase):
+    def test_movements_keep_totals_locations_and_lots_in_step(self):
+        a, b, _ = self.products
+        apply_movements([Movement(a.pk, Kind.DISPENSE, 4), Movement(b.pk, Kind.RECEIPT, 5, batch_no='B2'),
+                         Movement(b.pk, Kind.ADJUSTMENT, -3)])
+        self.assertEqual(self.totals(a), (6, 6, 6))
+        self.assertEqual(self.totals(b), (12, 12, 12))
+
+    def test_guarded_update_refuses_stock_taken_since_the_caller_looked(self):
+        a = self.products[0]
+        stale = Product.objects.get(pk=a.pk)
+        # another writer takes 8 after `stale` was read
+        apply_movement(a.pk, Kind.DISPENSE, 8)
+        with self.assertRaises(InsufficientStock):
+            apply_movement(stale.pk, Kind.DISPENSE, stale.quantity)
+        self.assertEqual(self.totals(a), (2, 2, 2))
+
+    def test_concurrent_dispenses_do_not_lose_updates(self):
+        a = self.products[0]
+        first, second = Product.objects.get(pk=a.pk), Product.objects.get(pk=a.pk)
+        apply_movement(first.pk, Kind.DISPENSE, 3)
+        apply_movement(second.pk, Kind.DISPENSE, 4)
+        self.assertEqual(self.totals(a), (3, 3, 3))
+
+    def test_insufficient_stock_rolls_back_the_whole_batch(self):
+        a, b, c = self.products
+        movements_before = StockMovement.objects.count()
+        summaries_before = self.summary_rows()
+        with self.assertRaises(InsufficientStock) as raised:
+            apply_movements([Movement(a.pk, Kind.RECEIPT, 5), Movement(b.pk, Kind.DISPENSE, 2),
+                             Movement(c.pk, Kind.DISPENSE, 11)])
+        self.assertEqual(raised.exception.product_ids, [c.pk])
+        self.assertEqual(raised.exception.location_ids, [self.location_id])
+        for p in self.products:
+            self.assertEqual(self.totals(p), (10, 10, 10))
+        self.assertEqual(StockMovement.objects.count(), movements_before)
+        self.assertEqual(self.summary_rows(), summaries_before)
+
+    def test_stock_is_reserved_in_location_product_order(self):
+        a, b, c = self.products
+        with CaptureQueriesContext(connection) as queries:
+            apply_movements([Movement(c.pk, Kind.DISPENSE, 1), Movement(a.pk, Kind.DISPENSE, 1),
+                             Movement(b.pk, Kind.WRITE_OFF, 1)])
+        reserved = [int(m.group(1)) for q in queries
+                    if q['sql'].startswith('UPDATE "inventory_locationstock"')
+                    for m in [re.search(r'"product_id" = (\d+)', q['sql'])] if m]
+        self.assertEqual(reserved, sorted([a.pk, b.pk, c.pk]))
+
+    def test_summaries_follow_stock_value(self):
+        a, b, _ = self.products
+        apply_movements([Movement(a.pk, Kind.DISPENSE, 4), Movement(b.pk, Kind.RECEIPT, 7)])
+        incremental = self.summary_rows()
+        summaries.rebuild()
+        self.assertEqual(incremental, self.summary_rows())
+
+
+class TransferTests(StockTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.ward = Location.objects.create(name='Ward')
+
+    def held_at(self, location_id):
+        return dict(LocationStock.objects.filter(location_id=location_id).values_list('product_id', 'quantity'))
+
+    def test_transfer_keeps_totals_locations_and_lots_in_step(self):
+        a, b, _ = self.products
+        apply_movement(a.pk, Kind.RECEIPT, 5, batch_no='A2')
+        rows = transfer_stock({a.pk: 12, b.pk: 4}, self.location_id, self.ward.pk)
+        self.assertEqual(self.totals(a), (15, 15, 15))
+        self.assertEqual(self.totals(b), (10, 10, 10))
+        self.assertEqual(self.held_at(self.ward.pk), {a.pk: 12, b.pk: 4})
+        self.assertEqual(self.held_at(self.location_id)[a.pk], 3)
+        ward_lots = StockLot.objects.filter(location=self.ward, product=a).values_list('batch_no', 'quantity')
+        self.assertEqual(sum(q for _, q in ward_lots), 12)
+        self.assertEqual(sum(r.delta for r in rows), 0)
+
+    def test_short_source_rolls_back(self):
+        a, b, _ = self.products
+        movements_before = StockMovement.objects.count()
+        with self.assertRaises(InsufficientStock) as raised:
+            transfer_stock({a.pk: 4, b.pk: 11}, self.location_id, self.ward.pk)
+        self.assertEqual(raised.exception.product_ids, [b.pk])
+        self.assertEqual(self.held_at(self.ward.pk), {})
+        self.assertEqual(self.held_at(self.location_id)[a.pk], 10)
+        self.assertFalse(StockLot.objects.filter(location=self.ward).exists())
+        self.assertEqual(StockMovement.objects.count(), movements_before)
+
+    def test_sync_lots_absorbs_stock_outside_lots(self):
+        a, b, _ = self.products
+        transfer_stock({a.pk: 4}, self.location_id, self.ward.pk)
+        # legacy rows: 3 units on hand at the main store that are in no lot, none of b's
+        LocationStock.objects.filter(product=a, location_id=self.location_id).update(quantity=9)
+        LocationStock.objects.filter(product=b).delete()
+        Product.objects.filter(pk=a.pk).update(quantity=5)  # counts written by an import
+        Product.objects.filter(pk=b.pk).update(quantity=14)
+        self.assertEqual(sync_lots([a.pk, b.pk]), 2)
+        self.assertEqual(self.totals(a), (5, 5, 5))
+        self.assertEqual(self.totals(b), (14, 14, 14))
+        for location_id in (self.location_id, self.ward.pk):
+            lots = dict(StockLot.objects.filter(location_id=location_id, quantity__gt=0).order_by()
+                        .values_list('product_id').annotate(held=Sum('quantity')))
+            self.assertEqual(self.held_at(location_id), lots)
+
+
+class FefoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        today = timezone.localdate()
+        cls.soon, cls.later = today + timedelta(days=10), today + timedelta(days=200)
+        cls.product = Product.objects.create(name='Amoxicillin', price=1)
+        cls.other = Product.objects.create(name='Ibuprofen', price=1)
+        apply_movements([
+            Movement(cls.product.pk, Kind.RECEIPT, 5, batch_no='LATE', expiry_date=cls.later),
+            Movement(cls.product.pk, Kind.RECEIPT, 4, batch_no='NONE'),
+            Movement(cls.product.pk, Kind.RECEIPT, 3, batch_no='SOON', expiry_date=cls.soon),
+            Movement(cls.other.pk, Kind.RECEIPT, 6, batch_no='X', expiry_date=cls.later),
+        ])
+
+    def lots(self, product=None):
+        return list(StockLot.objects.filter(product=product or self.product).values_list('batch_no', 'quantity'))
+
+    def test_receipts_of_the_same_batch_share_a_lot(self):
+        apply_movement(self.product.pk, Kind.RECEIPT, 2, batch_no='SOON', expiry_date=self.soon)
+        self.assertEqual(self.lots(), [('SOON', 5), ('LATE', 5), ('NONE', 4)])
+
+    def test_dispense_takes_earliest_expiry_first_and_logs_each_lot(self):
+        apply_movements([Movement(self.product.pk, Kind.DISPENSE, 7), Movement(self.other.pk, Kind.DISPENSE, 1)])
+        self.assertEqual(self.lots(), [('SOON', 0), ('LATE', 1), ('NONE', 4)])
+        self.assertEqual(self.lots(self.other), [('X', 5)])
+        taken = (StockMovement.objects.filter(product=self.product, kind=Kind.DISPENSE)
+                 .order_by('pk').values_list('lot__batch_no', 'delta'))
+        self.assertEqual(list(taken), [('SOON', -3), ('LATE', -4)])
+
+    def test_lots_without_expiry_go_last(self):
+        apply_movement(self.product.pk, Kind.DISPENSE, 10)
+        self.assertEqual(self.lots(), [('SOON', 0), ('LATE', 0), ('NONE', 2)])
+
+    def test_product_mirrors_its_earliest_lot_in_stock(self):
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.batch_no, self.product.expiry_date), ('SOON', self.soon))
+        apply_movement(self.product.pk, Kind.WRITE_OFF, 3)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.batch_no, self.product.expiry_date), ('LATE', self.later))
+
+    def test_near_expiry_lists_lots_not_products(self):
+        cutoff = timezone.localdate() + timedelta(days=30)
+        self.assertEqual([lot.batch_no for lot in StockLot.objects.near_expiry(cutoff)], ['SOON'])
+        apply_movement(self.product.pk, Kind.DISPENSE, 3)
+        self.assertEqual(list(StockLot.objects.near_expiry(cutoff)), [])
+
+
+class BarcodeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name='Amoxicillin', barcode='111', price=Decimal('3.50'), quantity=4)
+        Product.objects.create(name='Ibuprofen', barcode='222', price=1)
+        cls.user = User.objects.create_user('clerk', password='x')
+
+    def setUp(self):
+        barcodes.cache.clear()
+        self.addCleanup(barcodes.cache.clear)
+
+    def test_single_lookup(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('inventory:barcode_lookup', args=['111']))
+        self.assertEqual(response.json(), {'id': self.product.pk, 'barcode': '111', 'name': 'Amoxicillin',
+                                           'strength': '', 'price': '3.50', 'quantity': 4})
+        self.assertEqual(self.client.get(reverse('inventory:barcode_lookup', args=['999'])).status_code, 404)
+        with self.assertNumQueries(0):
+            self.assertEqual(barcodes.lookup(['111'])['111']['name'], 'Amoxicillin')
+
+    def test_batch_lookup_reads_all_misses_at_once(self):
+        barcodes.lookup(['111'])
+        with self.assertNumQueries(1):
+            found = barcodes.lookup(['111', '222', '999', '222', ''])
+        self.assertEqual(sorted(found), ['111', '222'])
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('inventory:barcode_batch'), {'codes': '222,999', 'code': '111'})
+        self.assertEqual({c: p and p['name'] for c, p in response.json()['results'].items()},
+                         {'111': 'Amoxicillin', '222': 'Ibuprofen', '999': None})
+        too_many = ','.join(str(i) for i in range(barcodes.MAX_BATCH + 1))
+        self.assertEqual(self.client.get(reverse('inventory:barcode_batch'), {'codes': too_many}).status_code, 400)
+
+    def test_cache_is_bounded_lru_with_expiry(self):
+        lru = barcodes.LRUCache(2, 60)
+        lru.set_many({'a': {'id': 1}, 'b': {'id': 2}})
+        lru.get_many(['a'])  # now the most recently used
+        lru.set_many({'c': {'id': 3}})
+        self.assertEqual(sorted(lru.get_many(['a', 'b', 'c'])), ['a', 'c'])
+        self.assertEqual(len(lru), 2)
+        expired = barcodes.LRUCache(2, -1)
+        expired.set_many({'a': {'id': 1}})
+        self.assertEqual(expired.get_many(['a']), {})
+
+    def test_save_evicts_once_committed(self):
+        barcodes.lookup(['111'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price, self.product.barcode = Decimal('4.00'), '333'
+            self.product.save()
+            self.assertIn('111', barcodes.cache.get_many(['111']))  # a lookup now could re-cache the old row
+        self.assertEqual(barcodes.cache.get_many(['111']), {})
+        self.assertEqual(barcodes.lookup(['333'])['333']['price'], '4.00')
+
+    def test_delete_and_stock_movements_evict(self):
+        barcodes.lookup(['111', '222'])
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_movement(self.product.pk, Kind.RECEIPT, 6)
+        self.assertEqual(barcodes.lookup(['111'])['111']['quantity'], 10)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.get(barcode='222').delete()
+        self.assertEqual(barcodes.lookup(['222']), {})
+
+
+class VersioningTests(TransactionTestCase):
+    def setUp(self):
+        self.products = [Product.objects.create(name=f'Product {i}', price=Decimal('1.00')) for i in range(2)]
+        apply_movements([Movement(p.pk, Kind.RECEIPT, 5) for p in self.products])
+
+    def version(self):
+        return InventoryVersion.objects.filter(pk=1).values_list('version', flat=True).first() or 0
+
+    def test_bump_runs_once_after_the_transaction_commits(self):
+        before = self.version()
+        with transaction.atomic():
+            apply_movement(self.products[0].pk, Kind.DISPENSE, 1)
+            apply_movement(self.products[1].pk, Kind.DISPENSE, 1)
+            self.products[0].save()
+            self.assertEqual(self.version(), before)
+        self.assertEqual(self.version(), before + 1)
+
+    def test_bump_in_rolled_back_savepoint_is_not_lost(self):
+        before = self.version()
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    versioning.bump()
+                    raise InsufficientStock([])
+            except InsufficientStock:
+                pass
+            versioning.bump()
+        self.assertEqual(self.version(), before + 1)
+
+    def test_committed_change_gets_a_fresh_page(self):
+        product = self.products[0]
+        self.client.force_login(User.objects.create_user('clerk', password='x'))
+        url = reverse('inventory:product_detail', args=[product.pk])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        product.name = 'Renamed'
+        product.save()
+        self.assertContains(self.client.get(url, HTTP_IF_NONE_MATCH=etag), 'Renamed')
+
+
+class SeedTests(TransactionTestCase):
+    def seed(self, seed):
+        call_command('seed_demo_data', products=5, seed=seed, suppliers=5, categories=3, stdout=io.StringIO())
+
+    def test_seeds_a_hundred_apart_do_not_collide(self):
+        self.seed(3)
+        self.seed(103)
+        self.assertEqual(Product.objects.filter(barcode__startswith='20003').count(), 5)
+        self.assertEqual(Product.objects.filter(barcode__startswith='20103').count(), 5)
+
+    def test_catalogue_bumps_the_inventory_version(self):
+        # bulk inserts send no signals
+        versioning._bump()
+        before = InventoryVersion.objects.get(pk=1).version
+        command = SeedCommand(stdout=io.StringIO())
+        options = dict(products=5, seed=4, suppliers=5, categories=3, batch_size=100, low_stock_share=0.15)
+        self.assertTrue(command.seed_catalogue(random.Random(4), options))
+        self.assertEqual(InventoryVersion.objects.get(pk=1).version, before + 1)
+
+
+class ConditionalPageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name='Amoxicillin', price=1)
+        cls.user = User.objects.create_user('clerk', password='x')
+        versioning._bump()
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.url = reverse('inventory:product_detail', args=[self.product.pk])
+
+    def revalidate(self, url=None):
+        first = self.client.get(url or self.url)
+        self.assertEqual(first.status_code, 200)
+        return first['ETag']
+
+    def test_matching_etag_is_answered_without_rendering(self):
+        etag = self.revalidate()
+        with self.assertNumQueries(3):  # session, user, version row
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.templates, [])
+
+    def test_another_user_gets_their_own_page(self):
+        etag = self.revalidate()
+        self.client.force_login(User.objects.create_user('other', password='x'))
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_pending_messages_are_rendered(self):
+        etag = self.revalidate()
+        storage = CookieStorage(RequestFactory().get('/'))
+        self.client.cookies[storage.cookie_name] = storage._encode([Message(message_constants.SUCCESS, 'Saved.')])
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Saved.')
+
+    def test_daily_pages_change_at_midnight(self):
+        url = reverse('reports:reports_dashboard')
+        etag = self.revalidate(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        with mock.patch('django.utils.timezone.localdate', return_value=tomorrow):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.supplier = Supplier.objects.create(name='Amoxa Pharma')
+        Product.objects.bulk_create([Product(name=f'Paracetamol {i}', strength='500mg', price=1) for i in range(505)])
+        search.rebuild()
+        cls.by_name = Product.objects.create(name='Amoxicillin', strength='250mg', price=3)
+        cls.by_supplier = Product.objects.create(name='Cough syrup', price=2)
+        cls.by_supplier.suppliers.add(cls.supplier)
+
+    def results(self, q):
+        return search.search_products(Product.objects.all(), q)
+
+    def test_every_match_is_reachable(self):
+        paginator = Paginator(self.results('para 500'), 10)
+        self.assertEqual(paginator.count, 505)
+        last = paginator.get_page(51)
+        self.assertEqual(len(last), 5)
+        seen = [p.pk for n in paginator.page_range for p in paginator.get_page(n)]
+        self.assertEqual(len(set(seen)), 505)
+
+    def test_name_matches_rank_first(self):
+        self.assertEqual([p.pk for p in self.results('amox')[:10]], [self.by_name.pk, self.by_supplier.pk])
+
+    def test_index_follows_saves_and_renames(self):
+        self.by_name.name = 'Ampicillin'
+        self.by_name.save()
+        self.assertEqual(self.results('ampi').count(), 1)
+        self.assertEqual([p.pk for p in self.results('amox')[:10]], [self.by_supplier.pk])
+        self.supplier.name = 'Brufen Ltd'
+        self.supplier.save()
+        self.assertEqual([p.pk for p in self.results('brufen')[:10]], [self.by_supplier.pk])
+
+    def test_list_view_pages_past_the_first_500(self):
+        user = User.objects.create_user('clerk', password='x')
+        self.client.force_login(user)
+        response = self.client.get(reverse('inventory:product_list'), {'q': 'para', 'page': 51})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['page_obj']), 5)
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # repeated names, so pages must break ties on pk
+        Product.objects.bulk_create([Product(name=f'Item {i % 7:02d}', price=1) for i in range(23)])
+        cls.ordered = list(Product.objects.order_by('name', 'pk').values_list('pk', flat=True))
+
+    def paginator(self):
+        return KeysetPaginator(Product.objects.all(), 5)
+
+    def test_forward_then_back_visits_every_row_once(self):
+        pages, page = [], self.paginator().get_page()
+        self.assertFalse(page.has_previous)
+        while True:
+            pages.append([p.pk for p in page])
+            if not page.has_next:
+                break
+            page = self.paginator().get_page(page.next_cursor)
+        self.assertEqual([pk for ids in pages for pk in ids], self.ordered)
+        self.assertEqual([len(ids) for ids in pages], [5, 5, 5, 5, 3])
+
+        back = []
+        while page.has_previous:
+            page = self.paginator().get_page(page.prev_cursor)
+            back.append([p.pk for p in page])
+        self.assertEqual(back, pages[-2::-1])
+
+    def test_each_page_is_one_query(self):
+        first = self.paginator().get_page()
+        with self.assertNumQueries(1):
+            self.paginator().get_page(first.next_cursor)
+
+    def test_bad_cursor_falls_back_to_the_first_page(self):
+        for token in ['garbage', encode_cursor(['Item 03'], 'n'), encode_cursor(['Item 03', 1], 'x'),
+                      encode_cursor(['a', 'x'], 'n'), encode_cursor([None, 1], 'p'), encode_cursor([['a'], 1], 'n')]:
+            with self.subTest(token=token):
+                page = self.paginator().get_page(token)
+                self.assertEqual([p.pk for p in page], self.ordered[:5])
+
+    def test_cursor_values_are_coerced_to_the_field_types(self):
+        fifth = Product.objects.get(pk=self.ordered[4])
+        page = self.paginator().get_page(encode_cursor([fifth.name, str(fifth.pk)], 'n'))
+        self.assertEqual([p.pk for p in page], self.ordered[5:10])
+
+    def test_approximate_count_is_cached(self):
+        self.assertEqual(approximate_count(Product.objects.filter(price=1)), 23)
+        with self.assertNumQueries(0):
+            self.assertEqual(approximate_count(Product.objects.filter(price=1)), 23)
+
+    @override_settings(INVENTORY_PAGINATION='keyset', INVENTORY_PAGINATION_APPROX_TOTAL=True)
+    def test_list_view_follows_cursors(self):
+        self.client.force_login(User.objects.create_user('clerk', password='x'))
+        response = self.client.get(reverse('inventory:product_list'))
+        page_obj = response.context['page_obj']
+        self.assertTrue(page_obj.is_keyset)
+        self.assertEqual(page_obj.approx_total, 23)
+        tampered = encode_cursor(['a', 'x'], 'n')
+        response = self.client.get(reverse('inventory:product_list'), {'cursor': tampered})
+        self.assertEqual([p.pk for p in response.context['page_obj']], self.ordered[:10])
+        self.assertContains(response, f'?cursor={page_obj.next_cursor}')
+        response = self.client.get(reverse('inventory:product_list'), {'cursor': page_obj.next_cursor})
+        self.assertEqual([p.pk for p in response.context['page_obj']], self.ordered[10:20])
+
+
+class ImporterTests(TestCase):
+    HEADER = 'Name,Strength,Form,Barcode,Category,Suppliers,Price,Quantity,ReorderLevel,BatchNo,Expiry\n'
+
+    def run_import(self, body, **kwargs):
+        return list(ProductImporter(**kwargs).run(io.StringIO(self.HEADER + body)))
+
+    def test_creates_products_with_links_lots_and_index(self):
+        reports = self.run_import('Amoxil,500mg,Capsule,111,Antibiotics,"Acme, Brufen",3.50,20,5,B1,2030-01-31\n'
+                                  'Panadol,,,,Analgesics,,1.25,0,,,\n')
+        self.assertEqual([(r.rows, r.created, r.updated, r.errors) for r in reports], [(2, 2, 0, [])])
+        amoxil = Product.objects.get(barcode='111')
+        self.assertEqual(amoxil.category.name, 'Antibiotics')
+        self.assertEqual(sorted(amoxil.suppliers.values_list('name', flat=True)), ['Acme', 'Brufen'])
+        self.assertEqual(amoxil.price, Decimal('3.50'))
+        self.assertEqual(list(amoxil.lots.values_list('batch_no', 'quantity')), [('B1', 20)])
+        self.assertEqual(LocationStock.objects.get(product=amoxil).quantity, 20)
+        self.assertEqual(Product.objects.get(name='Panadol').reorder_level, 5)
+        if search.is_available():
+            self.assertEqual([p.pk for p in search.search_products(Product.objects.all(), 'acme')[:10]],
+                             [amoxil.pk])
+
+    def test_barcode_upserts_and_last_row_wins(self):
+        self.run_import('Amoxil,500mg,Capsule,111,,Acme,3.50,20,5,,\n')
+        reports = self.run_import('Amoxil,500mg,Capsule,111,,,4.00,15,5,,\n'
+                                  'Amoxil Forte,500mg,Capsule,111,,Brufen,4.25,12,5,,\n')
+        self.assertEqual((reports[0].created, reports[0].updated), (0, 1))
+        amoxil = Product.objects.get(barcode='111')
+        self.assertEqual((amoxil.name, amoxil.price, amoxil.quantity), ('Amoxil Forte', Decimal('4.25'), 12))
+        self.assertEqual(list(amoxil.suppliers.values_list('name', flat=True)), ['Brufen'])
+        self.assertEqual(LocationStock.objects.get(product=amoxil).quantity, 12)
+
+    def test_bad_rows_are_reported_by_line_and_skipped(self):
+        reports = self.run_import('Good,,,,,,1.00,1,,,\n'
+                                  ',,,,,,1.00,1,,,\n'
+                                  'Cheap,,,,,,1.005,1,,,\n'
+                                  'Odd,,,,,,1.00,many,,,\n'
+                                  'Old,,,,,,1.00,1,,,31/01/2030\n', batch_size=2)
+        self.assertEqual([(r.number, r.rows, r.created) for r in reports], [(1, 2, 1), (2, 2, 0), (3, 1, 0)])
+        errors = [line for r in reports for line, _ in r.errors]
+        self.assertEqual(errors, [3, 4, 5, 6])
+        self.assertEqual(list(Product.objects.values_list('name', flat=True)), ['Good'])
+
+    def test_oversized_price_fails_only_its_row(self):
+        reports = self.run_import('Gold,,,,,,123456789.00,1,,,\nTin,,,,,,1234567.89,1,,,\n')
+        self.assertEqual(reports[0].created, 1)
+        self.assertEqual([line for line, _ in reports[0].errors], [2])
+        self.assertEqual(list(Product.objects.values_list('name', flat=True)), ['Tin'])
+
+    def test_new_label_alone_keeps_the_lot_mirror(self):
+        self.run_import('Amoxil,,,111,,,1.00,5,,B1,2030-01-31\n')
+        self.run_import('Amoxil,,,111,,,1.00,5,,B2,2031-01-31\n')
+        amoxil = Product.objects.get(barcode='111')
+        self.assertEqual(list(amoxil.lots.values_list('batch_no', 'expiry_date', 'quantity')),
+                         [('B1', date(2030, 1, 31), 5)])
+        self.assertEqual((amoxil.batch_no, amoxil.expiry_date), ('B1', date(2030, 1, 31)))
+
+    def test_no_create_leaves_unknown_names_unlinked(self):
+        Supplier.objects.create(name='Acme')
+        self.run_import('Amoxil,,,111,Antibiotics,"Acme, Brufen",1.00,1,,,\n', create_missing=False)
+        amoxil = Product.objects.get(barcode='111')
+        self.assertIsNone(amoxil.category)
+        self.assertEqual(list(amoxil.suppliers.values_list('name', flat=True)), ['Acme'])
+        self.assertFalse(Supplier.objects.filter(name='Brufen').exists())
+
+    def test_command_and_staff_view(self):
+        path = self.tmp_csv('Amoxil,,,111,,,1.00,1,,,\n')
+        out = io.StringIO()
+        call_command('import_products', path, stdout=out)
+        self.assertIn('Import complete: 1 rows, 1 created, 0 updated, 0 errors.', out.getvalue())
+
+        self.client.force_login(User.objects.create_user('clerk', password='x'))
+        url = reverse('inventory:product_import')
+        self.assertNotEqual(self.client.get(url).status_code, 200)
+        self.client.force_login(User.objects.create_user('boss', password='x', is_staff=True))
+        upload = SimpleUploadedFile('products.csv', (self.HEADER + 'Amoxil,,,111,,,2.00,1,,,\n').encode('utf-8-sig'))
+        response = self.client.post(url, {'file': upload}, follow=True)
+        self.assertContains(response, 'Import finished: 0 created, 1 updated, 0 errors.')
+        self.assertEqual(Product.objects.get(barcode='111').price, Decimal('2.00'))
+
+    def tmp_csv(self, body):
+        f = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, newline='')
+        self.addCleanup(os.unlink, f.name)
+        with f:
+            f.write(self.HEADER + body)
+        return f.name
+
+
+@override_settings(REORDER_WINDOW_DAYS=28, REORDER_LEAD_TIME_DAYS=7, REORDER_TARGET_DAYS=30, REORDER_SERVICE_Z=1.65)
+class ReorderTests(StockTestCase):
+    def consume(self, product, kind, quantity, days_ago=1):
+        rows = apply_movement(product.pk, kind, quantity)
+        StockMovement.objects.filter(pk__in=[r.pk for r in rows]).update(
+            created_at=timezone.now() - timedelta(days=days_ago))
+
+    @skipUnless(reorder.available(), "needs NumPy")
+    def test_compute_orders_up_to_lead_time_and_target(self):
+        np = reorder.np
+        daily = np.array([[2.0] * 28, [0.0] * 28, [0.0] * 28, [4.0] * 28])
+        velocity, cover, suggested = reorder.compute(np.array([100, 5, 0, 20]), np.array([5, 5, 5, 5]), daily)
+        self.assertEqual(velocity.tolist(), [2.0, 0.0, 0.0, 4.0])
+        self.assertEqual(cover[0], 50.0)
+        self.assertTrue(np.isnan(cover[1]))
+        # 100 on hand lasts past the lead time; 5 and 0 are at the reorder level (top up to level + 1);
+        # 20 lasts 5 days < 7: order 4 * (7 + 30) - 20
+        self.assertEqual(suggested.tolist(), [0, 1, 6, 128])
+
+    @skipUnless(reorder.available(), "needs NumPy")
+    def test_velocity_counts_outgoing_rows_of_the_configured_kinds(self):
+        a = self.products[0]
+        self.consume(a, Kind.RECEIPT, 50)
+        self.consume(a, Kind.DISPENSE, 7)
+        self.consume(a, Kind.ADJUSTMENT, -7)
+        self.consume(a, Kind.DISPENSE, 3, days_ago=0)  # today is not a complete day
+        reorder.refresh()
+        self.assertAlmostEqual(ReorderSuggestion.objects.get(product=a).daily_velocity, 0.25)
+        with self.settings(REORDER_CONSUMPTION_KINDS=['dispense', 'adjustment']):
+            reorder.refresh()
+        self.assertAlmostEqual(ReorderSuggestion.objects.get(product=a).daily_velocity, 0.5)
+
+    def test_status_page_shows_a_dash_without_cover(self):
+        ReorderSuggestion.objects.create(product=self.products[0], daily_velocity=0, days_of_cover=None,
+                                         suggested_quantity=5)
+        self.client.force_login(User.objects.create_user('clerk', password='x'))
+        response = self.client.get(reverse('inventory:stock_status'))
+        self.assertContains(response, '<td class="text-end">-</td>', html=True)
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, messages):
+        raise OSError("SMTP server unavailable")
+
+
+@override_settings(MANAGER_EMAIL='manager@example.com')
+class AlertOutboxTests(TestCase):
+    def setUp(self):
+        self.low = Product.objects.create(name='Insulin', price=1, quantity=2, reorder_level=5)
+        self.expiring = Product.objects.create(name='Vaccine', price=1, quantity=50,
+                                               expiry_date=timezone.localdate() + timedelta(days=3))
+
+    def test_alert_is_queued_once_per_crossing(self):
+        self.assertIsNotNone(queue_product_alert(self.low))
+        self.assertIsNone(queue_product_alert(self.low))
+        self.low.quantity = 20
+        queue_product_alert(self.low)  # back above the level: the flag is cleared
+        self.low.quantity = 1
+        self.assertIsNotNone(queue_product_alert(self.low))
+
+    def test_alerts_for_a_recipient_go_in_one_message(self):
+        queue_product_alert(self.low)
+        queue_product_alert(self.expiring)
+        self.assertEqual(dispatch_alerts(), (2, 1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('Low stock: Insulin', mail.outbox[0].body)
+        self.assertIn('Near expiry: Vaccine', mail.outbox[0].body)
+        self.assertFalse(ProductAlert.objects.filter(sent_at__isnull=True).exists())
+        self.assertEqual(dispatch_alerts(), (0, 0, 0))
+
+    def test_failed_sends_back_off_exponentially(self):
+        alert = queue_product_alert(self.low)
+        for attempts, delay in ((1, timedelta(minutes=1)), (2, timedelta(minutes=2)), (3, timedelta(minutes=4))):
+            before = timezone.now()
+            self.assertEqual(dispatch_alerts(connection=FailingEmailBackend()), (1, 0, 1))
+            alert.refresh_from_db()
+            self.assertEqual(alert.attempts, attempts)
+            self.assertIsNone(alert.claimed_at)
+            self.assertIn('SMTP server unavailable', alert.last_error)
+            self.assertGreaterEqual(alert.next_attempt_at, before + delay)
+            self.assertEqual(dispatch_alerts(), (0, 0, 0))  # not due yet
+            ProductAlert.objects.filter(pk=alert.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(dispatch_alerts(), (1, 1, 0))
+        alert.refresh_from_db()
+        self.assertIsNotNone(alert.sent_at)
+
+    def test_gives_up_after_the_last_attempt(self):
+        alert = queue_product_alert(self.low)
+        ProductAlert.objects.filter(pk=alert.pk).update(attempts=ALERT_MAX_ATTEMPTS)
+        self.assertEqual(dispatch_alerts(), (0, 0, 0))
+
+
+@override_settings(MANAGER_EMAIL='manager@example.com')
+class AlertScanTests(TestCase):
+    def setUp(self):
+        self.low = Product.objects.create(name='Insulin', price=1, quantity=2, reorder_level=5)
+        self.expiring = Product.objects.create(name='Vaccine', price=1, quantity=50,
+                                               expiry_date=timezone.localdate() + timedelta(days=3))
+        Product.objects.create(name='Saline', price=1, quantity=50)
+
+    def scan(self, *args):
+        out = io.StringIO()
+        call_command('inventory_alert_scan', *args, stdout=out)
+        return out.getvalue()
+
+    def test_only_new_crossings_are_reported(self):
+        self.assertEqual(scan_alerts(), ([self.low.pk], [self.expiring.pk], 0))
+        self.assertEqual(scan_alerts(), ([], [], 0))
+        Product.objects.filter(pk=self.low.pk).update(quantity=20)
+        self.assertEqual(scan_alerts(), ([], [], 1))
+        self.assertFalse(ProductAlertState.objects.get(product=self.low).low_stock)
+        Product.objects.filter(pk=self.low.pk).update(quantity=1)
+        self.assertEqual(scan_alerts(), ([self.low.pk], [], 0))
+
+    def test_scan_sends_one_digest_and_remembers_it(self):
+        output = self.scan()
+        self.assertIn('New low stock: 1, new near expiry: 1, cleared: 0', output)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('Low stock: Insulin', mail.outbox[0].body)
+        self.assertIn('Near expiry: Vaccine', mail.outbox[0].body)
+        self.scan()
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_dry_run_saves_nothing(self):
+        output = self.scan('--dry-run')
+        self.assertIn('Low stock: Insulin', output)
+        self.assertFalse(ProductAlertState.objects.exists())
+        self.assertFalse(ProductAlert.objects.exists())
+
+    def test_queue_only_leaves_the_digest_in_the_outbox(self):
+        self.scan('--queue-only')
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(ProductAlert.objects.filter(sent_at__isnull=True).count(), 1)
+
+    def test_scan_cost_does_not_grow_with_products(self):
+        def queries():
+            ProductAlertState.objects.all().delete()
+            with CaptureQueriesContext(connection) as ctx:
+                self.scan('--queue-only')
+            return len(ctx)
+        few = queries()
+        Product.objects.bulk_create([Product(name=f'Low {i}', price=1, quantity=0) for i in range(50)])
+        self.assertEqual(queries(), few)
+
+
+class InventoryViewBenchmark(perf.ViewBenchmark):
+    views = {
+        'inventory:product_list': (None, 6),
+        'inventory:product_create': (None, 5),
+        'inventory:product_import': (None, 3),
+        'inventory:barcode_batch': (None, 2),
+        'inventory:product_detail': ('product', 7),
+        'inventory:product_update': ('product', 7),
+        'inventory:product_stock': ('product', 8),
+        'inventory:product_transfer': ('product', 3),
+        'inventory:product_delete': ('product', 4),
+        'inventory:category_list': (None, 4),
+        'inventory:category_create': (None, 3),
+        'inventory:category_update': ('category', 4),
+        'inventory:category_delete': ('category', 4),
+        'inventory:supplier_list': (None, 5),
+        'inventory:supplier_create': (None, 3),
+        'inventory:supplier_detail': ('supplier', 6),
+        'inventory:supplier_update': ('supplier', 4),
+        'inventory:supplier_delete': ('supplier', 4),
+        'inventory:location_list': (None, 4),
+        'inventory:location_create': (None, 3),
+        'inventory:location_update': ('location', 4),
+        'inventory:stock_status': (None, 7),
+    }
@@ -7,8 +7,13 @@ urlpatterns = [
     # products
     path('products/', views.product_list, name='product_list'),
     path('products/add/', views.product_create, name='product_create'),
+    path('products/import/', views.product_import, name='product_import'),
+    path('products/barcode/', views.barcode_batch, name='barcode_batch'),
+    path('products/barcode/<str:code>/', views.barcode_lookup, name='barcode_lookup'),
     path('products/<int:pk>/', views.product_detail, name='product_detail'),
     path('products/<int:pk>/edit/', views.product_update, name='product_update'),
+    path('products/<int:pk>/stock/', views.product_stock, name='product_stock'),
+    path('products/<int:pk>/transfer/', views.product_transfer, name='product_transfer'),
     path('products/<int:pk>/delete/', views.product_delete, name='product_delete'),
 
     # categories
@@ -24,6 +29,11 @@ urlpatterns = [
     path('suppliers/<int:pk>/edit/', views.supplier_update, name='supplier_update'),
     path('suppliers/<int:pk>/delete/', views.supplier_delete, name='supplier_delete'),
 
+    # locations
+    path('locations/', views.location_list, name='location_list'),
+    path('locations/add/', views.location_create, name='location_create'),
+    path('locations/<int:pk>/edit/', views.location_update, name='location_update'),
+
     # stock
     path('stock/status/', views.stock_status, name='stock_status'),
 ]
\ No newline at end of file
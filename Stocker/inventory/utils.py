@@ -1,23 +1,172 @@
+from collections import OrderedDict
 from django.conf import settings
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
 from datetime import date, timedelta
 
-def maybe_send_product_alert(product):
-    """Send email if product is low stock or near expiry."""
-    manager = getattr(settings, "MANAGER_EMAIL", None)
-    if not manager:
-        return
+from .models import Product, ProductAlert, ProductAlertState
+
+NEAR_EXPIRY_DAYS = 30
+ALERT_SUBJECT = "Inventory Alert"
+ALERT_MAX_ATTEMPTS = 5
+ALERT_CLAIM_TIMEOUT = timedelta(minutes=10)  # a crashed worker's claim expires after this
+ALERT_RETRY_DELAY = timedelta(minutes=1)     # after the first failed attempt, doubling after each one
 
+def near_expiry_cutoff():
+    return date.today() + timedelta(days=NEAR_EXPIRY_DAYS)
+
+def location_param(request):
+    """The ?location=<pk> filter of a stock page, or None for all locations."""
+    try:
+        return int(request.GET.get('location', ''))
+    except ValueError:
+        return None
+
+def product_alert_lines(product, low=True, near=True):
+    """Alert lines for a product that is low on stock or near expiry (empty if neither)."""
     msgs = []
-    if product.quantity <= product.reorder_level:
+    if low and product.quantity <= product.reorder_level:
         msgs.append(f"- Low stock: {product.name} (Qty: {product.quantity}, Reorder ≤ {product.reorder_level})")
 
-    if product.expiry_date:
-        soon = date.today() + timedelta(days=30)
-        if product.expiry_date <= soon:
+    if near and product.expiry_date:
+        if product.expiry_date <= near_expiry_cutoff():
             msgs.append(f"- Near expiry: {product.name} (Expiry: {product.expiry_date})")
+    return msgs
+
+def queue_product_alert(product):
+    """Queue an alert email if product has just become low stock or near expiry.
 
+    Nothing is sent on the request path; `manage.py send_alerts` drains the queue.
+    Conditions the manager was already alerted about (ProductAlertState) are skipped.
+    """
+    manager = getattr(settings, "MANAGER_EMAIL", None)
+    if not manager:
+        return None
+
+    low = product.quantity <= product.reorder_level
+    near = bool(product.expiry_date and product.expiry_date <= near_expiry_cutoff())
+    state = ProductAlertState.objects.filter(product=product).first() or ProductAlertState(product=product)
+    msgs = product_alert_lines(product, low=low and not state.low_stock, near=near and not state.near_expiry)
+    if (state.low_stock, state.near_expiry) != (low, near):
+        state.low_stock, state.near_expiry = low, near
+        state.save()
     if msgs:
-        subject = "Inventory Alert"
-        body = "The following items need attention:\n\n" + "\n".join(msgs)
-        send_mail(subject, body, settings.DEFAULT_FROM_EMAIL, [manager], fail_silently=True)
+        return ProductAlert.objects.create(product=product, recipient=manager, lines="\n".join(msgs))
+    return None
+
+def scan_alerts(chunk_size=500):
+    """Set-based scan of every product against the stored alert state.
+
+    Returns (new_low_ids, new_near_ids, cleared_count). Products that left a
+    condition get their flag reset so a later crossing alerts again.
+    """
+    low = set(Product.objects.low_stock().values_list('pk', flat=True))
+    near = set(Product.objects.filter(expiry_date__isnull=False, expiry_date__lte=near_expiry_cutoff())
+               .values_list('pk', flat=True))
+    previous = {
+        pk: (l, n) for pk, l, n in
+        ProductAlertState.objects.filter(Q(low_stock=True) | Q(near_expiry=True))
+        .values_list('product_id', 'low_stock', 'near_expiry')
+    }
+
+    changed = []
+    new_low, new_near, cleared = [], [], 0
+    for pk in low | near | previous.keys():
+        was_low, was_near = previous.get(pk, (False, False))
+        is_low, is_near = pk in low, pk in near
+        if (was_low, was_near) == (is_low, is_near):
+            continue
+        changed.append(ProductAlertState(product_id=pk, low_stock=is_low, near_expiry=is_near))
+        if is_low and not was_low: new_low.append(pk)
+        if is_near and not was_near: new_near.append(pk)
+        if (was_low and not is_low) or (was_near and not is_near): cleared += 1
+
+    ProductAlertState.objects.bulk_create(
+        changed, batch_size=chunk_size, update_conflicts=True,
+        unique_fields=['product'], update_fields=['low_stock', 'near_expiry', 'updated_at'],
+    )
+    return new_low, new_near, cleared
+
+def digest_lines(new_low, new_near, chunk_size=500):
+    new_low, new_near = set(new_low), set(new_near)
+    ids = sorted(new_low | new_near)
+    lines = []
+    for i in range(0, len(ids), chunk_size):
+        for p in Product.objects.filter(pk__in=ids[i:i + chunk_size]).only(
+                'name', 'quantity', 'reorder_level', 'expiry_date'):
+            lines.extend(product_alert_lines(p, low=p.pk in new_low, near=p.pk in new_near))
+    return lines
+
+def alert_body(lines):
+    return "The following items need attention:\n\n" + "\n".join(lines)
+
+def retry_delay(attempts):
+    """Wait before the next try of an alert that has failed `attempts` times."""
+    return ALERT_RETRY_DELAY * 2 ** max(attempts - 1, 0)
+
+def _failed(alerts, error):
+    # one UPDATE per attempt count; `alerts` were loaded before their claim counted an attempt
+    now, by_attempts = timezone.now(), {}
+    for a in alerts:
+        by_attempts.setdefault(a.attempts + 1, []).append(a.pk)
+    for attempts, ids in by_attempts.items():
+        ProductAlert.objects.filter(pk__in=ids).update(
+            claimed_at=None, next_attempt_at=now + retry_delay(attempts), last_error=str(error)[:1000])
+
+def dispatch_alerts(batch_size=100, connection=None):
+    """Send one batch of pending alerts over a single mail connection.
+
+    Alerts for the same recipient are merged into one message; when a product
+    was queued several times only its latest alert is included. Rows are
+    claimed in a short transaction so the SMTP round trips hold no locks.
+    A failed alert is retried after retry_delay(attempts), doubling each time,
+    until ALERT_MAX_ATTEMPTS. Returns (alerts_handled, messages_sent, failures).
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        pending = list(
+            ProductAlert.objects
+            .select_for_update(skip_locked=True)
+            .filter(sent_at__isnull=True, attempts__lt=ALERT_MAX_ATTEMPTS)
+            .filter(Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now))
+            .order_by('id')[:batch_size]
+        )
+        ProductAlert.objects.filter(pk__in=[a.pk for a in pending]).update(
+            claimed_at=now, next_attempt_at=now + ALERT_CLAIM_TIMEOUT, attempts=F('attempts') + 1)
+    if not pending:
+        return 0, 0, 0
+
+    by_recipient = OrderedDict()
+    for alert in pending:
+        alerts, latest = by_recipient.setdefault(alert.recipient, ([], OrderedDict()))
+        alerts.append(alert)
+        key = alert.product_id or f"alert-{alert.pk}"
+        latest.pop(key, None)
+        latest[key] = alert
+
+    connection = connection or get_connection()
+    sent = failed = 0
+    try:
+        connection.open()
+    except Exception as e:
+        _failed(pending, e)
+        raise
+    try:
+        for recipient, (alerts, latest) in by_recipient.items():
+            lines = [line for a in latest.values() for line in a.lines.splitlines()]
+            msg = EmailMessage(ALERT_SUBJECT, alert_body(lines), settings.DEFAULT_FROM_EMAIL,
+                               [recipient], connection=connection)
+            try:
+                msg.send()
+            except Exception as e:
+                failed += 1
+                _failed(alerts, e)
+            else:
+                sent += 1
+                ProductAlert.objects.filter(pk__in=[a.pk for a in alerts]).update(
+                    sent_at=timezone.now(), next_attempt_at=None, last_error='')
+    finally:
+        connection.close()
+    return len(pending), sent, failed
@@ -1,32 +1,54 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.db.models import Q, F
+from django.conf import settings
+from django.db.models import Q, F, Count, Sum
+from django.db.models.functions import Coalesce
 from django.core.paginator import Paginator
-from datetime import date, timedelta
+from django.http import JsonResponse
+import io
 
-from .models import Product, Category, Supplier
-from .forms import ProductForm, CategoryForm, SupplierForm
-from .utils import maybe_send_product_alert
+from .models import (Product, Category, Supplier, Location, LocationStock, StockLot, StockMovement,
+                     ReorderSuggestion)
+from .forms import (ProductForm, CategoryForm, SupplierForm, LocationForm, ProductImportForm, StockMovementForm,
+                    StockTransferForm)
+from .importer import ProductImporter
+from .stock import apply_movement, transfer_stock, record_opening_stock, InsufficientStock
+from .utils import queue_product_alert, near_expiry_cutoff, location_param
+from .pagination import KeysetPaginator
+from . import search, barcodes
+from .versioning import conditional_page
 
 is_staff = user_passes_test(lambda u: u.is_staff)
 
+def paginate(request, qs, per_page, ordering=('name', 'pk')):
+    """Offset pages (?page=N) or keyset pages (?cursor=...) depending on settings."""
+    if getattr(settings, 'INVENTORY_PAGINATION', 'offset') == 'keyset':
+        with_total = getattr(settings, 'INVENTORY_PAGINATION_APPROX_TOTAL', False)
+        return KeysetPaginator(qs, per_page, ordering).get_page(request.GET.get('cursor'), with_total=with_total)
+    return Paginator(qs, per_page).get_page(request.GET.get('page'))
+
 # ----- Products -----
 @login_required
+@conditional_page('product_list')
 def product_list(request):
     q = request.GET.get('q', '').strip()
-    qs = Product.objects.all()
-    if q:
-        qs = qs.filter(
-            Q(name__icontains=q) |
-            Q(category__name__icontains=q) |
-            Q(suppliers__name__icontains=q)
-        ).distinct()
-    paginator = Paginator(qs, 10)
-    page_obj = paginator.get_page(request.GET.get('page'))
+    qs = Product.objects.select_related('category')
+    if q and search.is_available():
+        # ranking scores every match anyway, so search results page by offset in the FTS table
+        page_obj = Paginator(search.search_products(qs, q), 10).get_page(request.GET.get('page'))
+    else:
+        if q:
+            qs = qs.filter(
+                Q(name__icontains=q) |
+                Q(category__name__icontains=q) |
+                Q(suppliers__name__icontains=q)
+            ).distinct()
+        page_obj = paginate(request, qs, 10)
     return render(request, 'inventory/products/list.html', {'page_obj': page_obj, 'q': q})
 
 @login_required
+@conditional_page('product_detail')
 def product_detail(request, pk):
     p = get_object_or_404(Product, pk=pk)
     return render(request, 'inventory/products/detail.html', {'product': p})
@@ -37,7 +59,8 @@ def product_create(request):
         form = ProductForm(request.POST, request.FILES)
         if form.is_valid():
             p = form.save()
-            maybe_send_product_alert(p)
+            record_opening_stock(p, request.user)
+            queue_product_alert(p)
             messages.success(request, 'Product added.')
             return redirect('inventory:product_list')
     else:
@@ -50,14 +73,72 @@ def product_update(request, pk):
     if request.method == 'POST':
         form = ProductForm(request.POST, request.FILES, instance=p)
         if form.is_valid():
-            p = form.save()
-            maybe_send_product_alert(p)
+            # quantity is left to concurrent stock movements
+            p = form.save(commit=False)
+            p.save(update_fields=[f for f in form.fields if f != 'suppliers'] + ['updated_at'])
+            form.save_m2m()
+            queue_product_alert(p)
             messages.success(request, 'Product updated.')
             return redirect('inventory:product_detail', pk=p.pk)
     else:
         form = ProductForm(instance=p)
     return render(request, 'inventory/products/form.html', {'form': form, 'title': 'Edit Product'})
 
+def _held(product, location_id):
+    return LocationStock.objects.filter(product=product, location_id=location_id).values_list(
+        'quantity', flat=True).first() or 0
+
+def _stock_page(request, p, locations, form=None, transfer_form=None):
+    lots = StockLot.objects.filter(product=p, quantity__gt=0).select_related('location')
+    by_location = (LocationStock.objects.filter(product=p, quantity__gt=0).select_related('location')
+                   .order_by('location__name'))
+    movements = StockMovement.objects.filter(product=p).select_related('user', 'lot', 'location')[:20]
+    return render(request, 'inventory/products/stock.html', {
+        'product': p, 'lots': lots, 'by_location': by_location, 'movements': movements,
+        'form': form or StockMovementForm(locations=locations),
+        'transfer_form': transfer_form or (StockTransferForm(locations=locations) if len(locations) > 1 else None),
+    })
+
+@login_required
+def product_stock(request, pk):
+    p = get_object_or_404(Product, pk=pk)
+    locations = list(Location.objects.all())
+    if request.method != 'POST':
+        return _stock_page(request, p, locations)
+    form = StockMovementForm(request.POST, locations=locations)
+    if form.is_valid():
+        d = form.cleaned_data
+        try:
+            rows = apply_movement(p.pk, d['kind'], d['quantity'], user=request.user, note=d['note'],
+                                  batch_no=d['batch_no'], expiry_date=d['expiry_date'], location_id=d['location'])
+        except InsufficientStock:
+            form.add_error('quantity', f"Only {_held(p, d['location'])} in stock at this location.")
+        else:
+            p.refresh_from_db()
+            queue_product_alert(p)
+            messages.success(request, f'{rows[0].get_kind_display()} recorded ({sum(r.delta for r in rows):+d}).')
+            return redirect('inventory:product_stock', pk=p.pk)
+    return _stock_page(request, p, locations, form=form)
+
+@login_required
+def product_transfer(request, pk):
+    p = get_object_or_404(Product, pk=pk)
+    if request.method != 'POST':
+        return redirect('inventory:product_stock', pk=p.pk)
+    locations = list(Location.objects.all())
+    form = StockTransferForm(request.POST, locations=locations)
+    if form.is_valid():
+        d = form.cleaned_data
+        try:
+            transfer_stock({p.pk: d['quantity']}, d['source'], d['destination'], user=request.user, note=d['note'])
+        except InsufficientStock:
+            form.add_error('quantity', f"Only {_held(p, d['source'])} in stock at the source location.")
+        else:
+            names = {l.pk: l.name for l in locations}
+            messages.success(request, f"Moved {d['quantity']} from {names[d['source']]} to {names[d['destination']]}.")
+            return redirect('inventory:product_stock', pk=p.pk)
+    return _stock_page(request, p, locations, transfer_form=form)
+
 @login_required
 @is_staff
 def product_delete(request, pk):
@@ -68,6 +149,46 @@ def product_delete(request, pk):
         return redirect('inventory:product_list')
     return render(request, 'inventory/products/confirm_delete.html', {'product': p})
 
+@login_required
+@is_staff
+def product_import(request):
+    reports = None
+    if request.method == 'POST':
+        form = ProductImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            stream = io.TextIOWrapper(form.cleaned_data['file'].file, encoding='utf-8-sig', newline='')
+            try:
+                reports = list(ProductImporter().run(stream))
+            except UnicodeDecodeError:
+                form.add_error('file', 'The file must be UTF-8 encoded CSV.')
+            else:
+                created = sum(r.created for r in reports)
+                updated = sum(r.updated for r in reports)
+                errors = sum(len(r.errors) for r in reports)
+                level = messages.warning if errors else messages.success
+                level(request, f'Import finished: {created} created, {updated} updated, {errors} errors.')
+    else:
+        form = ProductImportForm()
+    return render(request, 'inventory/products/import.html', {'form': form, 'reports': reports})
+
+# ----- Barcode scans (JSON) -----
+@login_required
+def barcode_lookup(request, code):
+    product = barcodes.lookup([code]).get(code)
+    if product is None:
+        return JsonResponse({'error': 'Unknown barcode.', 'barcode': code}, status=404)
+    return JsonResponse(product)
+
+@login_required
+def barcode_batch(request):
+    """?code=A&code=B or ?codes=A,B -> {"results": {barcode: product or null}}."""
+    codes = request.GET.getlist('code') + [c for c in request.GET.get('codes', '').split(',')]
+    codes = list(dict.fromkeys(c.strip() for c in codes if c.strip()))
+    if len(codes) > barcodes.MAX_BATCH:
+        return JsonResponse({'error': f'At most {barcodes.MAX_BATCH} barcodes per request.'}, status=400)
+    found = barcodes.lookup(codes)
+    return JsonResponse({'results': {c: found.get(c) for c in codes}})
+
 # ----- Categories (staff for write) -----
 @login_required
 def category_list(request):
@@ -118,10 +239,11 @@ def supplier_list(request):
     qs = Supplier.objects.all().order_by('name')
     if q:
         qs = qs.filter(Q(name__icontains=q) | Q(email__icontains=q) | Q(phone__icontains=q))
-    page_obj = Paginator(qs, 12).get_page(request.GET.get('page'))
-    return render(request, 'inventory/suppliers/list.html', {'suppliers': page_obj, 'q': q})
+    page_obj = paginate(request, qs, 12)
+    return render(request, 'inventory/suppliers/list.html', {'suppliers': page_obj, 'page_obj': page_obj, 'q': q})
 
 @login_required
+@conditional_page('supplier_detail')
 def supplier_detail(request, pk):
     s = get_object_or_404(Supplier, pk=pk)
     products = Product.objects.filter(suppliers=s)
@@ -164,13 +286,64 @@ def supplier_delete(request, pk):
         return redirect('inventory:supplier_list')
     return render(request, 'inventory/suppliers/confirm_delete.html', {'supplier': s})
 
+# ----- Locations (staff for write) -----
+@login_required
+def location_list(request):
+    locations = Location.objects.annotate(
+        products_count=Count('stock', filter=Q(stock__quantity__gt=0)),
+        units=Coalesce(Sum('stock__quantity'), 0),
+    ).order_by('name')
+    return render(request, 'inventory/locations/list.html', {'locations': locations})
+
+@login_required
+@is_staff
+def location_create(request):
+    if request.method == 'POST':
+        form = LocationForm(request.POST)
+        if form.is_valid():
+            form.save()
+            messages.success(request, 'Location added.')
+            return redirect('inventory:location_list')
+    else:
+        form = LocationForm()
+    return render(request, 'inventory/locations/form.html', {'form': form, 'title': 'Add Location'})
+
+@login_required
+@is_staff
+def location_update(request, pk):
+    l = get_object_or_404(Location, pk=pk)
+    if request.method == 'POST':
+        form = LocationForm(request.POST, instance=l)
+        if form.is_valid():
+            form.save()
+            messages.success(request, 'Location updated.')
+            return redirect('inventory:location_list')
+    else:
+        form = LocationForm(instance=l)
+    return render(request, 'inventory/locations/form.html', {'form': form, 'title': 'Edit Location'})
+
 # ----- Stock status -----
+REORDER_LIST_SIZE = 50
+
 @login_required
 def stock_status(request):
-    low_stock = Product.objects.filter(quantity__lte=F('reorder_level'))
-    soon = date.today() + timedelta(days=30)
-    near_expiry = Product.objects.filter(expiry_date__isnull=False, expiry_date__lte=soon)
+    location = location_param(request)
+    urgency = [F('reorder__days_of_cover').asc(nulls_last=True), 'name', 'pk']
+    if location is None:
+        low_stock = Product.objects.low_stock().annotate(on_hand=F('quantity'))
+    else:
+        # at or below the reorder level at that location (locationstock_location_product)
+        low_stock = Product.objects.filter(location_stock__location=location,
+                                           location_stock__quantity__lte=F('reorder_level')
+                                           ).annotate(on_hand=F('location_stock__quantity'))
+    low_stock = low_stock.select_related('reorder').order_by(*urgency)
+    reorder = (ReorderSuggestion.objects.filter(suggested_quantity__gt=0).select_related('product')
+               .order_by(F('days_of_cover').asc(nulls_last=True), 'product_id')[:REORDER_LIST_SIZE])
+    near_expiry = StockLot.objects.near_expiry(near_expiry_cutoff(), location)
     return render(request, 'inventory/stock/status.html', {
+        'locations': Location.objects.all(),
+        'location': location,
         'low_stock': low_stock,
+        'reorder': reorder,
         'near_expiry': near_expiry,
     })
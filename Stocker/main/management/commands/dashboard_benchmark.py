@@ -0,0 +1,151 @@
+import asyncio
+import io
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from reports import kpis
+
+# name -> (handler, run the page's queries concurrently)
+MODES = {
+    'wsgi-serial': ('wsgi', False),  # WSGI, ASYNC_QUERY_WORKERS=0: queries one after another
+    'wsgi': ('wsgi', True),          # WSGI, queries overlapped on the worker pool
+    'asgi': ('asgi', True),          # ASGI handler, per-request thread-sensitive contexts
+}
+PAGES = ['main:dashboard', 'reports:inventory_report']
+
+
+class Command(BaseCommand):
+    help = ("Compare the async dashboard / report pages served through Django's WSGI and ASGI handlers "
+            "(in process, no network) under --users concurrent users. Page caches are dropped before "
+            "every request unless --warm.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', default=','.join(MODES), help=f"Comma separated: {', '.join(MODES)}")
+        parser.add_argument('--pages', default=','.join(PAGES), help="Comma separated URL names")
+        parser.add_argument('--users', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=10, help="Requests per user and page")
+        parser.add_argument('--username', help="User to log in as (default: the first staff user)")
+        parser.add_argument('--warm', action='store_true', help="Keep the KPI / dashboard caches")
+
+    def handle(self, *args, **options):
+        modes = [m.strip() for m in options['modes'].split(',') if m.strip()]
+        unknown = set(modes) - set(MODES)
+        if unknown:
+            raise CommandError(f"Unknown mode(s): {', '.join(sorted(unknown))}")
+        users = get_user_model().objects.order_by('pk')
+        user = (users.filter(username=options['username']) if options['username']
+                else users.filter(is_staff=True)).first()
+        if user is None:
+            raise CommandError("No such user; pass --username or create a staff user.")
+        client = Client()
+        client.force_login(user)
+        self.cookie = f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+        self.host = next((h for h in settings.ALLOWED_HOSTS if '*' not in h), 'localhost')
+        self.warm = options['warm']
+
+        self.stdout.write(f"{'page':<28}{'mode':<13}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'errors':>8}")
+        for name in [p.strip() for p in options['pages'].split(',') if p.strip()]:
+            path = reverse(name)
+            for mode in modes:
+                handler, concurrent = MODES[mode]
+                workers = settings.ASYNC_QUERY_WORKERS if concurrent else 0
+                with override_settings(ASYNC_QUERY_WORKERS=workers):
+                    run = self.run_wsgi if handler == 'wsgi' else self.run_asgi
+                    row = self.summarize(*run(path, options['users'], options['requests']))
+                self.stdout.write(f"{name:<28}{mode:<13}{row['rps']:>8.1f}{row['p50']:>9.1f}"
+                                  f"{row['p95']:>9.1f}{row['errors']:>8}")
+
+    def before_request(self):
+        if not self.warm:
+            kpis.invalidate()
+
+    def run_wsgi(self, path, users, requests):
+        application = get_wsgi_application()
+        latencies, errors = [], []
+        lock = threading.Lock()
+
+        def user_loop():
+            for _ in range(requests):
+                environ = {'PATH_INFO': path, 'HTTP_COOKIE': self.cookie, 'HTTP_HOST': self.host,
+                           'wsgi.errors': io.StringIO()}
+                setup_testing_defaults(environ)
+                statuses = []
+                self.before_request()
+                started = time.perf_counter()
+                body = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+                b''.join(body)
+                elapsed = (time.perf_counter() - started) * 1000
+                with lock:
+                    latencies.append(elapsed)
+                    if not statuses[0].startswith('200'):
+                        errors.append(statuses[0])
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=users) as pool:
+            for future in [pool.submit(user_loop) for _ in range(users)]:
+                future.result()
+        return latencies, errors, time.perf_counter() - started
+
+    def run_asgi(self, path, users, requests):
+        application = get_asgi_application()
+        latencies, errors = [], []
+
+        async def request():
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+                'root_path': '', 'server': (self.host, 80), 'client': ('127.0.0.1', 0),
+                'headers': [(b'host', self.host.encode()), (b'cookie', self.cookie.encode())],
+            }
+            sent, body_read, done = [], [], asyncio.Event()
+
+            async def receive():
+                if not body_read:
+                    body_read.append(True)
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await done.wait()  # the client stays connected until the response is complete
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                sent.append(message)
+                if message['type'] == 'http.response.body' and not message.get('more_body'):
+                    done.set()
+
+            await application(scope, receive, send)
+            status = next(m['status'] for m in sent if m['type'] == 'http.response.start')
+            if status != 200:
+                errors.append(str(status))
+
+        async def user_loop():
+            for _ in range(requests):
+                self.before_request()
+                started = time.perf_counter()
+                await request()
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        async def main():
+            await asyncio.gather(*(user_loop() for _ in range(users)))
+
+        started = time.perf_counter()
+        asyncio.run(main())
+        return latencies, errors, time.perf_counter() - started
+
+    def summarize(self, latencies, errors, seconds):
+        latencies = sorted(latencies)
+        return {
+            'rps': len(latencies) / seconds if seconds else 0,
+            'p50': statistics.median(latencies) if latencies else 0,
+            'p95': latencies[int(len(latencies) * 0.95)] if latencies else 0,
+            'errors': len(errors),
+        }
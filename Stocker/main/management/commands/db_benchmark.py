@@ -0,0 +1,125 @@
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, OperationalError
+
+from inventory.models import Product, StockLot
+from inventory.stock import apply_movement, InsufficientStock
+from Stocker.db import sqlite_options
+
+# name -> (tuned pragmas, CONN_MAX_AGE)
+MODES = {
+    'default': (False, 0),        # rollback journal, DEFERRED, a new connection per request
+    'wal': (True, 0),             # WAL + synchronous=NORMAL + IMMEDIATE, new connection per request
+    'wal-persistent': (True, 60), # as above with persistent connections
+}
+
+
+def _worker(path, tuned, max_age, seconds, write_share, product_ids, seed, results):
+    db = connection.settings_dict
+    db.update(NAME=path, OPTIONS=sqlite_options(tuned), CONN_MAX_AGE=max_age)
+    rng = random.Random(seed)
+    reads = writes = short = locked = 0
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pk = rng.choice(product_ids)
+        started = time.perf_counter()
+        try:
+            if rng.random() < write_share:
+                kind = 'receipt' if rng.random() < 0.5 else 'dispense'
+                try:
+                    apply_movement(pk, kind, rng.randint(1, 3))
+                    writes += 1
+                except InsufficientStock:
+                    short += 1  # rolled back, nothing written
+            else:
+                Product.objects.select_related('category').get(pk=pk)
+                list(StockLot.objects.filter(product_id=pk, quantity__gt=0))
+                reads += 1
+        except OperationalError:
+            locked += 1
+        latencies.append((time.perf_counter() - started) * 1000)
+        if not max_age:
+            connection.close()  # what request_finished does with CONN_MAX_AGE=0
+    connection.close()
+    results.put((reads, writes, short, locked, latencies))
+
+
+class Command(BaseCommand):
+    help = ("Compare SQLite configurations under concurrent readers/writers: each worker process runs "
+            "product reads and stock movements against a copy of the database for --seconds.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', default=','.join(MODES), help=f"Comma separated: {', '.join(MODES)}")
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--write-share', type=float, default=0.2, help="Share of operations that write")
+
+    def handle(self, *args, **options):
+        db = connections['default'].settings_dict
+        if db['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError("db_benchmark compares SQLite modes; the default database is not SQLite.")
+        modes = [m.strip() for m in options['modes'].split(',') if m.strip()]
+        unknown = set(modes) - set(MODES)
+        if unknown:
+            raise CommandError(f"Unknown mode(s): {', '.join(sorted(unknown))}")
+        product_ids = list(Product.objects.filter(quantity__gt=0).values_list('pk', flat=True)[:2000])
+        if not product_ids:
+            raise CommandError("No stocked products; run seed_demo_data --products N first.")
+
+        workdir = tempfile.mkdtemp(prefix='stocker-bench-')
+        try:
+            self.stdout.write(f"{'mode':<16}{'ops/s':>10}{'writes/s':>10}{'short':>8}{'locked':>8}"
+                              f"{'p50 ms':>9}{'p95 ms':>9}")
+            for mode in modes:
+                path = os.path.join(workdir, f'{mode}.sqlite3')
+                self.copy_database(str(db['NAME']), path)
+                tuned, max_age = MODES[mode]
+                row = self.run_mode(path, tuned, max_age, options, product_ids)
+                self.stdout.write(f"{mode:<16}{row['ops']:>10.0f}{row['writes']:>10.0f}{row['short']:>8}"
+                                  f"{row['locked']:>8}{row['p50']:>9.1f}{row['p95']:>9.1f}")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def copy_database(self, source, target):
+        # backup API: a consistent copy even while the source is in use; copies start in rollback-journal mode
+        with sqlite3.connect(source) as src, sqlite3.connect(target) as dst:
+            src.backup(dst)
+            dst.execute("PRAGMA journal_mode=DELETE")
+
+    def run_mode(self, path, tuned, max_age, options, product_ids):
+        connections.close_all()  # never share a connection with forked workers
+        ctx = multiprocessing.get_context('fork')
+        results = ctx.Queue()
+        procs = [
+            ctx.Process(target=_worker, args=(path, tuned, max_age, options['seconds'], options['write_share'],
+                                              product_ids, seed, results))
+            for seed in range(options['workers'])
+        ]
+        for p in procs:
+            p.start()
+        collected = [results.get() for _ in procs]
+        for p in procs:
+            p.join()
+        reads = sum(r[0] for r in collected)
+        writes = sum(r[1] for r in collected)
+        short = sum(r[2] for r in collected)
+        latencies = sorted(ms for r in collected for ms in r[4])
+        seconds = options['seconds']
+        return {
+            'ops': (reads + writes + short) / seconds,
+            'writes': writes / seconds,   # completed; attempts refused for lack of stock are 'short'
+            'short': short,
+            'locked': sum(r[3] for r in collected),
+            'p50': statistics.median(latencies) if latencies else 0,
+            'p95': latencies[int(len(latencies) * 0.95)] if latencies else 0,
+        }
@@ -0,0 +1,34 @@
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from main import thumbnails
+
+class Command(BaseCommand):
+    help = ("Render missing or outdated WebP/JPEG thumbnails for supplier logos and profile avatars "
+            "(backfill; uploads are handled in the background)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Re-render images whose variants are current")
+
+    def handle(self, *args, **options):
+        rendered = {}  # source name -> variants, shared by rows with the same image
+        started = time.perf_counter()
+        for label, (field, store, _) in thumbnails.SOURCES.items():
+            model = apps.get_model(label)
+            done = skipped = failed = 0
+            rows = model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+            for instance in rows.only('pk', field, store).order_by('pk').iterator():
+                if not options['force'] and thumbnails.is_current(instance):
+                    skipped += 1
+                    continue
+                try:
+                    done += thumbnails.generate(instance, rendered, reuse=not options['force'])
+                except (OSError, ValueError) as exc:  # missing or unreadable file
+                    failed += 1
+                    self.stderr.write(f"{label} {instance.pk}: {getattr(instance, field).name}: {exc}")
+            self.stdout.write(f"{label}: {done} rendered, {skipped} current, {failed} failed")
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Thumbnails done: {len(rendered)} distinct images in {elapsed:.1f} s."))
@@ -0,0 +1,379 @@
+"""Per-request SQL / timing instrumentation (enabled by settings.REQUEST_METRICS).
+
+For every request the middleware records the number of SQL queries, DB time,
+template render time (through the TimedDjangoTemplates backend configured in
+settings.TEMPLATES) and total view time, sends them as a `Server-Timing`
+header, logs slow requests and statements repeated often enough to look like
+an N+1, and keeps running aggregates per view name (see `snapshot()`).
+
+StaticAssetMiddleware serves collected static files with long-lived caching.
+"""
+import json
+import logging
+import mimetypes
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import ExitStack
+from contextvars import ContextVar
+from urllib.parse import urlparse
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.db import connections
+from django.http import FileResponse
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template as DjangoTemplate
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .storage import encodings
+
+logger = logging.getLogger('stocker.requests')
+
+_current = ContextVar('request_metrics', default=None)
+_lock = threading.Lock()
+_aggregates = {}
+
+
+class RequestStats:
+    def __init__(self):
+        self.lock = threading.Lock()  # queries may run on worker threads (reports.aio)
+        self.queries = 0
+        self.db_ms = 0.0
+        self.template_ms = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            with self.lock:
+                self.db_ms += elapsed
+                self.queries += 1
+                self.statements[sql] += 1
+
+
+class TimedTemplate(DjangoTemplate):
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None:
+            return super().render(context, request)
+        started, db_before = time.perf_counter(), stats.db_ms
+        try:
+            return super().render(context, request)
+        finally:
+            # queries run lazily from the template count as DB time only
+            stats.template_ms += (time.perf_counter() - started) * 1000 - (stats.db_ms - db_before)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The DjangoTemplates backend, with render time reported to RequestMetricsMiddleware
+    (settings.TEMPLATES)."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            # re-raised as coming from this backend, keeping the debug page's template info
+            new = TemplateDoesNotExist(*exc.args, tried=exc.tried, backend=self, chain=exc.chain)
+            if hasattr(exc, 'template_debug'):
+                new.template_debug = exc.template_debug
+            raise new from exc
+
+
+def _record(view, total_ms, stats, repeated):
+    with _lock:
+        agg = _aggregates.setdefault(view, {
+            'requests': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'db_ms': 0.0,
+            'template_ms': 0.0, 'queries': 0, 'max_queries': 0, 'n_plus_one': 0, 'slow': 0,
+        })
+        agg['requests'] += 1
+        agg['total_ms'] += total_ms
+        agg['max_ms'] = max(agg['max_ms'], total_ms)
+        agg['db_ms'] += stats.db_ms
+        agg['template_ms'] += stats.template_ms
+        agg['queries'] += stats.queries
+        agg['max_queries'] = max(agg['max_queries'], stats.queries)
+        agg['n_plus_one'] += bool(repeated)
+        agg['slow'] += total_ms >= settings.REQUEST_METRICS_SLOW_MS
+
+
+def track_queries():
+    """Context manager counting the current thread's queries towards the request being measured.
+
+    For work the request hands to other threads; a no-op outside a measured request.
+    """
+    stack = ExitStack()
+    stats = _current.get()
+    if stats is not None:
+        for conn in connections.all():
+            stack.enter_context(conn.execute_wrapper(stats))
+    return stack
+
+
+def is_enabled():
+    return getattr(settings, 'REQUEST_METRICS', False)
+
+
+def snapshot(reset=False):
+    """Per-view aggregates with averages, for the staff metrics endpoint."""
+    with _lock:
+        data = {}
+        for view, agg in sorted(_aggregates.items()):
+            n = agg['requests']
+            data[view] = {k: round(v, 2) if isinstance(v, float) else v for k, v in agg.items()}
+            data[view].update(avg_ms=round(agg['total_ms'] / n, 2), avg_db_ms=round(agg['db_ms'] / n, 2),
+                              avg_queries=round(agg['queries'] / n, 2))
+        if reset:
+            _aggregates.clear()
+    return data
+
+
+class RequestMetricsMiddleware:
+    """Measures each request. A streaming body's queries are counted while it is
+    sent: its Server-Timing header covers the view only, the aggregates and logs
+    the whole response.
+
+    Async-capable, so async views keep running on the event loop. There the
+    wrappers go on the connections of the request's thread-sensitive thread,
+    where its ORM calls run (sync_to_async, the async ORM)."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not is_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            with track_queries():
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.measure_response(request, response, stats, started)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            queries = await sync_to_async(track_queries)()
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(queries.close)()
+        finally:
+            _current.reset(token)
+        return self.measure_response(request, response, stats, started)
+
+    def measure_response(self, request, response, stats, started):
+        response['Server-Timing'] = self.server_timing(stats, (time.perf_counter() - started) * 1000)
+        if getattr(response, 'streaming', False):
+            measured = self.ameasured if response.is_async else self.measured
+            response.streaming_content = measured(response.streaming_content, stats,
+                                                  lambda: self.finish(request, stats, started))
+        else:
+            self.finish(request, stats, started)
+        return response
+
+    @staticmethod
+    def measured(content, stats, finish):
+        """Iterate `content` counting its queries towards `stats`; `finish` once it is done."""
+        iterator = iter(content)
+        try:
+            while True:
+                token = _current.set(stats)
+                try:
+                    with track_queries():
+                        chunk = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    _current.reset(token)
+                yield chunk
+        finally:
+            finish()
+
+    @staticmethod
+    async def ameasured(content, stats, finish):
+        """`measured` for async content: its queries run wherever it sends them, so only
+        those made through track_queries (reports.aio) are counted."""
+        iterator = aiter(content)
+        try:
+            while True:
+                token = _current.set(stats)
+                try:
+                    chunk = await anext(iterator)
+                except StopAsyncIteration:
+                    return
+                finally:
+                    _current.reset(token)
+                yield chunk
+        finally:
+            finish()
+
+    @staticmethod
+    def server_timing(stats, total_ms):
+        app_ms = max(total_ms - stats.db_ms - stats.template_ms, 0)
+        return ', '.join([
+            f'db;dur={stats.db_ms:.1f};desc="{stats.queries} queries"',
+            f'tpl;dur={stats.template_ms:.1f}',
+            f'app;dur={app_ms:.1f}',
+            f'total;dur={total_ms:.1f}',
+        ])
+
+    @staticmethod
+    def finish(request, stats, started):
+        total_ms = (time.perf_counter() - started) * 1000
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else request.path
+        repeated = {sql: n for sql, n in stats.statements.items()
+                    if n >= settings.REQUEST_METRICS_N_PLUS_ONE}
+        _record(view, total_ms, stats, repeated)
+        if total_ms >= settings.REQUEST_METRICS_SLOW_MS:
+            logger.warning("Slow request %s %s (%s): %.0f ms, %d queries, db %.0f ms, templates %.0f ms",
+                           request.method, request.path, view, total_ms, stats.queries,
+                           stats.db_ms, stats.template_ms)
+        for sql, n in repeated.items():
+            logger.warning("Possible N+1 in %s: %d x %s", view, n, sql[:300])
+
+
+class StaticAssetMiddleware:
+    """Serve collected static files from STATIC_ROOT (enabled by settings.STATIC_SERVE).
+
+    Manifest-hashed names never change, so they get a year-long immutable
+    Cache-Control; other names are revalidated after STATIC_MAX_AGE seconds.
+    The pre-compressed variant written by collectstatic (main.storage) is sent
+    when the client accepts its encoding.
+
+    File stats are cached for at most RECHECK_SECONDS, in an LRU of MAX_ASSETS
+    names. A changed manifest (collectstatic ran) reloads the hashed names and
+    drops the whole cache.
+    """
+    IMMUTABLE = 'public, max-age=31536000, immutable'
+    RECHECK_SECONDS = 2.0
+    MAX_ASSETS = 1024
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'STATIC_SERVE', False) or not settings.STATIC_ROOT:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prefix = urlparse(settings.STATIC_URL).path
+        self.root = str(settings.STATIC_ROOT)
+        self.manifest = os.path.join(self.root, 'staticfiles.json')
+        self.lock = threading.Lock()
+        self.assets = OrderedDict()  # name -> (checked at, (path, size, mtime, {encoding: (path, size)}))
+        self.hashed = set()
+        self.manifest_version = None
+        self.manifest_checked = float('-inf')
+
+    def load_hashed_names(self):
+        try:
+            with open(self.manifest) as f:
+                return set(json.load(f).get('paths', {}).values())
+        except (OSError, ValueError):
+            return set()
+
+    def hashed_names(self):
+        now = time.monotonic()
+        if now - self.manifest_checked >= self.RECHECK_SECONDS:
+            self.manifest_checked = now
+            try:
+                st = os.stat(self.manifest)
+                version = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                version = None
+            if version != self.manifest_version:
+                hashed = self.load_hashed_names()
+                with self.lock:
+                    self.manifest_version, self.hashed = version, hashed
+                    self.assets.clear()
+        return self.hashed
+
+    def stat(self, name):
+        try:
+            path = safe_join(self.root, name)
+            st = os.stat(path)
+        except (SuspiciousFileOperation, OSError, ValueError):
+            return None
+        if not os.path.isfile(path):
+            return None
+        variants = {}
+        for suffix, encoding in encodings():
+            if os.path.isfile(path + suffix):
+                variants[encoding] = (path + suffix, os.path.getsize(path + suffix))
+        return path, st.st_size, st.st_mtime, variants
+
+    def find(self, name):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.assets.get(name)
+            if entry is not None and now - entry[0] < self.RECHECK_SECONDS:
+                self.assets.move_to_end(name)
+                return entry[1]
+        asset = self.stat(name)
+        with self.lock:
+            if asset is None:
+                self.assets.pop(name, None)
+            else:
+                self.assets[name] = (now, asset)
+                self.assets.move_to_end(name)
+                while len(self.assets) > self.MAX_ASSETS:
+                    self.assets.popitem(last=False)
+        return asset
+
+    @staticmethod
+    def accepted(request):
+        accepted = set()
+        for part in request.headers.get('Accept-Encoding', '').split(','):
+            coding, _, params = part.strip().partition(';')
+            if params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+                accepted.add(coding.strip().lower())
+        return accepted
+
+    def __call__(self, request):
+        if request.method not in ('GET', 'HEAD') or not request.path_info.startswith(self.prefix):
+            return self.get_response(request)
+        name = request.path_info[len(self.prefix):]
+        hashed = self.hashed_names()
+        asset = self.find(name)
+        if asset is None:
+            return self.get_response(request)
+        path, size, mtime, variants = asset
+        accepted = self.accepted(request)
+        encoding = next((e for _, e in encodings() if e in variants and e in accepted), None)
+        etag = f'"{int(mtime)}-{size}-{encoding or "identity"}"'
+        response = get_conditional_response(request, etag=etag, last_modified=int(mtime))
+        if response is None:
+            content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            if content_type.startswith('text/') or content_type in ('application/javascript', 'image/svg+xml'):
+                content_type += '; charset=utf-8'
+            response = FileResponse(open(variants[encoding][0] if encoding else path, 'rb'),
+                                    content_type=content_type)
+            response.headers.pop('Content-Disposition', None)
+            if encoding:
+                response['Content-Encoding'] = encoding
+            response['Last-Modified'] = http_date(mtime)
+        response['ETag'] = etag
+        response['Cache-Control'] = (self.IMMUTABLE if name in hashed
+                                     else f'public, max-age={settings.STATIC_MAX_AGE}')
+        if variants:
+            response['Vary'] = 'Accept-Encoding'
+        return response
@@ -0,0 +1,136 @@
+"""View benchmark harness shared by the apps' tests.py.
+
+A `ViewBenchmark` subclass declares the URL names it covers and a SQL query
+budget for each. The test seeds catalogues of every size in PERF_SIZES
+(via `seed_demo_data --products`), requests each view cold (empty cache) and
+warm, and fails when a view:
+
+* runs more queries than its budget,
+* runs more queries on the largest dataset than on the smallest (N+1),
+* runs more queries than the stored baseline.
+
+Query counts are deterministic, so those checks always run. Latency is the
+best of PERF_REPEAT warm requests; it is recorded every time but compared
+with the baseline (within PERF_TOLERANCE) only when PERF_CHECK_LATENCY=1,
+since wall-clock times depend on the machine and its load.
+
+Results are merged into PERF_RESULTS (JSON, in the temp directory by
+default). Set PERF_UPDATE_BASELINE=1 to write the current numbers to
+PERF_BASELINE instead of checking against it; the stored latencies are
+compared with PERF_TOLERANCE (a fraction) plus a few ms of slack.
+"""
+import io
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from inventory.models import Product, Category, Supplier, Location
+
+SIZES = sorted(int(s) for s in os.environ.get('PERF_SIZES', '20,200').split(','))
+REPEAT = int(os.environ.get('PERF_REPEAT', '3'))
+TOLERANCE = float(os.environ.get('PERF_TOLERANCE', '1.0'))
+SLACK_MS = 10.0
+BASELINE_PATH = Path(os.environ.get('PERF_BASELINE', Path(settings.BASE_DIR) / 'perf_baseline.json'))
+RESULTS_PATH = Path(os.environ.get('PERF_RESULTS', Path(tempfile.gettempdir()) / 'stocker_perf_results.json'))
+UPDATE_BASELINE = os.environ.get('PERF_UPDATE_BASELINE') == '1'
+CHECK_LATENCY = os.environ.get('PERF_CHECK_LATENCY') == '1'
+
+# URL kwarg sources: 'product' -> {'pk': <first product pk>}, ...
+PK_SOURCES = {'product': Product, 'category': Category, 'supplier': Supplier, 'location': Location}
+
+
+def _load(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _merge(path, section, data):
+    doc = _load(path)
+    doc.setdefault(section, {}).update(data)
+    path.write_text(json.dumps(doc, indent=2, sort_keys=True) + "\n")
+
+
+class ViewBenchmark(TestCase):
+    # {url name: (PK_SOURCES key or None, query budget)}
+    views = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('perf', password='perf', is_staff=True)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def request(self, url):
+        response = self.client.get(url)
+        if getattr(response, 'streaming', False):
+            b''.join(response.streaming_content)
+        return response
+
+    def measure(self, name, source):
+        kwargs = {'pk': PK_SOURCES[source].objects.order_by('pk').values_list('pk', flat=True).first()} if source else {}
+        url = reverse(name, kwargs=kwargs)
+        cache.clear()
+        with CaptureQueriesContext(connection) as cold:
+            response = self.request(url)
+        self.assertIn(response.status_code, (200, 302), f"{name} returned {response.status_code}")
+        timings = []
+        for _ in range(REPEAT):
+            with CaptureQueriesContext(connection) as warm:
+                started = time.perf_counter()
+                self.request(url)
+                timings.append((time.perf_counter() - started) * 1000)
+        return {'queries': len(cold), 'warm_queries': len(warm), 'ms': round(min(timings), 2)}
+
+    def test_views(self):
+        if not self.views:
+            self.skipTest("no views declared")
+        results = {name: {} for name in self.views}
+        seeded = 0
+        for i, size in enumerate(SIZES):
+            call_command('seed_demo_data', products=size - seeded, seed=90 + i,
+                         suppliers=max(5, size // 20), categories=10, stdout=io.StringIO())
+            seeded = size
+            for name, (source, _) in self.views.items():
+                results[name][str(size)] = self.measure(name, source)
+
+        _merge(RESULTS_PATH, 'views', results)
+        _merge(RESULTS_PATH, 'meta', {'generated': datetime.now(timezone.utc).isoformat(), 'sizes': SIZES,
+                                      'repeat': REPEAT, 'vendor': connection.vendor})
+        baseline = _load(BASELINE_PATH).get('views', {})
+        if UPDATE_BASELINE:
+            _merge(BASELINE_PATH, 'views', {
+                name: {'queries': max(r['queries'] for r in runs.values()), 'ms': runs[str(SIZES[-1])]['ms']}
+                for name, runs in results.items()
+            })
+
+        for name, (_, budget) in self.views.items():
+            runs = results[name]
+            first, last = runs[str(SIZES[0])], runs[str(SIZES[-1])]
+            with self.subTest(view=name):
+                for size, r in runs.items():
+                    self.assertLessEqual(r['queries'], budget,
+                                         f"{name}: {r['queries']} queries at {size} products (budget {budget})")
+                self.assertLessEqual(last['queries'], first['queries'],
+                                     f"{name}: query count grows with data ({first['queries']} -> {last['queries']})")
+                base = baseline.get(name)
+                if base and not UPDATE_BASELINE:
+                    self.assertLessEqual(last['queries'], base['queries'], f"{name}: more queries than baseline")
+                    if CHECK_LATENCY and base.get('ms') is not None:
+                        limit = base['ms'] * (1 + TOLERANCE) + SLACK_MS
+                        self.assertLessEqual(last['ms'], limit,
+                                             f"{name}: {last['ms']} ms vs baseline {base['ms']} ms")
@@ -0,0 +1,14 @@
+from django.apps import apps
+from django.db.models.signals import post_save
+
+from . import thumbnails
+
+
+def schedule_thumbnails(sender, instance, raw=False, **kwargs):
+    if not raw and not thumbnails.is_current(instance):
+        thumbnails.schedule(instance)
+
+
+for label in thumbnails.SOURCES:
+    post_save.connect(schedule_thumbnails, sender=apps.get_model(label),
+                      dispatch_uid=f'thumbnails:{label}')
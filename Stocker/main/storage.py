@@ -0,0 +1,50 @@
+"""Static files storage: manifest-hashed names plus pre-compressed variants.
+
+collectstatic writes `name.gz` (and `name.br` when the brotli package from
+requirements.txt is installed) next to every compressible file, original and
+hashed, so StaticAssetMiddleware can send the smallest encoding the client
+accepts without compressing per request.
+"""
+import gzip
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+COMPRESSIBLE = ('.css', '.js', '.mjs', '.map', '.json', '.svg', '.txt', '.xml', '.html', '.ico', '.ttf', '.eot')
+MIN_SIZE = 256      # bytes; smaller files gain nothing worth a variant
+MIN_SAVING = 0.05   # keep a variant only if it is at least 5% smaller
+
+
+def encodings():
+    """(file suffix, Content-Encoding) pairs in order of preference."""
+    return ([('.br', 'br')] if brotli else []) + [('.gz', 'gzip')]
+
+
+def _compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(n for n in names if n.lower().endswith(COMPRESSIBLE)):
+            with self.open(name) as f:
+                data = f.read()
+            if len(data) < MIN_SIZE:
+                continue
+            for suffix, encoding in encodings():
+                compressed = _compress(data, encoding)
+                if len(compressed) > len(data) * (1 - MIN_SAVING):
+                    continue
+                with open(self.path(name + suffix), 'wb') as f:
+                    f.write(compressed)
+                yield name, name + suffix, True
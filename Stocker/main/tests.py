@@ -1,3 +1,279 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import tempfile
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connections
+from django.db.utils import load_backend
+from django.http import HttpResponse, StreamingHttpResponse
+from django.template import TemplateDoesNotExist, engines
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from Stocker.db import sqlite_options
+
+from accounts.models import Profile
+from inventory.models import Supplier
+from main import perf
+
+from . import middleware, thumbnails
+from .middleware import StaticAssetMiddleware
+
+
+class StaticAssetMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = tmp.name
+        self.write('app.css', b'body { color: red }')
+        self.write('app.0123abcd.css', b'body { color: red }')
+        self.write('app.0123abcd.css.gz', gzip.compress(b'body { color: red }'))
+        self.write('staticfiles.json', json.dumps({'paths': {'app.css': 'app.0123abcd.css'}}).encode())
+        override = override_settings(STATIC_SERVE=True, STATIC_ROOT=self.root, STATIC_URL='/static/',
+                                     STATIC_MAX_AGE=60)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.middleware = StaticAssetMiddleware(lambda request: HttpResponse(status=404))
+        self.middleware.RECHECK_SECONDS = 0  # no stat caching between requests
+
+    def write(self, name, data):
+        with open(os.path.join(self.root, name), 'wb') as f:
+            f.write(data)
+
+    def get(self, name, **headers):
+        return self.middleware(RequestFactory().get(f'/static/{name}', headers=headers))
+
+    def test_hashed_names_are_immutable_and_others_revalidate(self):
+        self.assertEqual(self.get('app.0123abcd.css')['Cache-Control'], StaticAssetMiddleware.IMMUTABLE)
+        self.assertEqual(self.get('app.css')['Cache-Control'], 'public, max-age=60')
+        self.assertEqual(self.get('missing.css').status_code, 404)
+
+    def test_precompressed_variant_and_conditional_get(self):
+        response = self.get('app.0123abcd.css', accept_encoding='gzip, br;q=0')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        again = self.get('app.0123abcd.css', accept_encoding='gzip', if_none_match=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+        self.assertNotIn('Content-Encoding', self.get('app.0123abcd.css', accept_encoding='gzip;q=0'))
+
+    def test_collectstatic_while_serving(self):
+        old_etag = self.get('app.css')['ETag']
+        self.write('app.css', b'body { color: blue; margin: 0 }')
+        self.write('app.4567cdef.css', b'body { color: blue; margin: 0 }')
+        self.write('staticfiles.json', json.dumps({'paths': {'app.css': 'app.4567cdef.css'}}).encode())
+        self.assertEqual(self.get('app.4567cdef.css')['Cache-Control'], StaticAssetMiddleware.IMMUTABLE)
+        self.assertNotEqual(self.get('app.css')['ETag'], old_etag)
+
+    def test_cache_is_bounded(self):
+        self.middleware.MAX_ASSETS = 2
+        for name in ('app.css', 'app.0123abcd.css', 'staticfiles.json'):
+            self.get(name)
+        self.assertEqual(list(self.middleware.assets), ['app.0123abcd.css', 'staticfiles.json'])
+
+
+@override_settings(REQUEST_METRICS=True, REQUEST_METRICS_SLOW_MS=60000)
+class RequestMetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('staff', password='staff', is_staff=True)
+
+    def setUp(self):
+        middleware.snapshot(reset=True)
+        self.addCleanup(middleware.snapshot, reset=True)
+        self.client.force_login(self.user)
+
+    def metrics(self):
+        return self.client.get(reverse('main:request_metrics')).json()['views']
+
+    def test_get_reports_and_post_resets(self):
+        self.client.get(reverse('main:home_view'))
+        self.assertEqual(self.metrics()['main:home_view']['requests'], 1)
+        self.assertIn('main:home_view', self.metrics())  # a GET leaves them alone
+        self.client.post(reverse('main:request_metrics'))
+        self.assertNotIn('main:home_view', self.metrics())
+
+    def test_reset_needs_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        client.get(reverse('main:home_view'))
+        self.assertEqual(client.post(reverse('main:request_metrics')).status_code, 403)
+        self.assertIn('main:home_view', self.metrics())
+
+    def test_template_time_is_reported(self):
+        response = self.client.get(reverse('main:home_view'))
+        timings = dict(part.split(';')[:2] for part in response['Server-Timing'].split(', '))
+        self.assertGreater(float(timings['tpl'].removeprefix('dur=')), 0)
+        self.assertGreater(self.metrics()['main:home_view']['template_ms'], 0)
+
+    def test_streaming_body_queries_are_counted(self):
+        response = self.client.get(reverse('reports:export_inventory_ndjson'))
+        view_queries = int(response['Server-Timing'].split('desc="')[1].split(' ')[0])
+        self.assertEqual(self.metrics(), {})  # recorded once the body has been sent
+        b''.join(response.streaming_content)
+        # at least the (empty) first page of products is read while streaming
+        self.assertGreater(self.metrics()['reports:export_inventory_ndjson']['queries'], view_queries)
+
+    def test_async_capable(self):
+        async def get_response(request):
+            return HttpResponse()
+        self.assertTrue(iscoroutinefunction(middleware.RequestMetricsMiddleware(get_response)))
+        self.assertFalse(iscoroutinefunction(middleware.RequestMetricsMiddleware(lambda request: HttpResponse())))
+
+    async def test_async_view_queries_are_counted(self):
+        await self.async_client.aforce_login(self.user)
+        await cache.aclear()
+        response = await self.async_client.get(reverse('main:dashboard'))
+        self.assertIn('queries"', response['Server-Timing'])
+        metrics = (await self.async_client.get(reverse('main:request_metrics'))).json()['views']
+        self.assertGreater(metrics['main:dashboard']['queries'], 0)
+        self.assertGreater(metrics['main:dashboard']['template_ms'], 0)
+
+    async def test_async_streaming_body_is_recorded_when_sent(self):
+        async def chunks():
+            yield b'a'
+            yield b'b'
+
+        async def get_response(request):
+            return StreamingHttpResponse(chunks())
+        request = RequestFactory().get('/stream/')
+        response = await middleware.RequestMetricsMiddleware(get_response)(request)
+        self.assertEqual(middleware.snapshot(), {})
+        self.assertEqual([chunk async for chunk in response], [b'a', b'b'])
+        self.assertEqual(middleware.snapshot()['/stream/']['requests'], 1)
+
+    def test_missing_template_names_the_timed_backend(self):
+        backend = engines.all()[0]
+        with self.assertRaises(TemplateDoesNotExist) as cm:
+            backend.get_template('main/missing.html')
+        self.assertIs(cm.exception.backend, backend)
+        self.assertIsInstance(cm.exception.__cause__, TemplateDoesNotExist)
+
+
+def image_upload(name, size=(400, 100), mode='RGB', color='red', fmt='PNG'):
+    out = io.BytesIO()
+    Image.new(mode, size, color).save(out, fmt)
+    return SimpleUploadedFile(name, out.getvalue())
+
+
+@override_settings(THUMBNAILS_BACKGROUND=False)
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(MEDIA_ROOT=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def supplier(self, name='Acme', **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            supplier = Supplier.objects.create(name=name, logo=image_upload('logo.png', **kwargs))
+        supplier.refresh_from_db()
+        return supplier
+
+    def test_upload_renders_variants_after_commit(self):
+        card = self.supplier().logo_card
+        self.assertEqual((card.width, card.height), (240, 60))  # fits 240x120, keeps the 4:1 shape
+        for url in (card.src, card.webp):
+            name = url.removeprefix('/media/')
+            self.assertTrue(name.startswith('thumbs/logo_card/'))
+            with default_storage.open(name) as f, Image.open(f) as image:
+                self.assertEqual(image.size, (240, 60))
+
+    def test_original_is_shown_until_the_variants_match_it(self):
+        supplier = self.supplier()
+        Supplier.objects.filter(pk=supplier.pk).update(logo='suppliers/other.png')
+        supplier.refresh_from_db()
+        self.assertEqual(supplier.logo_card, thumbnails.Thumbnail('/media/suppliers/other.png', None, None, None))
+        self.assertIsNone(Supplier(name='No logo').logo_card)
+
+    def test_identical_output_is_stored_once(self):
+        first, second = self.supplier('Acme'), self.supplier('Beta')
+        self.assertNotEqual(first.logo.name, second.logo.name)
+        self.assertEqual(first.logo_card, second.logo_card)
+
+    def test_avatars_are_cropped_and_flattened_for_jpeg(self):
+        user = User.objects.create_user('ali')
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = Profile.objects.create(user=user, avatar=image_upload('me.png', size=(200, 100),
+                                                                            mode='RGBA', color=(0, 0, 0, 0)))
+        profile.refresh_from_db()
+        small = profile.avatar_small
+        self.assertEqual((small.width, small.height), (72, 72))
+        with default_storage.open(small.src.removeprefix('/media/')) as f, Image.open(f) as image:
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(image.getpixel((36, 36)), (255, 255, 255))
+
+    def test_command_backfills_what_was_missed(self):
+        supplier = self.supplier()
+        Supplier.objects.filter(pk=supplier.pk).update(logo_variants={})
+        out = io.StringIO()
+        call_command('generate_thumbnails', stdout=out)
+        self.assertIn('inventory.Supplier: 1 rendered, 0 current, 0 failed', out.getvalue())
+        supplier.refresh_from_db()
+        self.assertIsNotNone(supplier.logo_card.webp)
+        out = io.StringIO()
+        call_command('generate_thumbnails', stdout=out)
+        self.assertIn('inventory.Supplier: 0 rendered, 1 current, 0 failed', out.getvalue())
+
+
+class SQLiteOptionsTests(SimpleTestCase):
+    def connect(self, **options):
+        # a wrapper outside connections, so the pragmas run on a fresh file
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings_dict = {
+            **connections['default'].settings_dict,
+            'NAME': os.path.join(tmp.name, 'db.sqlite3'),
+            'OPTIONS': sqlite_options(**options),
+        }
+        conn = load_backend(settings_dict['ENGINE']).DatabaseWrapper(settings_dict, 'sqlite_options')
+        self.addCleanup(conn.close)
+        return conn
+
+    def pragma(self, conn, name):
+        with conn.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    def begin_statement(self, conn):
+        statements = []
+        with conn.execute_wrapper(lambda execute, sql, *args: statements.append(sql) or execute(sql, *args)):
+            conn._start_transaction_under_autocommit()
+        conn.rollback()
+        return statements[0]
+
+    def test_tuned_connection_applies_the_pragmas(self):
+        conn = self.connect(busy_timeout_ms=1234, mmap_size=1024 * 1024)
+        self.assertEqual(self.pragma(conn, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(conn, 'synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma(conn, 'busy_timeout'), 1234)
+        self.assertEqual(self.pragma(conn, 'mmap_size'), 1024 * 1024)
+        self.assertEqual(self.begin_statement(conn), 'BEGIN IMMEDIATE')
+
+    def test_wal_can_be_left_off(self):
+        conn = self.connect(wal=False)
+        self.assertEqual(self.pragma(conn, 'journal_mode'), 'delete')
+        self.assertEqual(self.pragma(conn, 'busy_timeout'), 5000)
+        self.assertEqual(self.begin_statement(conn), 'BEGIN IMMEDIATE')
+
+    def test_untuned_connection_keeps_the_defaults(self):
+        conn = self.connect(tuned=False)
+        self.assertEqual(self.pragma(conn, 'journal_mode'), 'delete')
+        self.assertEqual(self.pragma(conn, 'mmap_size'), 0)
+        self.assertEqual(self.begin_statement(conn), 'BEGIN')
+
+
+class MainViewBenchmark(perf.ViewBenchmark):
+    views = {
+        'main:home_view': (None, 3),
+        'main:dashboard': (None, 8),
+        'main:request_metrics': (None, 2),
+    }
@@ -0,0 +1,159 @@
+"""Fixed-size WebP / JPEG variants of uploaded images.
+
+After an upload commits, the variants are rendered on a background thread
+(`manage.py generate_thumbnails` backfills and catches anything missed) and
+stored under MEDIA_ROOT/thumbs/ with content-hashed names, so identical
+output is stored once and the files never change. Their names are recorded
+in a JSON field next to the image, together with the source they were made
+from; pages read them through `variant()` with no extra queries and fall
+back to the original until the variants exist.
+"""
+import hashlib
+import io
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger('stocker.thumbnails')
+
+# name -> (width, height, mode); 'cover' crops to fill, 'contain' fits inside without upscaling
+SPECS = {
+    'logo_card': (240, 120, 'contain'),    # supplier cards (shown at up to 120px high)
+    'avatar_small': (72, 72, 'cover'),     # page header (36px, 2x)
+    'avatar_large': (300, 300, 'cover'),   # profile pages (150px, 2x)
+}
+
+# model label -> (image field, variants field, specs)
+SOURCES = {
+    'inventory.Supplier': ('logo', 'logo_variants', ['logo_card']),
+    'accounts.Profile': ('avatar', 'avatar_variants', ['avatar_small', 'avatar_large']),
+}
+
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+
+Thumbnail = namedtuple('Thumbnail', 'src webp width height')
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='stocker-thumbnails')
+
+
+def variant(image, variants, spec):
+    """Thumbnail for `spec` of an image field, or the original while it has no current variants."""
+    if not image:
+        return None
+    entry = variants.get(spec) if variants and variants.get('source') == image.name else None
+    if entry is None:
+        return Thumbnail(image.url, None, None, None)
+    return Thumbnail(default_storage.url(entry['jpeg']), default_storage.url(entry['webp']),
+                     entry['width'], entry['height'])
+
+
+def is_current(instance):
+    field, store, _ = SOURCES[instance._meta.label]
+    image = getattr(instance, field)
+    return not image or getattr(instance, store).get('source') == image.name
+
+
+def _resize(image, width, height, mode):
+    if mode == 'cover':
+        return ImageOps.fit(image, (width, height), Image.LANCZOS)
+    image = image.copy()
+    image.thumbnail((width, height), Image.LANCZOS)
+    return image
+
+
+def _encode(image, fmt):
+    out = io.BytesIO()
+    if fmt == 'webp':
+        image.save(out, 'WEBP', quality=WEBP_QUALITY, method=4)
+    else:
+        if image.mode != 'RGB':
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+            image = background
+        image.save(out, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+def _store(spec, data, ext):
+    digest = hashlib.sha256(data).hexdigest()[:24]
+    name = f"thumbs/{spec}/{digest[:2]}/{digest}.{ext}"
+    if not default_storage.exists(name):
+        default_storage.save(name, ContentFile(data))
+    return name
+
+
+def render(image, specs):
+    """{spec: {'webp', 'jpeg', 'width', 'height'}} for an open image field file."""
+    with image.open('rb') as f:
+        source = ImageOps.exif_transpose(Image.open(f))
+        source = source.convert('RGBA' if 'A' in source.getbands() or 'transparency' in source.info else 'RGB')
+    result = {}
+    for spec in specs:
+        thumb = _resize(source, *SPECS[spec])
+        result[spec] = {
+            'webp': _store(spec, _encode(thumb, 'webp'), 'webp'),
+            'jpeg': _store(spec, _encode(thumb, 'jpeg'), 'jpg'),
+            'width': thumb.width,
+            'height': thumb.height,
+        }
+    return result
+
+
+def generate(instance, rendered=None, reuse=True):
+    """Render and record the variants of one row's image. Uploaded names are unique, so
+    variants already recorded for the same source name (e.g. the default avatar) are
+    reused unless `reuse` is off; `rendered` ({source name: variants}) does the same
+    within a batch. Returns False if the image was replaced meanwhile (that upload
+    schedules its own job)."""
+    from inventory import versioning
+
+    model = type(instance)
+    field, store, specs = SOURCES[model._meta.label]
+    image = getattr(instance, field)
+    if not image:
+        return False
+    variants = rendered.get(image.name) if rendered is not None else None
+    if variants is None and reuse:
+        variants = model.objects.filter(**{f'{store}__source': image.name}).values_list(store, flat=True).first()
+    if variants is None:
+        variants = dict(render(image, specs), source=image.name)
+    if rendered is not None:
+        rendered[image.name] = variants
+    with transaction.atomic():
+        # update() skips the save signals, so this does not schedule itself again
+        updated = model.objects.filter(pk=instance.pk, **{field: image.name}).update(**{store: variants})
+        if updated:
+            versioning.bump()  # pages showing the image are served with conditional GET
+    return bool(updated)
+
+
+def _job(label, pk):
+    try:
+        instance = apps.get_model(label).objects.filter(pk=pk).first()
+        if instance is not None and not is_current(instance):
+            generate(instance)
+    except Exception:
+        logger.exception("Thumbnail generation failed for %s %s", label, pk)
+    finally:
+        close_old_connections()
+
+
+def schedule(instance):
+    """Generate variants once the current transaction commits (in the background
+    unless THUMBNAILS_BACKGROUND is off)."""
+    label, pk = instance._meta.label, instance.pk
+
+    def run():
+        if settings.THUMBNAILS_BACKGROUND:
+            _executor.submit(_job, label, pk)
+        else:
+            _job(label, pk)
+    transaction.on_commit(run)
@@ -6,4 +6,5 @@ app_name = 'main'
 urlpatterns = [
     path('', views.home_view, name='home_view'),
     path('dashboard/', views.dashboard, name='dashboard'),
+    path('metrics/requests/', views.request_metrics, name='request_metrics'),
 ]
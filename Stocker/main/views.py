@@ -1,20 +1,26 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render
-from django.contrib.auth.decorators import login_required
-from inventory.models import Product, Supplier, Category
-from django.db.models import F
-from datetime import date, timedelta
+from django.http import JsonResponse
+from django.contrib.auth.decorators import login_required, user_passes_test
+from django.views.decorators.http import require_http_methods
+from reports.kpis import aget_dashboard
+from . import middleware
 
 def home_view(request):
     return render(request, 'main/home.html')
 
 @login_required
-def dashboard(request):
-    stats = {
-        'products': Product.objects.count(),
-        'suppliers': Supplier.objects.count(),
-        'categories': Category.objects.count(),
-    }
-    low_stock = Product.objects.filter(quantity__lte=F('reorder_level'))[:8]
-    soon = date.today() + timedelta(days=30)
-    near_expiry = Product.objects.filter(expiry_date__isnull=False, expiry_date__lte=soon)[:8]
-    return render(request, 'main/dashboard.html', {'stats': stats, 'low_stock': low_stock, 'near_expiry': near_expiry})
+async def dashboard(request):
+    request.user = await request.auser()  # loaded by login_required; the templates read request.user
+    context = await aget_dashboard()
+    # the base template reads the user's profile: render off the event loop
+    return await sync_to_async(render)(request, 'main/dashboard.html', context)
+
+@user_passes_test(lambda u: u.is_staff)
+@require_http_methods(['GET', 'POST'])
+def request_metrics(request):
+    """Per-view request aggregates from RequestMetricsMiddleware (a POST, with the CSRF token, also clears them)."""
+    return JsonResponse({
+        'enabled': middleware.is_enabled(),
+        'views': middleware.snapshot(reset=request.method == 'POST'),
+    })
@@ -0,0 +1,47 @@
+"""Run a view's independent queries concurrently.
+
+Django's async ORM (acount(), aget(), ``async for``) hands every query to the
+one thread-sensitive executor, so awaiting several with asyncio.gather still
+runs them one after another. `gather` runs each callable on a small pool of
+worker threads instead, each with its own database connection, so a page's
+independent queries overlap and its latency approaches the slowest of them.
+
+Callables run with the caller's context, so they are routed to the same
+database (reports.routers) and counted by RequestMetricsMiddleware. Inside an
+open transaction (tests, ATOMIC_REQUESTS) other connections cannot see its
+writes, so the queries then run one after another on the request's own
+connection; ASYNC_QUERY_WORKERS=0 does the same everywhere.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+from main.middleware import track_queries
+
+from . import routers
+
+_executor = ThreadPoolExecutor(max_workers=max(settings.ASYNC_QUERY_WORKERS, 1), thread_name_prefix='stocker-query')
+
+
+def _run(query):
+    routers.prepare_thread()
+    try:
+        with track_queries():
+            return query()
+    finally:
+        close_old_connections()  # what request_finished does on request threads
+
+
+def _in_transaction():
+    return any(conn.in_atomic_block for conn in connections.all(initialized_only=True))
+
+
+async def gather(*queries):
+    """Results of the callables `queries`, in order."""
+    if not settings.ASYNC_QUERY_WORKERS or await sync_to_async(_in_transaction)():
+        return [await sync_to_async(query)() for query in queries]
+    return await asyncio.gather(*(sync_to_async(_run, thread_sensitive=False, executor=_executor)(query)
+                                  for query in queries))
@@ -0,0 +1,164 @@
+"""Typed bulk exports of the catalogue for analytics.
+
+Products are read in (name, pk) keyset order, one `values_list` batch at a
+time, so memory is bounded by a batch whatever the size of the catalogue.
+Every batch is written out before the next is read:
+
+* parquet: one row group per batch, with real column types (price
+  decimal(10, 2), expiry_date date32, suppliers list<string>);
+* arrow: the same schema as an Arrow IPC stream, one record batch per batch;
+* ndjson: one JSON object per line (price as a decimal string such as
+  "12.50", so it stays exact; dates ISO 8601).
+
+Parquet and Arrow need pyarrow (requirements.txt); without it only NDJSON
+is offered. The writers yield bytes as they go, so
+reports.views streams them and `manage.py export_inventory` writes them to disk.
+"""
+import json
+from collections import defaultdict, namedtuple
+from datetime import date
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Q
+
+from inventory.models import Product
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional: only the columnar formats need it
+    pa = pq = None
+
+CHUNK_SIZE = 10000  # rows per batch: one Parquet row group / Arrow record batch
+
+COLUMNS = ['id', 'name', 'strength', 'form', 'barcode', 'category', 'suppliers', 'price', 'quantity',
+           'reorder_level', 'batch_no', 'expiry_date']
+
+
+def iter_batches(chunk_size=CHUNK_SIZE):
+    """Yield lists of rows (tuples in COLUMNS order, suppliers as a list of names),
+    walking products by (name, pk) one chunk at a time."""
+    through = Product.suppliers.through
+    qs = (Product.objects
+          .order_by('name', 'pk')
+          .values_list('pk', 'name', 'strength', 'form', 'barcode', 'category__name',
+                       'price', 'quantity', 'reorder_level', 'batch_no', 'expiry_date'))
+    last = None
+    while True:
+        page = qs
+        if last:
+            page = qs.filter(Q(name__gt=last[0]) | Q(name=last[0], pk__gt=last[1]))
+        rows = list(page[:chunk_size])
+        if not rows:
+            return
+        suppliers = defaultdict(list)
+        links = (through.objects
+                 .filter(product_id__in=[r[0] for r in rows])
+                 .order_by('supplier__name')
+                 .values_list('product_id', 'supplier__name'))
+        for product_id, supplier_name in links:
+            suppliers[product_id].append(supplier_name)
+        yield [r[:6] + (suppliers[r[0]],) + r[6:] for r in rows]
+        last = (rows[-1][1], rows[-1][0])
+
+
+def arrow_available():
+    return pa is not None
+
+
+def arrow_schema():
+    return pa.schema([
+        ('id', pa.int64()),
+        ('name', pa.string()),
+        ('strength', pa.string()),
+        ('form', pa.string()),
+        ('barcode', pa.string()),
+        ('category', pa.string()),
+        ('suppliers', pa.list_(pa.string())),
+        ('price', pa.decimal128(10, 2)),
+        ('quantity', pa.int64()),
+        ('reorder_level', pa.int64()),
+        ('batch_no', pa.string()),
+        ('expiry_date', pa.date32()),
+    ])
+
+
+def _record_batch(schema, rows):
+    columns = list(zip(*rows))
+    return pa.record_batch([pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                           schema=schema)
+
+
+class _Sink:
+    """Write-only file object keeping what pyarrow writes until it is drained."""
+    closed = False
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def parquet_chunks(batches):
+    schema = arrow_schema()
+    sink = _Sink()
+    with pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema,
+                          compression=settings.EXPORT_PARQUET_COMPRESSION) as writer:
+        for rows in batches:
+            writer.write_batch(_record_batch(schema, rows))
+            yield sink.drain()
+    yield sink.drain()  # footer
+
+
+def arrow_chunks(batches):
+    schema = arrow_schema()
+    sink = _Sink()
+    with pa.ipc.new_stream(pa.PythonFile(sink, mode='w'), schema) as writer:
+        yield sink.drain()  # schema message
+        for rows in batches:
+            writer.write_batch(_record_batch(schema, rows))
+            yield sink.drain()
+    yield sink.drain()  # end-of-stream marker
+
+
+def _json_value(value):
+    if isinstance(value, Decimal):
+        return str(value)  # exact; a JSON number would be read back as a binary float
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def ndjson_chunks(batches):
+    encode = json.JSONEncoder(default=_json_value, ensure_ascii=False).encode
+    for rows in batches:
+        yield ''.join(encode(dict(zip(COLUMNS, row))) + '\n' for row in rows).encode()
+
+
+# name -> (writer, content type, file extension, needs pyarrow)
+Format = namedtuple('Format', 'chunks content_type extension needs_arrow')
+FORMATS = {
+    'parquet': Format(parquet_chunks, 'application/vnd.apache.parquet', 'parquet', True),
+    'arrow': Format(arrow_chunks, 'application/vnd.apache.arrow.stream', 'arrows', True),
+    'ndjson': Format(ndjson_chunks, 'application/x-ndjson', 'ndjson', False),
+}
+
+
+def available(name):
+    return name in FORMATS and (arrow_available() or not FORMATS[name].needs_arrow)
@@ -0,0 +1,105 @@
+"""Daily per-category / per-supplier stock history.
+
+`take_snapshot(day)` aggregates the catalogue straight into the history tables
+with one INSERT ... SELECT per table, so no product rows pass through Python.
+Trend pages then read O(days x groups) rows.
+"""
+from django.db import connection, transaction
+from django.db.models import Sum
+
+from inventory import versioning
+from inventory.models import Product, Category, Supplier
+
+from .models import CategoryStockHistory, SupplierStockHistory
+
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+CATEGORY_SQL = """
+    INSERT INTO {history} (day, category_id, name, products_count, quantity, stock_value)
+    SELECT %s, COALESCE(p.category_id, 0), COALESCE(c.name, ''),
+           COUNT(*), COALESCE(SUM(p.quantity), 0), COALESCE(SUM(p.price * p.quantity), 0)
+    FROM {product} p
+    LEFT JOIN {category} c ON c.id = p.category_id
+    GROUP BY COALESCE(p.category_id, 0), COALESCE(c.name, '')
+"""
+
+SUPPLIER_SQL = """
+    INSERT INTO {history} (day, supplier_id, name, products_count, quantity, stock_value)
+    SELECT %s, COALESCE(ps.supplier_id, 0), COALESCE(s.name, ''),
+           COUNT(*), COALESCE(SUM(p.quantity), 0), COALESCE(SUM(p.price * p.quantity), 0)
+    FROM {product} p
+    LEFT JOIN {through} ps ON ps.product_id = p.id
+    LEFT JOIN {supplier} s ON s.id = ps.supplier_id
+    GROUP BY COALESCE(ps.supplier_id, 0), COALESCE(s.name, '')
+"""
+
+
+@transaction.atomic
+def take_snapshot(day):
+    """Write (or rewrite) the history rows for `day`; returns (category rows, supplier rows)."""
+    CategoryStockHistory.objects.filter(day=day).delete()
+    SupplierStockHistory.objects.filter(day=day).delete()
+    tables = dict(product=_table(Product), category=_table(Category), supplier=_table(Supplier),
+                  through=_table(Product.suppliers.through))
+    counts = []
+    with connection.cursor() as cursor:
+        for model, sql in ((CategoryStockHistory, CATEGORY_SQL), (SupplierStockHistory, SUPPLIER_SQL)):
+            cursor.execute(sql.format(history=_table(model), **tables), [day])
+            counts.append(cursor.rowcount)
+    versioning.bump()  # the trend page is served with conditional GET
+    return tuple(counts)
+
+
+TREND_GROUPS = {
+    'category': (CategoryStockHistory, 'category_id', '(No category)'),
+    'supplier': (SupplierStockHistory, 'supplier_id', '(No supplier)'),
+}
+
+
+def _sparkline(values, width=120, height=28):
+    """SVG polyline points for a series (None = no row that day)."""
+    present = [v for v in values if v is not None]
+    if len(present) < 2:
+        return ''
+    low, high = min(present), max(present)
+    span = (high - low) or 1
+    step = width / (len(values) - 1)
+    return ' '.join(f"{i * step:.1f},{height - (float(v - low) / float(span)) * height:.1f}"
+                    for i, v in enumerate(values) if v is not None)
+
+
+def trends(by, start, top=10):
+    """Stock value per day for the `top` groups (by value on the latest day) and in total.
+
+    The totals always come from the category rows: every product is in exactly
+    one of them, while a product with several suppliers is in several supplier rows.
+    """
+    model, key, empty = TREND_GROUPS[by]
+    rows = model.objects.filter(day__gte=start)
+    totals = list(CategoryStockHistory.objects.filter(day__gte=start).order_by('day').values('day')
+                  .annotate(value=Sum('stock_value'), count=Sum('products_count')))
+    if not totals:
+        return {'days': [], 'totals': [], 'groups': []}
+    days = [t['day'] for t in totals]
+    leaders = list(rows.filter(day=days[-1]).order_by('-stock_value').values_list(key, flat=True)[:top])
+    series, names = {}, {}
+    for day, group, name, value in rows.filter(**{f'{key}__in': leaders}).values_list('day', key, 'name', 'stock_value'):
+        series.setdefault(group, {})[day] = value
+        names[group] = name or empty
+    groups = []
+    for group in leaders:
+        values = [series[group].get(d) for d in days]
+        first = next(v for v in values if v is not None)
+        last = values[-1]
+        groups.append({
+            'name': names[group], 'first': first, 'last': last,
+            'change': (last - first) / first * 100 if first else None,
+            'points': _sparkline(values),
+        })
+    values = [t['value'] for t in totals]
+    return {'days': days, 'totals': totals, 'groups': groups, 'total_first': values[0], 'total_last': values[-1],
+            'total_change': (values[-1] - values[0]) / values[0] * 100 if values[0] else None,
+            'total_points': _sparkline(values)}
@@ -0,0 +1,100 @@
+"""Cached dashboard figures.
+
+Every KPI comes from one conditional-aggregation query over Product. Results
+are kept in Django's cache and dropped by the signal handlers in
+`reports.signals` once a transaction changing a product, supplier or category
+commits (dropping them earlier would let a concurrent request cache the old
+figures again until the timeout). The cache timeout bounds staleness for
+writers that bypass signals and for date-based figures such as near expiry. The main dashboard's queries run
+concurrently (see reports.aio).
+"""
+from datetime import date
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Sum, F, Q, DecimalField, ExpressionWrapper
+
+from inventory.models import Product, Supplier, Category, StockHealth
+from inventory.utils import near_expiry_cutoff
+
+from . import aio
+
+KPI_CACHE_KEY = 'reports:kpis'
+DASHBOARD_CACHE_KEY = 'main:dashboard'
+CACHE_TIMEOUT = 300
+DASHBOARD_LIST_SIZE = 8
+
+value_expr = ExpressionWrapper(
+    F('price') * F('quantity'),
+    output_field=DecimalField(max_digits=12, decimal_places=2)
+)
+
+
+def compute_kpis():
+    kpis = Product.objects.aggregate(
+        total_value=Sum(value_expr),
+        total_products=Count('id'),
+        low_count=Count('id', filter=Q(stock_health__lte=StockHealth.LOW)),
+        near_count=Count('id', filter=Q(expiry_date__isnull=False, expiry_date__lte=near_expiry_cutoff())),
+    )
+    kpis['total_value'] = kpis['total_value'] or 0
+    return kpis
+
+
+def _cached(key, compute):
+    today = date.today()
+    hit = cache.get(key)
+    if hit is not None and hit[0] == today:
+        return hit[1]
+    value = compute()
+    cache.set(key, (today, value), CACHE_TIMEOUT)
+    return value
+
+
+def get_kpis():
+    return _cached(KPI_CACHE_KEY, compute_kpis)
+
+
+def _dashboard_queries():
+    # independent of each other: run concurrently by reports.aio
+    return [
+        get_kpis,
+        Supplier.objects.count,
+        Category.objects.count,
+        lambda: list(Product.objects.low_stock()[:DASHBOARD_LIST_SIZE]),
+        lambda: list(Product.objects.filter(
+            expiry_date__isnull=False, expiry_date__lte=near_expiry_cutoff())[:DASHBOARD_LIST_SIZE]),
+    ]
+
+
+async def acompute_dashboard():
+    kpis, suppliers, categories, low_stock, near_expiry = await aio.gather(*_dashboard_queries())
+    return {
+        'stats': {
+            'products': kpis['total_products'],
+            'suppliers': suppliers,
+            'categories': categories,
+        },
+        'low_stock': low_stock,
+        'near_expiry': near_expiry,
+    }
+
+
+async def aget_dashboard():
+    today = date.today()
+    hit = await cache.aget(DASHBOARD_CACHE_KEY)
+    if hit is not None and hit[0] == today:
+        return hit[1]
+    value = await acompute_dashboard()
+    await cache.aset(DASHBOARD_CACHE_KEY, (today, value), CACHE_TIMEOUT)
+    return value
+
+
+def invalidate():
+    cache.delete_many([KPI_CACHE_KEY, DASHBOARD_CACHE_KEY])
+
+
+def invalidate_on_commit():
+    # once per transaction, like inventory.versioning.bump
+    if not any(func is invalidate for _, func, _ in transaction.get_connection().run_on_commit):
+        transaction.on_commit(invalidate)
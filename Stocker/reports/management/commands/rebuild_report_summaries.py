@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from reports import summaries
+
+class Command(BaseCommand):
+    help = "Recompute the category and supplier stock summary tables from the product table"
+
+    def handle(self, *args, **options):
+        categories, suppliers = summaries.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Summaries rebuilt: {categories} category rows, {suppliers} supplier rows."))
@@ -0,0 +1,47 @@
+import os
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from reports import routers
+
+
+class Command(BaseCommand):
+    help = ("Copy the primary SQLite database to REPORTS_SNAPSHOT_PATH with the online backup API. "
+            "The new copy replaces the old one atomically; report views pick it up on their next query.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, default=0,
+                            help="Keep running and refresh every N seconds")
+
+    def handle(self, *args, **options):
+        path = routers.snapshot_path()
+        if not path:
+            raise CommandError("REPORTS_SNAPSHOT_PATH is not set (or the primary database is not SQLite).")
+        source = str(connections['default'].settings_dict['NAME'])
+        while True:
+            started = time.monotonic()
+            self.refresh(source, path)
+            self.stdout.write(self.style.SUCCESS(
+                f"Snapshot refreshed in {time.monotonic() - started:.2f}s: {path} "
+                f"({os.path.getsize(path) / 1_048_576:.1f} MB, max lag {settings.REPORTS_MAX_LAG}s)"))
+            if not options['every']:
+                break
+            time.sleep(max(options['every'] - (time.monotonic() - started), 0))
+
+    def refresh(self, source, path):
+        tmp = f"{path}.tmp"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        src, dst = sqlite3.connect(source), sqlite3.connect(tmp)
+        try:
+            src.backup(dst)  # one step: a consistent copy as of now, readers and writers keep going
+            dst.execute("PRAGMA journal_mode=DELETE")  # read-only opens can't create WAL files
+            dst.commit()
+        finally:
+            dst.close()
+            src.close()
+        os.replace(tmp, path)
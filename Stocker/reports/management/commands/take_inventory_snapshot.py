@@ -0,0 +1,22 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from reports import history
+
+class Command(BaseCommand):
+    help = ("Record today's per-category and per-supplier stock totals in the history tables "
+            "(run once a day, e.g. from cron; re-running replaces the day's rows)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help="Day to record the current totals under (YYYY-MM-DD, default today)")
+
+    def handle(self, *args, **options):
+        try:
+            day = date.fromisoformat(options['date']) if options['date'] else timezone.localdate()
+        except ValueError:
+            raise CommandError("--date must be YYYY-MM-DD.")
+        categories, suppliers = history.take_snapshot(day)
+        self.stdout.write(self.style.SUCCESS(
+            f"Snapshot for {day}: {categories} category rows, {suppliers} supplier rows."))
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:23
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+
+
+def build_summaries(apps, schema_editor):
+    Product = apps.get_model('inventory', 'Product')
+    Category = apps.get_model('inventory', 'Category')
+    Supplier = apps.get_model('inventory', 'Supplier')
+    CategoryStockSummary = apps.get_model('reports', 'CategoryStockSummary')
+    SupplierStockSummary = apps.get_model('reports', 'SupplierStockSummary')
+    value = ExpressionWrapper(F('price') * F('quantity'), output_field=DecimalField(max_digits=12, decimal_places=2))
+
+    names = dict(Category.objects.values_list('pk', 'name'))
+    CategoryStockSummary.objects.bulk_create([
+        CategoryStockSummary(pk=r['category_id'] or 0, name=names.get(r['category_id'], ''),
+                             products_count=r['n'], stock_value=r['v'] or 0)
+        for r in Product.objects.order_by().values('category_id').annotate(n=Count('id'), v=Sum(value))
+    ])
+    names = dict(Supplier.objects.values_list('pk', 'name'))
+    SupplierStockSummary.objects.bulk_create([
+        SupplierStockSummary(pk=r['suppliers'] or 0, name=names.get(r['suppliers'], ''),
+                             products_count=r['n'], stock_value=r['v'] or 0)
+        for r in Product.objects.order_by().values('suppliers').annotate(n=Count('id', distinct=True), v=Sum(value))
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryStockSummary',
+            fields=[
+                ('id', models.PositiveBigIntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(blank=True, max_length=100)),
+                ('products_count', models.IntegerField(default=0)),
+                ('stock_value', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+            ],
+            options={
+                'ordering': ['-products_count', 'name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SupplierStockSummary',
+            fields=[
+                ('id', models.PositiveBigIntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(blank=True, max_length=150)),
+                ('products_count', models.IntegerField(default=0)),
+                ('stock_value', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+            ],
+            options={
+                'ordering': ['-products_count', 'name'],
+            },
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
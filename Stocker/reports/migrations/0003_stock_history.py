@@ -0,0 +1,45 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0002_stock_summaries'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryStockHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('category_id', models.PositiveBigIntegerField()),
+                ('name', models.CharField(blank=True, max_length=100)),
+                ('products_count', models.IntegerField(default=0)),
+                ('quantity', models.BigIntegerField(default=0)),
+                ('stock_value', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+            ],
+            options={
+                'ordering': ['day', 'category_id'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'category_id'), name='categorystockhistory_day_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SupplierStockHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('supplier_id', models.PositiveBigIntegerField()),
+                ('name', models.CharField(blank=True, max_length=150)),
+                ('products_count', models.IntegerField(default=0)),
+                ('quantity', models.BigIntegerField(default=0)),
+                ('stock_value', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+            ],
+            options={
+                'ordering': ['day', 'supplier_id'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'supplier_id'), name='supplierstockhistory_day_uniq')],
+            },
+        ),
+    ]
@@ -4,4 +4,61 @@ from inventory.models import Product, Category, Supplier
 # Create your models here.
 class Product(models.Model):
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='products')
-    suppliers = models.ManyToManyField(Supplier, blank=True, related_name='products')
\ No newline at end of file
+    suppliers = models.ManyToManyField(Supplier, blank=True, related_name='products')
+
+# Materialized report rows, maintained incrementally by reports.summaries.
+# The primary key is the category/supplier id; 0 collects products without one.
+class CategoryStockSummary(models.Model):
+    id = models.PositiveBigIntegerField(primary_key=True)
+    name = models.CharField(max_length=100, blank=True)
+    products_count = models.IntegerField(default=0)
+    stock_value = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['-products_count', 'name']
+
+    def __str__(self): return self.name or '(No category)'
+
+
+class SupplierStockSummary(models.Model):
+    id = models.PositiveBigIntegerField(primary_key=True)
+    name = models.CharField(max_length=150, blank=True)
+    products_count = models.IntegerField(default=0)
+    stock_value = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['-products_count', 'name']
+
+    def __str__(self): return self.name or '(No supplier)'
+
+
+# Daily history written by `manage.py take_inventory_snapshot` (reports.history);
+# same id convention as the summaries: 0 collects products without a category/supplier.
+class CategoryStockHistory(models.Model):
+    day = models.DateField()
+    category_id = models.PositiveBigIntegerField()
+    name = models.CharField(max_length=100, blank=True)
+    products_count = models.IntegerField(default=0)
+    quantity = models.BigIntegerField(default=0)
+    stock_value = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['day', 'category_id']
+        constraints = [models.UniqueConstraint(fields=['day', 'category_id'], name='categorystockhistory_day_uniq')]
+
+    def __str__(self): return f"{self.day} {self.name or '(No category)'}"
+
+
+class SupplierStockHistory(models.Model):
+    day = models.DateField()
+    supplier_id = models.PositiveBigIntegerField()
+    name = models.CharField(max_length=150, blank=True)
+    products_count = models.IntegerField(default=0)
+    quantity = models.BigIntegerField(default=0)
+    stock_value = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['day', 'supplier_id']
+        constraints = [models.UniqueConstraint(fields=['day', 'supplier_id'], name='supplierstockhistory_day_uniq')]
+
+    def __str__(self): return f"{self.day} {self.name or '(No supplier)'}"
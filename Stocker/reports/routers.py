@@ -0,0 +1,159 @@
+"""Send the report views' reads to a secondary database.
+
+settings.REPORTS_DB_ALIAS names the secondary: a SQLite snapshot of the
+primary (REPORTS_SNAPSHOT_PATH, refreshed by `manage.py refresh_reports_snapshot`)
+or a Postgres replica (REPORTS_REPLICA_URL). Only code running under
+`reads_from_reports_db` is routed, so signal handlers and writes elsewhere
+keep using the primary. When the secondary lags more than REPORTS_MAX_LAG
+seconds (or is missing), reads fall back to the primary.
+"""
+import functools
+import os
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections, DatabaseError
+
+_alias = ContextVar('reports_db', default=None)  # alias chosen for the current report request
+LAG_CHECK_INTERVAL = 2.0  # seconds between lag probes per process
+
+_lag_cache = {}       # alias -> (checked at, lag seconds or None)
+_snapshot_inode = {}  # thread-local connection -> inode it was opened on
+
+
+def reports_alias():
+    alias = getattr(settings, 'REPORTS_DB_ALIAS', None)
+    return alias if alias and alias in settings.DATABASES else None
+
+
+def snapshot_path():
+    return getattr(settings, 'REPORTS_SNAPSHOT_PATH', None)
+
+
+def _probe_lag(alias):
+    path = snapshot_path()
+    if path:
+        try:
+            return max(time.time() - os.stat(path).st_mtime, 0.0)
+        except OSError:
+            return None
+    conn = connections[alias]
+    if conn.vendor != 'postgresql':
+        return 0.0
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT CASE WHEN pg_is_in_recovery() "
+                           "THEN EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) ELSE 0 END")
+            lag = cursor.fetchone()[0]
+    except DatabaseError:
+        return None
+    return float(lag) if lag is not None else None
+
+
+def lag_seconds(alias=None):
+    """Age of the secondary's data in seconds, or None if it is unavailable."""
+    alias = alias or reports_alias()
+    if not alias:
+        return None
+    now = time.monotonic()
+    checked, lag = _lag_cache.get(alias, (None, None))
+    if checked is None or now - checked > LAG_CHECK_INTERVAL:
+        lag = _probe_lag(alias)
+        _lag_cache[alias] = (now, lag)
+    return lag
+
+
+def _reopen_if_replaced(alias):
+    # refresh_reports_snapshot swaps in a new file; persistent connections would keep reading the old one
+    try:
+        inode = os.stat(snapshot_path()).st_ino
+    except OSError:
+        return
+    conn = connections[alias]
+    if _snapshot_inode.get(id(conn)) != inode:
+        conn.close()
+        _snapshot_inode[id(conn)] = inode
+
+
+def usable_alias():
+    alias = reports_alias()
+    if not alias:
+        return None
+    lag = lag_seconds(alias)
+    if lag is None or lag > settings.REPORTS_MAX_LAG:
+        return None
+    if snapshot_path():
+        _reopen_if_replaced(alias)
+    return alias
+
+
+def prepare_thread():
+    """Call before routed queries on a worker thread: its own connection may still
+    point at a replaced snapshot."""
+    alias = _alias.get()
+    if alias and snapshot_path():
+        _reopen_if_replaced(alias)
+
+
+def _routed(iterator, alias):
+    iterator = iter(iterator)
+    while True:
+        token = _alias.set(alias)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _alias.reset(token)
+        yield chunk
+
+
+def reads_from_reports_db(view):
+    """View decorator: route the view's reads (and a streaming body's) to the reports database.
+
+    The database is picked once per request, so a long export never mixes the
+    secondary and the primary.
+    """
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            alias = await sync_to_async(usable_alias)()
+            token = _alias.set(alias)
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _alias.reset(token)
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        alias = usable_alias()
+        if alias is None:
+            return view(request, *args, **kwargs)
+        token = _alias.set(alias)
+        try:
+            response = view(request, *args, **kwargs)
+        finally:
+            _alias.reset(token)
+        if getattr(response, 'streaming', False):
+            response.streaming_content = _routed(response.streaming_content, alias)
+        return response
+    return wrapper
+
+
+class ReportsRouter:
+    def db_for_read(self, model, **hints):
+        return _alias.get()
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # same data on both databases
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == reports_alias():
+            return False  # a copy of the primary, never migrated directly
+        return None
@@ -0,0 +1,108 @@
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from inventory.models import Product, Supplier, Category
+from inventory.signals import products_changing, products_changed, stock_changed
+
+from . import kpis, summaries
+from .models import CategoryStockSummary, SupplierStockSummary
+
+
+# ----- KPI cache -----
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Supplier)
+@receiver(post_delete, sender=Supplier)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(products_changed)
+@receiver(stock_changed)
+def invalidate_kpis(sender, **kwargs):
+    kpis.invalidate_on_commit()
+
+
+# ----- Summary tables -----
+@receiver(pre_save, sender=Product)
+def remember_product_totals(sender, instance, raw=False, **kwargs):
+    instance._summary_old = None
+    if instance.pk and not raw:
+        instance._summary_old = (Product.objects.filter(pk=instance.pk)
+                                 .values_list('category_id', 'price', 'quantity').first())
+
+@receiver(post_save, sender=Product)
+def update_product_summaries(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    old = None if created else instance._summary_old
+    stored = (instance.category_id, instance.price, instance.quantity)
+    if old and update_fields is not None:
+        # fields this save did not write keep their stored values (stock movements may have changed quantity)
+        written = [{'category', 'category_id'}, {'price'}, {'quantity'}]
+        stored = tuple(new if names & update_fields else prev for names, new, prev in zip(written, stored, old))
+    summaries.product_saved(instance.pk, old and (old[0], old[1] * old[2]), (stored[0], stored[1] * stored[2]))
+
+@receiver(pre_delete, sender=Product)
+def remember_deleted_product(sender, instance, **kwargs):
+    instance._summary_suppliers = summaries.supplier_ids_of(instance.pk)
+
+@receiver(post_delete, sender=Product)
+def update_deleted_product_summaries(sender, instance, **kwargs):
+    summaries.product_deleted(instance.category_id, summaries.product_value(instance),
+                              getattr(instance, '_summary_suppliers', []))
+
+@receiver(m2m_changed, sender=Product.suppliers.through)
+def update_link_summaries(sender, instance, action, reverse, pk_set, **kwargs):
+    through = Product.suppliers.through
+    if action in ('pre_remove', 'pre_clear'):
+        links = through.objects.filter(**{'supplier_id' if reverse else 'product_id': instance.pk})
+        if action == 'pre_remove':
+            links = links.filter(**{'product_id__in' if reverse else 'supplier_id__in': pk_set})
+        instance._summary_pairs = list(links.values_list('product_id', 'supplier_id'))
+    elif action in ('post_remove', 'post_clear'):
+        summaries.links_changed(getattr(instance, '_summary_pairs', []), -1)
+    elif action == 'post_add':
+        pairs = [(pk, instance.pk) if reverse else (instance.pk, pk) for pk in pk_set or []]
+        summaries.links_changed(pairs, 1)
+
+@receiver(post_save, sender=Category)
+def rename_category_summary(sender, instance, raw=False, **kwargs):
+    if not raw:
+        CategoryStockSummary.objects.filter(pk=instance.pk).update(name=instance.name)
+
+@receiver(post_save, sender=Supplier)
+def rename_supplier_summary(sender, instance, raw=False, **kwargs):
+    if not raw:
+        SupplierStockSummary.objects.filter(pk=instance.pk).update(name=instance.name)
+
+@receiver(pre_delete, sender=Category)
+def remember_category_summary(sender, instance, **kwargs):
+    instance._summary_row = CategoryStockSummary.objects.filter(pk=instance.pk).first()
+
+@receiver(post_delete, sender=Category)
+def move_category_summary(sender, instance, **kwargs):
+    # its products were set to no category
+    row = getattr(instance, '_summary_row', None)
+    if row:
+        summaries.apply_deltas(CategoryStockSummary, {summaries.NONE: (row.products_count, row.stock_value)})
+        row.delete()
+
+@receiver(pre_delete, sender=Supplier)
+def remember_supplier_products(sender, instance, **kwargs):
+    instance._summary_products = list(instance.product_set.values_list('pk', flat=True))
+
+@receiver(post_delete, sender=Supplier)
+def drop_supplier_summary(sender, instance, **kwargs):
+    SupplierStockSummary.objects.filter(pk=instance.pk).delete()
+    summaries.products_unlinked(getattr(instance, '_summary_products', []))
+
+@receiver(products_changing)
+def subtract_changing_products(sender, product_ids, **kwargs):
+    summaries.apply_products(product_ids, -1)
+
+@receiver(products_changed)
+def add_changed_products(sender, product_ids, **kwargs):
+    summaries.apply_products(product_ids, 1)
+
+@receiver(stock_changed)
+def update_stock_summaries(sender, deltas, **kwargs):
+    summaries.stock_changed(deltas)
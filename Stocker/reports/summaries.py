@@ -0,0 +1,178 @@
+"""Incremental maintenance of CategoryStockSummary / SupplierStockSummary.
+
+Each change is turned into per-row deltas of (products_count, stock_value)
+that are applied with `F()` updates, so report pages read a handful of rows
+instead of aggregating the catalogue. Row 0 collects products without a
+category / without any supplier. `rebuild()` recomputes everything.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Sum, F, DecimalField, ExpressionWrapper
+
+from inventory.models import Product, Category, Supplier
+
+from .kpis import value_expr
+from .models import CategoryStockSummary, SupplierStockSummary
+
+NONE = 0
+CHUNK = 500
+
+link_value_expr = ExpressionWrapper(
+    F('product__price') * F('product__quantity'),
+    output_field=DecimalField(max_digits=12, decimal_places=2)
+)
+
+
+def product_value(product):
+    return product.price * product.quantity
+
+
+def apply_deltas(model, deltas):
+    """deltas: {row id: (count delta, value delta)}; missing rows are created first."""
+    deltas = {k: d for k, d in deltas.items() if d[0] or d[1]}
+    if not deltas:
+        return
+    existing = set(model.objects.filter(pk__in=list(deltas)).values_list('pk', flat=True))
+    missing = [k for k in deltas if k not in existing]
+    if missing:
+        source = Category if model is CategoryStockSummary else Supplier
+        names = dict(source.objects.filter(pk__in=missing).values_list('pk', 'name'))
+        model.objects.bulk_create([model(pk=k, name=names.get(k, '')) for k in missing], ignore_conflicts=True)
+    for k, (n, v) in sorted(deltas.items()):  # same row order in every writer
+        model.objects.filter(pk=k).update(products_count=F('products_count') + n,
+                                          stock_value=F('stock_value') + v)
+
+
+def _add(deltas, key, n, v):
+    c, s = deltas[key]
+    deltas[key] = (c + n, s + v)
+
+
+def supplier_ids_of(product_id):
+    return list(Product.suppliers.through.objects
+                .filter(product_id=product_id).values_list('supplier_id', flat=True))
+
+
+# ----- single product -----
+def product_saved(product_id, old, new):
+    """old / new: (category_id, value) before and after the save; old is None for a new product."""
+    new_cat, new_value = new
+    new_cat = new_cat or NONE
+    cats, sups = defaultdict(lambda: (0, 0)), defaultdict(lambda: (0, 0))
+    if old is None:
+        _add(cats, new_cat, 1, new_value)
+        for s in supplier_ids_of(product_id) or [NONE]:
+            _add(sups, s, 1, new_value)
+    else:
+        old_cat, old_value = old
+        _add(cats, old_cat or NONE, -1, -old_value)
+        _add(cats, new_cat, 1, new_value)
+        if new_value != old_value:
+            for s in supplier_ids_of(product_id) or [NONE]:
+                _add(sups, s, 0, new_value - old_value)
+    apply_deltas(CategoryStockSummary, cats)
+    apply_deltas(SupplierStockSummary, sups)
+
+
+def product_deleted(category_id, value, supplier_ids):
+    apply_deltas(CategoryStockSummary, {category_id or NONE: (-1, -value)})
+    apply_deltas(SupplierStockSummary, {s: (-1, -value) for s in supplier_ids or [NONE]})
+
+
+# ----- supplier links -----
+def links_changed(pairs, sign):
+    """pairs: (product_id, supplier_id) links that were just added (+1) or removed (-1)."""
+    if not pairs:
+        return
+    product_ids = {p for p, _ in pairs}
+    values = {pk: price * qty for pk, price, qty in
+              Product.objects.filter(pk__in=product_ids).values_list('pk', 'price', 'quantity')}
+    per_product = defaultdict(int)
+    sups = defaultdict(lambda: (0, 0))
+    for p, s in pairs:
+        per_product[p] += 1
+        _add(sups, s, sign, sign * values.get(p, 0))
+
+    # products moving into / out of the "no supplier" row
+    now = dict(Product.suppliers.through.objects
+               .filter(product_id__in=product_ids).order_by()
+               .values('product_id').annotate(n=Count('supplier_id')).values_list('product_id', 'n'))
+    for p, changed in per_product.items():
+        links = now.get(p, 0)
+        if sign > 0 and links == changed:
+            _add(sups, NONE, -1, -values.get(p, 0))
+        elif sign < 0 and links == 0:
+            _add(sups, NONE, 1, values.get(p, 0))
+    apply_deltas(SupplierStockSummary, sups)
+
+
+def products_unlinked(ids):
+    """Move products left without any supplier (after a supplier delete) into row 0."""
+    ids = list(ids)
+    for i in range(0, len(ids), CHUNK):
+        r = (Product.objects.filter(pk__in=ids[i:i + CHUNK], suppliers__isnull=True)
+             .aggregate(n=Count('id'), v=Sum(value_expr)))
+        apply_deltas(SupplierStockSummary, {NONE: (r['n'], r['v'] or 0)})
+
+
+# ----- stock movements (inventory.signals.stock_changed) -----
+def stock_changed(deltas):
+    """deltas: {product_id: quantity change}. Counts stay; stock values move by price * change."""
+    ids = sorted(p for p, d in deltas.items() if d)
+    for i in range(0, len(ids), CHUNK):
+        chunk = ids[i:i + CHUNK]
+        values, cats, sups = {}, defaultdict(lambda: (0, 0)), defaultdict(lambda: (0, 0))
+        for pk, category_id, price in Product.objects.filter(pk__in=chunk).values_list('pk', 'category_id', 'price'):
+            values[pk] = price * deltas[pk]
+            _add(cats, category_id or NONE, 0, values[pk])
+        unlinked = set(values)
+        for product_id, supplier_id in (Product.suppliers.through.objects.filter(product_id__in=chunk)
+                                        .values_list('product_id', 'supplier_id')):
+            unlinked.discard(product_id)
+            _add(sups, supplier_id, 0, values.get(product_id, 0))
+        for pk in unlinked:
+            _add(sups, NONE, 0, values[pk])
+        apply_deltas(CategoryStockSummary, cats)
+        apply_deltas(SupplierStockSummary, sups)
+
+
+# ----- bulk writers (inventory.signals.products_changing / products_changed) -----
+def _contributions(ids):
+    cats, sups = defaultdict(lambda: (0, 0)), defaultdict(lambda: (0, 0))
+    for r in (Product.objects.filter(pk__in=ids).order_by()
+              .values('category_id').annotate(n=Count('id'), v=Sum(value_expr))):
+        _add(cats, r['category_id'] or NONE, r['n'], r['v'] or 0)
+    for r in (Product.suppliers.through.objects.filter(product_id__in=ids).order_by()
+              .values('supplier_id').annotate(n=Count('product_id'), v=Sum(link_value_expr))):
+        _add(sups, r['supplier_id'], r['n'], r['v'] or 0)
+    unlinked = Product.objects.filter(pk__in=ids, suppliers__isnull=True).aggregate(n=Count('id'), v=Sum(value_expr))
+    if unlinked['n']:
+        _add(sups, NONE, unlinked['n'], unlinked['v'] or 0)
+    return cats, sups
+
+
+def apply_products(ids, sign):
+    ids = list(ids)
+    for i in range(0, len(ids), CHUNK):
+        cats, sups = _contributions(ids[i:i + CHUNK])
+        apply_deltas(CategoryStockSummary, {k: (sign * n, sign * v) for k, (n, v) in cats.items()})
+        apply_deltas(SupplierStockSummary, {k: (sign * n, sign * v) for k, (n, v) in sups.items()})
+
+
+@transaction.atomic
+def rebuild():
+    CategoryStockSummary.objects.all().delete()
+    SupplierStockSummary.objects.all().delete()
+    cats, sups = _contributions(Product.objects.values('pk'))
+    cat_names = dict(Category.objects.values_list('pk', 'name'))
+    sup_names = dict(Supplier.objects.values_list('pk', 'name'))
+    CategoryStockSummary.objects.bulk_create([
+        CategoryStockSummary(pk=k, name=cat_names.get(k, ''), products_count=n, stock_value=v)
+        for k, (n, v) in cats.items()
+    ])
+    SupplierStockSummary.objects.bulk_create([
+        SupplierStockSummary(pk=k, name=sup_names.get(k, ''), products_count=n, stock_value=v)
+        for k, (n, v) in sups.items()
+    ])
+    return len(cats), len(sups)
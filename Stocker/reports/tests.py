@@ -1,3 +1,455 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from inventory.models import Category, Product, StockLot, StockMovement, Supplier
+from inventory.stock import Movement, apply_movements
+from main import perf
+
+from . import aio, exports, history, kpis, routers, summaries
+from .management.commands.refresh_reports_snapshot import Command as RefreshSnapshot
+from .models import CategoryStockHistory, CategoryStockSummary, SupplierStockHistory, SupplierStockSummary
+
+
+class SummaryTests(TestCase):
+    """The incrementally maintained rows must always match a full rebuild."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tablets, cls.syrups = Category.objects.create(name='Tablets'), Category.objects.create(name='Syrups')
+        cls.acme, cls.beta = Supplier.objects.create(name='Acme'), Supplier.objects.create(name='Beta')
+        cls.a = Product.objects.create(name='A', price=Decimal('2.50'), quantity=10, category=cls.tablets)
+        cls.b = Product.objects.create(name='B', price=Decimal('4.00'), quantity=3, category=cls.syrups)
+        cls.c = Product.objects.create(name='C', price=Decimal('1.00'), quantity=7)
+        cls.a.suppliers.add(cls.acme, cls.beta)
+        cls.b.suppliers.add(cls.acme)
+
+    def rows(self):
+        return (sorted(CategoryStockSummary.objects.exclude(products_count=0, stock_value=0)
+                       .values_list('pk', 'products_count', 'stock_value')),
+                sorted(SupplierStockSummary.objects.exclude(products_count=0, stock_value=0)
+                       .values_list('pk', 'products_count', 'stock_value')))
+
+    def assertMatchesRebuild(self):
+        incremental = self.rows()
+        summaries.rebuild()
+        self.assertEqual(incremental, self.rows())
+
+    def test_creates_and_links(self):
+        self.assertEqual(CategoryStockSummary.objects.get(pk=self.tablets.pk).stock_value, Decimal('25.00'))
+        self.assertEqual(SupplierStockSummary.objects.get(pk=self.acme.pk).products_count, 2)
+        self.assertEqual(SupplierStockSummary.objects.get(pk=summaries.NONE).products_count, 1)
+        self.assertMatchesRebuild()
+
+    def test_edits_move_value_between_rows(self):
+        self.a.price, self.a.category = Decimal('3.00'), self.syrups
+        self.a.save()
+        self.c.category = self.tablets
+        self.c.save()
+        self.assertMatchesRebuild()
+
+    def test_link_changes(self):
+        self.a.suppliers.remove(self.beta)
+        self.c.suppliers.add(self.beta)
+        self.b.suppliers.clear()
+        self.acme.product_set.add(self.c)
+        self.assertMatchesRebuild()
+
+    def test_deletes(self):
+        self.b.delete()
+        self.beta.delete()
+        self.tablets.delete()
+        self.assertMatchesRebuild()
+
+    def test_stock_movements(self):
+        apply_movements([Movement(self.a.pk, StockMovement.Kind.RECEIPT, 5),
+                         Movement(self.c.pk, StockMovement.Kind.RECEIPT, 2)])
+        apply_movements([Movement(self.a.pk, StockMovement.Kind.DISPENSE, 4)])
+        self.assertEqual(CategoryStockSummary.objects.get(pk=self.tablets.pk).stock_value, Decimal('27.50'))
+        self.assertMatchesRebuild()
+
+    def test_partial_save_of_a_stale_instance(self):
+        stale = Product.objects.get(pk=self.a.pk)
+        apply_movements([Movement(self.a.pk, StockMovement.Kind.RECEIPT, 5)])
+        stale.name, stale.price = 'A2', Decimal('3.00')
+        stale.save(update_fields=['name', 'price'])
+        self.assertEqual(stale.quantity, 10)  # the caller's object is left alone
+        self.assertEqual(CategoryStockSummary.objects.get(pk=self.tablets.pk).stock_value, Decimal('45.00'))
+        self.assertMatchesRebuild()
+
+    def test_rebuild_command(self):
+        CategoryStockSummary.objects.all().delete()
+        call_command('rebuild_report_summaries', stdout=io.StringIO())
+        self.assertEqual(CategoryStockSummary.objects.get(pk=self.syrups.pk).stock_value, Decimal('12.00'))
+
+
+class KpiTests(TransactionTestCase):
+    # TransactionTestCase: on_commit callbacks run when the writes really commit
+
+    def setUp(self):
+        today = date.today()
+        Product.objects.create(name='Expired', price=Decimal('1.00'), quantity=10, expiry_date=today - timedelta(days=3))
+        Product.objects.create(name='Soon', price=Decimal('2.00'), quantity=1, reorder_level=5,
+                               expiry_date=today + timedelta(days=10))
+        Product.objects.create(name='Later', price=Decimal('3.00'), quantity=0, expiry_date=today + timedelta(days=90))
+        Product.objects.create(name='Undated', price=Decimal('4.00'), quantity=20)
+        cache.clear()
+
+    def test_one_query_for_every_figure(self):
+        with self.assertNumQueries(1):
+            figures = kpis.compute_kpis()
+        self.assertEqual(figures, {'total_value': Decimal('92.00'), 'total_products': 4, 'low_count': 2,
+                                   'near_count': 2})  # expired or expiring within 30 days; undated never
+
+    def test_cached_until_a_change_commits(self):
+        kpis.get_kpis()
+        with self.assertNumQueries(0):
+            kpis.get_kpis()
+        with transaction.atomic():
+            Product.objects.create(name='New', price=Decimal('1.00'), quantity=1)
+            Supplier.objects.create(name='Acme')
+            # not committed yet: a dashboard reading now caches the old figures again
+            self.assertEqual(kpis.get_kpis()['total_products'], 4)
+            queued = [func for _, func, _ in transaction.get_connection().run_on_commit if func is kpis.invalidate]
+            self.assertEqual(len(queued), 1)
+        self.assertEqual(kpis.get_kpis()['total_products'], 5)
+
+    def test_rolled_back_changes_keep_the_cache(self):
+        kpis.get_kpis()
+        with transaction.atomic():
+            Product.objects.create(name='New', price=Decimal('1.00'), quantity=1)
+            transaction.set_rollback(True)
+        with self.assertNumQueries(0):
+            self.assertEqual(kpis.get_kpis()['total_products'], 4)
+
+
+class HistoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tablets = Category.objects.create(name='Tablets')
+        cls.acme, cls.beta = Supplier.objects.create(name='Acme'), Supplier.objects.create(name='Beta')
+        cls.a = Product.objects.create(name='A', price=Decimal('2.00'), quantity=10, category=cls.tablets)
+        cls.b = Product.objects.create(name='B', price=Decimal('1.00'), quantity=5)
+        cls.a.suppliers.add(cls.acme, cls.beta)
+        cls.day = date(2026, 3, 1)
+
+    def category_rows(self, day):
+        return list(CategoryStockHistory.objects.filter(day=day)
+                    .values_list('category_id', 'name', 'products_count', 'quantity', 'stock_value'))
+
+    def supplier_rows(self, day):
+        return list(SupplierStockHistory.objects.filter(day=day)
+                    .values_list('supplier_id', 'name', 'products_count', 'stock_value'))
+
+    def test_snapshot_groups_products_and_puts_missing_links_in_group_0(self):
+        self.assertEqual(history.take_snapshot(self.day), (2, 3))
+        self.assertEqual(self.category_rows(self.day), [(0, '', 1, 5, Decimal('5.00')),
+                                                        (self.tablets.pk, 'Tablets', 1, 10, Decimal('20.00'))])
+        self.assertEqual(self.supplier_rows(self.day), [(0, '', 1, Decimal('5.00')),
+                                                        (self.acme.pk, 'Acme', 1, Decimal('20.00')),
+                                                        (self.beta.pk, 'Beta', 1, Decimal('20.00'))])
+
+    def test_rerun_replaces_the_days_rows(self):
+        history.take_snapshot(self.day)
+        history.take_snapshot(self.day - timedelta(days=1))
+        self.b.delete()
+        call_command('take_inventory_snapshot', date=self.day.isoformat(), stdout=io.StringIO())
+        self.assertEqual(self.category_rows(self.day), [(self.tablets.pk, 'Tablets', 1, 10, Decimal('20.00'))])
+        self.assertEqual(len(self.category_rows(self.day - timedelta(days=1))), 2)
+
+    def test_trends(self):
+        history.take_snapshot(self.day - timedelta(days=2))
+        self.a.price = Decimal('3.00')
+        self.a.save()
+        history.take_snapshot(self.day)
+        data = history.trends('category', self.day - timedelta(days=6))
+        self.assertEqual(data['days'], [self.day - timedelta(days=2), self.day])
+        self.assertEqual([(g['name'], g['first'], g['last']) for g in data['groups']],
+                         [('Tablets', Decimal('20.00'), Decimal('30.00')), ('(No category)', Decimal('5.00'), Decimal('5.00'))])
+        self.assertEqual(data['groups'][0]['change'], 50)
+        self.assertEqual((data['total_first'], data['total_last']), (Decimal('25.00'), Decimal('35.00')))
+        self.assertEqual(data['total_change'], 40)
+
+    def test_supplier_trends_count_each_product_once_in_the_total(self):
+        history.take_snapshot(self.day)
+        by_category = history.trends('category', self.day)
+        by_supplier = history.trends('supplier', self.day)
+        self.assertEqual(by_supplier['total_last'], Decimal('25.00'))
+        self.assertEqual(by_supplier['total_last'], by_category['total_last'])
+        self.assertEqual(len(by_supplier['groups']), 3)
+        self.assertEqual(history.trends('supplier', self.day + timedelta(days=1)), {'days': [], 'totals': [], 'groups': []})
+
+
+class Boom(Exception):
+    pass
+
+
+def thread_name():
+    return threading.current_thread().name
+
+
+class AsyncViewTests(TransactionTestCase):
+    # TransactionTestCase: outside a transaction aio.gather uses its worker threads
+
+    def setUp(self):
+        today = date.today()
+        Product.objects.create(name='Low', price=Decimal('2.00'), quantity=1, reorder_level=5,
+                               category=Category.objects.create(name='Tablets'))
+        Product.objects.create(name='Soon', price=Decimal('1.00'), quantity=20, expiry_date=today + timedelta(days=5))
+        Supplier.objects.create(name='Acme')
+        self.user = User.objects.create_user('clerk', password='x')
+        cache.clear()
+
+    def test_gather_runs_on_worker_threads_in_order(self):
+        results = async_to_sync(aio.gather)(thread_name, lambda: 1, thread_name, lambda: 2)
+        self.assertTrue(results[0].startswith('stocker-query'))
+        self.assertTrue(results[2].startswith('stocker-query'))
+        self.assertEqual(results[1::2], [1, 2])
+
+    def test_gather_runs_on_the_request_connection_inside_a_transaction(self):
+        with transaction.atomic():
+            Supplier.objects.create(name='Uncommitted')
+            names, count = async_to_sync(aio.gather)(thread_name, Supplier.objects.count)
+        self.assertFalse(names.startswith('stocker-query'))
+        self.assertEqual(count, 2)  # sees the transaction's own writes
+
+    @override_settings(ASYNC_QUERY_WORKERS=0)
+    def test_no_workers_runs_one_after_another(self):
+        self.assertFalse(async_to_sync(aio.gather)(thread_name)[0].startswith('stocker-query'))
+
+    def test_a_failing_query_propagates(self):
+        def boom():
+            raise Boom
+        with self.assertRaises(Boom):
+            async_to_sync(aio.gather)(lambda: 1, boom)
+        self.assertEqual(async_to_sync(aio.gather)(lambda: 1), [1])  # the pool is still usable
+
+    async def test_dashboard(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('main:dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['stats'], {'products': 2, 'suppliers': 1, 'categories': 1})
+        self.assertEqual([p.name for p in response.context['low_stock']], ['Low'])
+        self.assertEqual([p.name for p in response.context['near_expiry']], ['Soon'])
+
+    async def test_dashboard_query_error_fails_the_request(self):
+        await self.async_client.aforce_login(self.user)
+        with mock.patch.object(Supplier.objects, 'count', side_effect=Boom):
+            with self.assertRaises(Boom):
+                await self.async_client.get(reverse('main:dashboard'))
+        self.assertIsNone(await cache.aget(kpis.DASHBOARD_CACHE_KEY))
+        response = await self.async_client.get(reverse('main:dashboard'))
+        self.assertEqual(response.context['stats']['suppliers'], 1)
+
+    async def test_inventory_report(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('reports:inventory_report'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({r['name']: r['stock_value'] for r in response.context['by_category']},
+                         {'Tablets': Decimal('2.00'), '': Decimal('20.00')})
+        self.assertEqual([p.name for p in response.context['low_stock']], ['Low'])
+        self.assertEqual(response.context['total_value'], Decimal('22.00'))
+
+    async def test_inventory_report_query_error_fails_the_request(self):
+        await self.async_client.aforce_login(self.user)
+        with mock.patch.object(StockLot.objects, 'near_expiry', side_effect=Boom):
+            with self.assertRaises(Boom):
+                await self.async_client.get(reverse('reports:inventory_report'))
+
+    async def test_stock_trends(self):
+        await self.async_client.aforce_login(self.user)
+        await sync_to_async(history.take_snapshot)(date.today())
+        response = await self.async_client.get(reverse('reports:stock_trends'), {'by': 'supplier', 'days': 30})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.context['by'], response.context['period']), ('supplier', 30))
+        self.assertEqual(response.context['total_last'], Decimal('22.00'))
+
+
+class ReportsRouterTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'reports.sqlite3')
+        open(self.path, 'wb').close()
+        # route to 'default' standing in for the snapshot: only the alias chosen matters here
+        override = override_settings(REPORTS_DB_ALIAS='default', REPORTS_SNAPSHOT_PATH=self.path, REPORTS_MAX_LAG=60)
+        override.enable()
+        self.addCleanup(override.disable)
+        routers._lag_cache.clear()
+        self.addCleanup(routers._lag_cache.clear)
+
+    def age(self, seconds):
+        then = time.time() - seconds
+        os.utime(self.path, (then, then))
+        routers._lag_cache.clear()
+
+    def test_fresh_snapshot_is_used(self):
+        self.age(5)
+        self.assertEqual(routers.usable_alias(), 'default')
+        self.assertAlmostEqual(routers.lag_seconds(), 5, delta=1)
+
+    def test_stale_or_missing_snapshot_falls_back_to_the_primary(self):
+        self.age(120)
+        self.assertIsNone(routers.usable_alias())
+        os.remove(self.path)
+        routers._lag_cache.clear()
+        self.assertIsNone(routers.lag_seconds())
+        self.assertIsNone(routers.usable_alias())
+
+    @override_settings(REPORTS_DB_ALIAS='missing')
+    def test_unconfigured_alias_is_ignored(self):
+        self.assertIsNone(routers.usable_alias())
+
+    def test_only_decorated_views_and_their_streams_are_routed(self):
+        router = routers.ReportsRouter()
+
+        @routers.reads_from_reports_db
+        def view(request):
+            seen.append(router.db_for_read(Product))
+            return StreamingHttpResponse(router.db_for_read(Product) for _ in range(2))
+
+        seen = []
+        response = view(None)
+        self.assertEqual(seen, ['default'])
+        self.assertIsNone(router.db_for_read(Product))
+        self.assertEqual(list(response.streaming_content), [b'default', b'default'])
+        self.assertIsNone(router.db_for_write(Product))
+
+        self.age(120)
+        seen = []
+        response = view(None)
+        self.assertEqual(seen, [None])
+        self.assertEqual(list(response.streaming_content), [b'None', b'None'])
+
+    def test_refresh_copies_the_primary_atomically(self):
+        source = os.path.join(os.path.dirname(self.path), 'primary.sqlite3')
+        db = sqlite3.connect(source)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("CREATE TABLE t (x)")
+        db.execute("INSERT INTO t VALUES (1)")
+        db.commit()
+        db.close()
+        RefreshSnapshot().refresh(source, self.path)
+        copy = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        self.addCleanup(copy.close)
+        self.assertEqual(copy.execute("SELECT x FROM t").fetchall(), [(1,)])
+        self.assertEqual(copy.execute("PRAGMA journal_mode").fetchone(), ('delete',))
+        self.assertFalse(os.path.exists(f"{self.path}.tmp"))
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Antibiotics')
+        cls.product = Product.objects.create(name='Amoxicillin', strength='500mg', price=Decimal('12.30'),
+                                             quantity=4, category=category, expiry_date=date(2027, 1, 31))
+        cls.product.suppliers.add(Supplier.objects.create(name='Beta'), Supplier.objects.create(name='Alpha'))
+        Product.objects.create(name='Zinc', price=Decimal('0.10'))
+        cls.user = User.objects.create_user('clerk', password='x')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def csv_rows(self, response):
+        return list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+
+    def test_csv_is_streamed_with_a_header_row(self):
+        response = self.client.get(reverse('reports:export_inventory_csv'))
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment; filename="inventory_', response['Content-Disposition'])
+        self.assertNotIn('Content-Encoding', response)
+        rows = self.csv_rows(response)
+        self.assertEqual(rows[0], ['Name', 'Strength', 'Form', 'Barcode', 'Category', 'Suppliers', 'Price',
+                                   'Quantity', 'ReorderLevel', 'BatchNo', 'Expiry'])
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[1][:7], ['Amoxicillin', '500mg', '', '', 'Antibiotics', 'Alpha, Beta', '12.30'])
+        self.assertEqual(rows[2][4], '')  # no category
+
+    def test_csv_gzip_on_request_from_capable_clients(self):
+        url = reverse('reports:export_inventory_csv')
+        plain = b''.join(self.client.get(url).streaming_content)
+        response = self.client.get(url, {'gzip': '1'}, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), plain)
+        response = self.client.get(url, {'gzip': '1'}, HTTP_ACCEPT_ENCODING='identity')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(b''.join(response.streaming_content), plain)
+
+    def test_supplier_summary_csv(self):
+        rows = self.csv_rows(self.client.get(reverse('reports:export_supplier_summary_csv')))
+        self.assertEqual(rows[0], ['Supplier', 'ProductsCount', 'StockValue'])
+        self.assertEqual(len(rows), 4)  # Alpha, Beta and products without a supplier
+
+    def test_ndjson_keeps_prices_exact(self):
+        response = self.client.get(reverse('reports:export_inventory_ndjson'))
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([r['name'] for r in rows], ['Amoxicillin', 'Zinc'])
+        self.assertEqual(rows[0]['price'], '12.30')
+        self.assertEqual(rows[0]['suppliers'], ['Alpha', 'Beta'])
+        self.assertEqual(rows[0]['expiry_date'], '2027-01-31')
+        self.assertEqual(rows[1]['price'], '0.10')
+
+    def test_batches_cover_every_product_once(self):
+        batches = list(exports.iter_batches(chunk_size=1))
+        self.assertEqual([len(b) for b in batches], [1, 1])
+
+    def test_columnar_links_follow_pyarrow(self):
+        response = self.client.get(reverse('reports:inventory_report'))
+        link = reverse('reports:export_inventory_parquet')
+        if exports.arrow_available():
+            self.assertContains(response, link)
+        else:
+            self.assertNotContains(response, link)
+            self.assertEqual(self.client.get(link).status_code, 501)
+
+    def test_command_writes_the_default_format(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'inventory.out')
+            call_command('export_inventory', output=path, stdout=io.StringIO())
+            with open(path, 'rb') as f:
+                data = f.read()
+        if exports.arrow_available():
+            self.assertEqual(data[:4], b'PAR1')
+        else:
+            self.assertEqual(len(data.splitlines()), 2)
+
+    @skipUnless(exports.arrow_available(), "needs pyarrow")
+    def test_parquet_round_trips_typed_columns(self):
+        response = self.client.get(reverse('reports:export_inventory_parquet'))
+        table = exports.pq.read_table(exports.pa.BufferReader(b''.join(response.streaming_content)))
+        first = table.to_pylist()[0]
+        self.assertEqual(first['price'], Decimal('12.30'))
+        self.assertEqual(first['expiry_date'], date(2027, 1, 31))
+        self.assertEqual(first['suppliers'], ['Alpha', 'Beta'])
+
+
+class ReportsViewBenchmark(perf.ViewBenchmark):
+    views = {
+        'reports:reports_dashboard': (None, 5),
+        'reports:inventory_report': (None, 8),
+        'reports:supplier_report': (None, 5),
+        'reports:export_inventory_csv': (None, 5),
+        'reports:export_inventory_ndjson': (None, 5),
+        'reports:export_supplier_summary_csv': (None, 3),
+        'reports:stock_trends': (None, 5),
+    }
@@ -7,9 +7,14 @@ urlpatterns = [
     path('', views.reports_dashboard, name='reports_dashboard'),      # /reports/
     path('inventory/', views.inventory_report, name='inventory_report'),
     path('suppliers/', views.supplier_report, name='supplier_report'),
+    path('trends/', views.stock_trends, name='stock_trends'),
 
     # Exports (CSV)
     path('export/inventory.csv', views.export_inventory_csv, name='export_inventory_csv'),
+    # Typed exports for analytics (reports.exports)
+    path('export/inventory.parquet', views.export_inventory, {'fmt': 'parquet'}, name='export_inventory_parquet'),
+    path('export/inventory.arrows', views.export_inventory, {'fmt': 'arrow'}, name='export_inventory_arrow'),
+    path('export/inventory.ndjson', views.export_inventory, {'fmt': 'ndjson'}, name='export_inventory_ndjson'),
     path('export/suppliers.csv', views.export_supplier_summary_csv, name='export_supplier_summary_csv'),
     ]
 
@@ -1,126 +1,200 @@
+from asgiref.sync import sync_to_async
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count, Sum, F, Q, DecimalField, ExpressionWrapper
-from django.http import HttpResponse
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
 from django.shortcuts import render
-from inventory.models import Product
+from django.utils.timezone import localdate
+from datetime import timedelta
+from inventory.models import Product, Location, LocationStock, StockLot
+from inventory.utils import near_expiry_cutoff, location_param
+from inventory.versioning import conditional_page
 
-value_expr = ExpressionWrapper(
-    F('price') * F('quantity'),
-    output_field=DecimalField(max_digits=12, decimal_places=2)
-)
+from . import aio, exports, history
+from .kpis import get_kpis
+from .models import CategoryStockSummary, SupplierStockSummary
+from .routers import reads_from_reports_db
 
 @login_required
+@conditional_page('reports_dashboard', daily=True)
 def reports_dashboard(request):
-    total_value = Product.objects.aggregate(total=Sum(value_expr))['total'] or 0
-    total_products = Product.objects.count()
-    low_count = Product.objects.filter(quantity__lte=F('reorder_level')).count()
-    near_count = Product.objects.filter(expiry_date__isnull=False, expiry_date__lte=F('expiry_date')).filter(
-        expiry_date__lte=F('expiry_date')  # dummy to keep structure—removed next line will handle near expiry in inventory_report
-    ).count()  # We'll show near-expiry properly in inventory_report
-
-    return render(request, 'reports/dashboard.html', {
-        'total_value': total_value,
-        'total_products': total_products,
-        'low_count': low_count,
-        'near_count': near_count,  # optional card
-    })
+    return render(request, 'reports/dashboard.html', get_kpis())
 
 
-@login_required
-def inventory_report(request):
-    # By category
-    by_category = (
-        Product.objects
-        .values('category__id', 'category__name')
-        .annotate(
-            products_count=Count('id'),
-            stock_value=Sum(value_expr)
-        )
-        .order_by('-products_count', 'category__name')
-    )
+def location_categories(location):
+    """By-category rows (name, products_count, stock_value) for one location's stock:
+    one grouped scan of the location's LocationStock rows."""
+    value = ExpressionWrapper(F('quantity') * F('product__price'),
+                              output_field=DecimalField(max_digits=16, decimal_places=2))
+    return list(LocationStock.objects.filter(location=location, quantity__gt=0)
+                .values(name=F('product__category__name'))
+                .annotate(products_count=Count('id'), stock_value=Sum(value))
+                .order_by('-products_count', 'name'))
 
-    # Near expiry (≤ 30 days)
-    from datetime import date, timedelta
-    soon = date.today() + timedelta(days=30)
-    near_expiry = Product.objects.filter(expiry_date__isnull=False, expiry_date__lte=soon)
 
-    # Low stock
-    low_stock = Product.objects.filter(quantity__lte=F('reorder_level'))
+def location_low_stock(location):
+    # at or below the reorder level at that location (locationstock_location_product)
+    return list(Product.objects.filter(location_stock__location=location,
+                                       location_stock__quantity__lte=F('reorder_level'))
+                .annotate(on_hand=F('location_stock__quantity')).order_by('name', 'pk'))
+
+
+@login_required
+@reads_from_reports_db
+@conditional_page('inventory_report', daily=True)
+async def inventory_report(request):
+    location = location_param(request)
+    if location is None:
+        queries = [
+            # By category (maintained incrementally, see reports.summaries)
+            lambda: list(CategoryStockSummary.objects.filter(products_count__gt=0)
+                         .values('name', 'products_count', 'stock_value')),
+            # Low stock
+            lambda: list(Product.objects.low_stock().annotate(on_hand=F('quantity'))),
+        ]
+    else:
+        queries = [lambda: location_categories(location), lambda: location_low_stock(location)]
+    locations, by_category, low_stock, near_expiry = await aio.gather(
+        lambda: list(Location.objects.all()),
+        *queries,
+        # Near expiry (≤ 30 days)
+        lambda: list(StockLot.objects.near_expiry(near_expiry_cutoff(), location)),
+    )
 
-    total_value = Product.objects.aggregate(total=Sum(value_expr))['total'] or 0
+    # from the same database as the rows above (not the KPI cache, which tracks the primary)
+    total_value = sum(r['stock_value'] or 0 for r in by_category)
 
-    return render(request, 'reports/inventory.html', {
+    return await sync_to_async(render)(request, 'reports/inventory.html', {
+        'locations': locations,
+        'location': location,
         'total_value': total_value,
         'by_category': by_category,
         'near_expiry': near_expiry,
         'low_stock': low_stock,
+        'columnar_exports': exports.arrow_available(),
     })
 
 
 @login_required
+@reads_from_reports_db
+@conditional_page('supplier_report')
 def supplier_report(request):
-    # Aggregate by supplier (M2M) — no need to know related_name
-    by_supplier = (
-        Product.objects
-        .values('suppliers__id', 'suppliers__name')
-        .annotate(
-            products_count=Count('id', distinct=True),
-            stock_value=Sum(value_expr)
-        )
-        .order_by('-products_count', 'suppliers__name')
-    )
+    by_supplier = SupplierStockSummary.objects.filter(products_count__gt=0)
 
     return render(request, 'reports/suppliers.html', {
         'by_supplier': by_supplier
     })
 
 
-# -------- CSV exports --------
+TREND_PERIODS = (30, 90, 365)
+
+@login_required
+@reads_from_reports_db
+@conditional_page('stock_trends', daily=True)
+def stock_trends(request):
+    by = request.GET.get('by') if request.GET.get('by') in history.TREND_GROUPS else 'category'
+    try:
+        days = int(request.GET.get('days', 90))
+    except ValueError:
+        days = 90
+    days = days if days in TREND_PERIODS else 90
+    data = history.trends(by, localdate() - timedelta(days=days - 1))
+    return render(request, 'reports/trends.html', dict(data, by=by, period=days, periods=TREND_PERIODS))
+
+
+# -------- Exports --------
 import csv
-from django.utils.timezone import localdate
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.text import compress_sequence
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """File-like object for csv.writer that hands each row back instead of buffering it."""
+    def write(self, value):
+        return value
+
+
+def _stream_response(request, filename, content_type, content, compressible=True):
+    """Stream `content` (bytes chunks) as a download.
+
+    Pass ?gzip=1 (with a gzip-capable client) to get a gzip-encoded stream of a
+    compressible format.
+    """
+    use_gzip = (compressible and request.GET.get('gzip') == '1'
+                and 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    if use_gzip:
+        content = compress_sequence(content)
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    if use_gzip:
+        response['Content-Encoding'] = 'gzip'
+        response['Vary'] = 'Accept-Encoding'
+    return response
+
+
+def _csv_response(request, filename, header, chunks):
+    """Stream `chunks` (iterables of rows) as CSV, one joined block per chunk."""
+    writer = csv.writer(Echo())
+
+    def lines():
+        yield writer.writerow(header).encode()
+        for rows in chunks:
+            yield ''.join(writer.writerow(r) for r in rows).encode()
+
+    return _stream_response(request, filename, 'text/csv', lines())
+
+
+def iter_inventory_rows(chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield lists of CSV rows, walking products by (name, pk) one chunk at a time."""
+    for rows in exports.iter_batches(chunk_size):
+        yield [
+            [name, strength, form, barcode, category or '', ", ".join(suppliers),
+             price, quantity, reorder, batch, expiry or '']
+            for (pk, name, strength, form, barcode, category, suppliers,
+                 price, quantity, reorder, batch, expiry) in rows
+        ]
+
 
 @login_required
+@reads_from_reports_db
 def export_inventory_csv(request):
     """Export all products as CSV."""
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="inventory_{localdate()}.csv"'
-    writer = csv.writer(response)
-    writer.writerow(['Name','Strength','Form','Barcode','Category','Suppliers','Price','Quantity','ReorderLevel','BatchNo','Expiry'])
-
-    qs = (Product.objects
-          .select_related('category')
-          .prefetch_related('suppliers')
-          .order_by('name'))
-
-    for p in qs:
-        suppliers = ", ".join([s.name for s in p.suppliers.all()])
-        writer.writerow([
-            p.name, p.strength, p.form, p.barcode,
-            getattr(p.category, 'name', ''), suppliers,
-            p.price, p.quantity, p.reorder_level, p.batch_no,
-            p.expiry_date or ''
-        ])
-    return response
+    header = ['Name','Strength','Form','Barcode','Category','Suppliers','Price','Quantity','ReorderLevel','BatchNo','Expiry']
+    return _csv_response(request, f"inventory_{localdate()}.csv", header, iter_inventory_rows())
+
+
+@login_required
+@reads_from_reports_db
+def export_inventory(request, fmt):
+    """Export all products as Parquet, an Arrow IPC stream or NDJSON, with typed columns."""
+    if fmt not in exports.FORMATS:
+        raise Http404
+    if not exports.available(fmt):
+        return HttpResponse(f"The {fmt} export needs pyarrow (pip install pyarrow).", status=501,
+                            content_type='text/plain')
+    spec = exports.FORMATS[fmt]
+    return _stream_response(request, f"inventory_{localdate()}.{spec.extension}", spec.content_type,
+                            spec.chunks(exports.iter_batches()), compressible=not spec.needs_arrow)
+
+
+def iter_supplier_summary_rows(chunk_size=EXPORT_CHUNK_SIZE):
+    rows = (SupplierStockSummary.objects
+            .filter(products_count__gt=0)
+            .order_by('name')
+            .values_list('name', 'products_count', 'stock_value'))
+    chunk = []
+    for name, products_count, stock_value in rows.iterator(chunk_size=chunk_size):
+        chunk.append([name or '(No supplier)', products_count, stock_value])
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
 
 
 @login_required
+@reads_from_reports_db
 def export_supplier_summary_csv(request):
     """Export supplier summary (count + stock value) as CSV."""
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="suppliers_summary_{localdate()}.csv"'
-    writer = csv.writer(response)
-    writer.writerow(['Supplier','ProductsCount','StockValue'])
-
-    rows = (
-        Product.objects
-        .values('suppliers__name')
-        .annotate(
-            products_count=Count('id', distinct=True),
-            stock_value=Sum(value_expr)
-        )
-        .order_by('suppliers__name')
-    )
-
-    for r in rows:
-        writer.writerow([r['suppliers__name'] or '(No supplier)', r['products_count'] or 0, r['stock_value'] or 0])
-    return response
+    header = ['Supplier','ProductsCount','StockValue']
+    return _csv_response(request, f"suppliers_summary_{localdate()}.csv", header, iter_supplier_summary_rows())